@@ -0,0 +1,288 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Policies ordering worker clusters for orchestrated builds
+
+Policies get ClusterInfo tuples (cluster, platform, osbs, load) of the
+clusters which are available for the platform and return them in the order
+in which starting a worker build should be attempted. The history policy
+uses durations and results of previous worker builds, kept by ClusterHistory.
+"""
+
+from __future__ import division, unicode_literals
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# number of most recent build durations kept per cluster and platform
+CLUSTER_HISTORY_DURATIONS = 20
+# failure rate used for clusters without any finished builds
+DEFAULT_FAILURE_RATE = 0.1
+MAX_FAILURE_RATE = 0.9
+
+
+class ClusterHistory(object):
+    """
+    Durations and results of worker builds, by cluster and platform,
+    optionally stored in a local JSON file shared by builds running on
+    the same node; the file is updated under an exclusive lock of
+    <path>.lock
+    """
+
+    def __init__(self, path=None, max_durations=CLUSTER_HISTORY_DURATIONS):
+        """
+        :param path: str, file to load history from and store it in
+        :param max_durations: int, number of most recent durations kept
+        """
+        self.path = path
+        self.max_durations = max_durations
+        self._lock = threading.Lock()
+        self._entries = self._read_file() if path else {}
+        # builds recorded here which couldn't be stored in the file yet
+        self._unwritten = []
+
+    @staticmethod
+    def _get_key(cluster, platform):
+        return '{0}/{1}'.format(cluster, platform)
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError('not a JSON object')
+        except (IOError, OSError):
+            return {}
+        except ValueError as ex:
+            logger.warning('ignoring corrupted cluster history %s: %r', self.path, ex)
+            return {}
+        return entries
+
+    def _write_file(self, entries):
+        """
+        :return: bool, whether entries were stored
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            # builds sharing the file never see it incomplete
+            os.rename(path, self.path)
+        except (IOError, OSError) as ex:
+            logger.warning('unable to store cluster history %s: %r', self.path, ex)
+            return False
+        return True
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        exclusive lock held while the file is read and updated, so that
+        no build sharing it loses builds recorded by another one
+        """
+        lock_file = None
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            lock_file = open(self.path + '.lock', 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except (IOError, OSError) as ex:
+            logger.warning('unable to lock cluster history %s: %r', self.path, ex)
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                # releases the lock
+                lock_file.close()
+
+    def _add_build(self, entries, key, duration, succeeded):
+        entry = entries.setdefault(key, {'builds': 0, 'failures': 0, 'durations': []})
+        entry['builds'] += 1
+        if not succeeded:
+            entry['failures'] += 1
+        elif duration is not None:
+            # failed builds usually end early, their durations would mislead
+            entry['durations'] = (entry['durations'] + [duration])[-self.max_durations:]
+
+    def record_build(self, cluster, platform, duration, succeeded):
+        """
+        remember finished worker build
+
+        :param cluster: str, cluster name
+        :param platform: str, platform built
+        :param duration: float, seconds the build took, None if unknown
+        :param succeeded: bool, whether the build succeeded
+        """
+        key = self._get_key(cluster, platform)
+        with self._lock:
+            if not self.path:
+                self._add_build(self._entries, key, duration, succeeded)
+                return
+
+            self._unwritten.append((key, duration, succeeded))
+            with self._file_lock():
+                # the file has builds recorded by all builds sharing it,
+                # those recorded here are added unless stored already
+                entries = self._read_file()
+                for build in self._unwritten:
+                    self._add_build(entries, *build)
+                if self._write_file(entries):
+                    self._unwritten = []
+            self._entries = entries
+
+    def get_stats(self, cluster, platform):
+        """
+        :return: dict, with number of 'builds', 'failures' and mean
+                 'duration' of successful builds (None if unknown)
+        """
+        with self._lock:
+            entry = self._entries.get(self._get_key(cluster, platform), {})
+            durations = entry.get('durations', [])
+            return {
+                'builds': entry.get('builds', 0),
+                'failures': entry.get('failures', 0),
+                'duration': sum(durations) / len(durations) if durations else None,
+            }
+
+
+class SchedulingPolicy(object):
+    """
+    Order clusters available for a platform, the first one is tried first
+
+    Subclasses set name and implement sort_clusters().
+    """
+
+    name = None
+
+    def __init__(self, history=None):
+        """
+        :param history: ClusterHistory instance
+        """
+        self.history = history or ClusterHistory()
+
+    def sort_clusters(self, platform, cluster_infos):
+        """
+        :param platform: str, platform to build
+        :param cluster_infos: list of ClusterInfo, clusters available for platform
+        :return: list of ClusterInfo, in preferred order
+        """
+        raise NotImplementedError
+
+    def record_build(self, cluster, platform, duration, succeeded):
+        """
+        learn from finished worker build, see ClusterHistory.record_build
+        """
+        self.history.record_build(cluster, platform, duration, succeeded)
+
+
+class LoadSchedulingPolicy(SchedulingPolicy):
+    """
+    Prefer the cluster with the lowest ratio of active builds to
+    max_concurrent_builds, then the one with the highest priority
+    """
+
+    name = 'load'
+
+    def sort_clusters(self, platform, cluster_infos):
+        ret = sorted(cluster_infos, key=lambda c: c.cluster.priority)
+        return sorted(ret, key=lambda c: c.load)
+
+
+class HistorySchedulingPolicy(SchedulingPolicy):
+    """
+    Prefer the cluster expected to finish the build soonest
+
+    The expected time is the mean duration of builds of the platform on
+    the cluster, multiplied by the number of times the build has to wait
+    for all concurrent builds on the cluster to finish before it can start,
+    and by the number of attempts needed according to the failure rate of
+    the cluster. Clusters without history are expected to take the mean
+    duration of the other clusters; with no history at all, clusters are
+    ordered by load.
+
+    Clusters which can start the build right away are preferred to clusters
+    which would queue it, even if the build would finish sooner there.
+    """
+
+    name = 'history'
+
+    def _get_failure_rate(self, stats):
+        if not stats['builds']:
+            return DEFAULT_FAILURE_RATE
+        # failures of clusters with only a few builds are less certain
+        rate = (stats['failures'] + DEFAULT_FAILURE_RATE) / (stats['builds'] + 1)
+        return min(rate, MAX_FAILURE_RATE)
+
+    @staticmethod
+    def _is_full(cluster_info):
+        max_builds = cluster_info.cluster.max_concurrent_builds
+        return round(cluster_info.load * max_builds) >= max_builds
+
+    def get_expected_time(self, cluster_info, stats, default_duration):
+        """
+        :param cluster_info: ClusterInfo
+        :param stats: dict, see ClusterHistory.get_stats
+        :param default_duration: float, duration used if stats don't have one
+        :return: float, seconds in which the build is expected to finish
+        """
+        duration = stats['duration'] or default_duration
+        max_builds = cluster_info.cluster.max_concurrent_builds
+        active_builds = cluster_info.load * max_builds
+        # builds over the limit are queued, ours waits for a whole round of them
+        rounds = 1 + max(0, active_builds + 1 - max_builds) / max_builds
+        return duration * rounds / (1 - self._get_failure_rate(stats))
+
+    def sort_clusters(self, platform, cluster_infos):
+        stats = {info.cluster.name: self.history.get_stats(info.cluster.name, platform)
+                 for info in cluster_infos}
+        durations = [s['duration'] for s in stats.values() if s['duration'] is not None]
+        if not durations:
+            return LoadSchedulingPolicy(self.history).sort_clusters(platform, cluster_infos)
+
+        default_duration = sum(durations) / len(durations)
+        expected = {}
+        for info in cluster_infos:
+            expected[info.cluster.name] = self.get_expected_time(info, stats[info.cluster.name],
+                                                                 default_duration)
+            logger.debug('build for platform %s on cluster %s expected to finish in %.0fs',
+                         platform, info.cluster.name, expected[info.cluster.name])
+
+        ret = sorted(cluster_infos, key=lambda c: c.cluster.priority)
+        ret = sorted(ret, key=lambda c: expected[c.cluster.name])
+        # queueing a build delays also the builds submitted after it
+        return sorted(ret, key=self._is_full)
+
+
+SCHEDULING_POLICIES = {
+    policy.name: policy
+    for policy in (LoadSchedulingPolicy, HistorySchedulingPolicy)
+}
+
+
+def get_scheduling_policy(name, history=None):
+    """
+    :param name: str, name of policy from SCHEDULING_POLICIES
+    :param history: ClusterHistory instance
+    :return: SchedulingPolicy instance
+    """
+    try:
+        policy = SCHEDULING_POLICIES[name]
+    except KeyError:
+        raise ValueError('Unknown scheduling policy {0}, expected one of: {1}'
+                         .format(name, ', '.join(sorted(SCHEDULING_POLICIES))))
+    return policy(history)
@@ -0,0 +1,319 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Compress data in independent blocks on a pool of threads
+
+zlib and lzma release the GIL while compressing, so blocks are compressed
+in parallel by threads of a single process. zstd compresses on its own
+worker threads.
+"""
+
+from __future__ import division, unicode_literals
+
+import gzip
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+try:
+    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
+    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
+    from backports import lzma
+except ImportError:
+    import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# last 32 KiB of previous block are used as dictionary for the next one,
+# it's the maximum distance deflate can refer to
+GZIP_DICTIONARY_SIZE = 32 * 1024
+GZIP_BLOCK_SIZE = 1024**2
+XZ_BLOCK_SIZE = 16 * 1024**2
+# window used for zstd long-distance matching, the same as `zstd --long`;
+# zstd decompresses it with default memory limits
+ZSTD_WINDOW_LOG = 27
+
+COMPRESSION_METHODS = ('gzip', 'lzma', 'zstd')
+COMPRESSION_EXTENSIONS = {
+    'gzip': 'gz',
+    'lzma': 'xz',
+    'zstd': 'zst',
+}
+
+try:
+    zlib.compressobj(zdict=b'x')
+    ZLIB_ZDICT = True
+except TypeError:
+    # python 2 doesn't support preset dictionaries
+    ZLIB_ZDICT = False
+
+
+def _deflate_block(data, level, zdict, last):
+    """
+    compress block into raw deflate data which can be concatenated with
+    data of following blocks
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # sync flush ends the output on byte boundary without marking it final
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else
+                                                        zlib.Z_SYNC_FLUSH)
+
+
+def _xz_block(data, level):
+    return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+
+
+class ParallelCompressor(object):
+    """
+    file-like object compressing data written to it in blocks on a pool of
+    threads and writing the compressed blocks, in order, to fileobj
+
+    fileobj is not closed by close()
+    """
+
+    block_size = None
+
+    def __init__(self, fileobj, level, threads, block_size=None):
+        """
+        :param fileobj: file-like object to write compressed data to
+        :param level: int, compression level
+        :param threads: int, number of compressing threads
+        :param block_size: int, size of independently compressed blocks
+        """
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads
+        if block_size:
+            self.block_size = block_size
+        self.closed = False
+
+        self._pool = ThreadPool(threads)
+        self._header_written = False
+        self._buffer = []
+        self._buffered = 0
+        # AsyncResults of compressed blocks waiting to be written, in order
+        self._pending = deque()
+
+    def _compress(self, block, last):
+        """
+        start compressing block
+
+        :return: AsyncResult, compressed block
+        """
+        raise NotImplementedError
+
+    def _write_header(self):
+        pass
+
+    def _write_trailer(self):
+        pass
+
+    def _submit(self, block, last=False):
+        if not self._header_written:
+            self._write_header()
+            self._header_written = True
+        self._pending.append(self._compress(block, last))
+        # keep only a couple of blocks per thread in memory
+        while len(self._pending) > 2 * self.threads:
+            self.fileobj.write(self._pending.popleft().get())
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed file')
+
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            buffered = b''.join(self._buffer)
+            offset = 0
+            while len(buffered) - offset >= self.block_size:
+                self._submit(buffered[offset:offset + self.block_size])
+                offset += self.block_size
+            self._buffer = [buffered[offset:]]
+            self._buffered = len(buffered) - offset
+        return len(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit(b''.join(self._buffer), last=True)
+            self._buffer = []
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+            self._write_trailer()
+        finally:
+            self.closed = True
+            self._pool.close()
+            self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ParallelGzipFile(ParallelCompressor):
+    """
+    Write single-member gzip file (the same way pigz does): blocks are
+    compressed into raw deflate data, each block using the end of the
+    previous one as dictionary, and concatenated; the CRC is computed
+    sequentially
+    """
+
+    block_size = GZIP_BLOCK_SIZE
+
+    def __init__(self, fileobj, level=6, threads=1, block_size=None, filename=None,
+                 mtime=None):
+        """
+        :param filename: str, name of the original file stored in gzip header
+        :param mtime: int, modification time stored in gzip header, defaults to now
+        """
+        super(ParallelGzipFile, self).__init__(fileobj, level, threads, block_size)
+        self.filename = filename
+        self.mtime = mtime
+        self._crc = zlib.crc32(b'') & 0xffffffff
+        self._size = 0
+        self._previous = b''
+
+    def _write_header(self):
+        flags = 0
+        name = b''
+        if self.filename:
+            name = os.path.basename(self.filename)
+            if name.endswith('.gz'):
+                name = name[:-3]
+            name = name.encode('latin-1', 'replace')
+            flags = 0x08  # FNAME
+        mtime = int(time.time() if self.mtime is None else self.mtime)
+        xfl = 2 if self.level == 9 else 4 if self.level == 1 else 0
+        self.fileobj.write(b'\x1f\x8b\x08' + struct.pack('<BIBB', flags, mtime, xfl, 255))
+        if name:
+            self.fileobj.write(name + b'\x00')
+
+    def _compress(self, block, last):
+        self._crc = zlib.crc32(block, self._crc) & 0xffffffff
+        self._size += len(block)
+        zdict = self._previous if ZLIB_ZDICT else None
+        self._previous = block[-GZIP_DICTIONARY_SIZE:]
+        return self._pool.apply_async(_deflate_block, (block, self.level, zdict, last))
+
+    def _write_trailer(self):
+        self.fileobj.write(struct.pack('<II', self._crc, self._size & 0xffffffff))
+
+
+class ParallelXZFile(ParallelCompressor):
+    """
+    Write xz file consisting of concatenated xz streams, one per block;
+    xz and lzma modules decompress such files as a whole
+    """
+
+    block_size = XZ_BLOCK_SIZE
+
+    def __init__(self, fileobj, level=6, threads=1, block_size=None):
+        super(ParallelXZFile, self).__init__(fileobj, level, threads, block_size)
+        self._blocks = 0
+
+    def _compress(self, block, last):
+        if last and not block and self._blocks:
+            # the file already consists of complete streams
+            return self._pool.apply_async(bytes)
+        self._blocks += 1
+        return self._pool.apply_async(_xz_block, (block, self.level))
+
+
+def open_zstd(fileobj, level=3, threads=1, long_distance=True):
+    """
+    file-like object writing zstd frame into fileobj, with long-distance
+    matching, which finds repeated content far apart in the stream (e.g.
+    the same files in several layers)
+
+    fileobj is not closed by close()
+
+    :param level: int, compression level
+    :param threads: int, number of compressing threads
+    :param long_distance: bool, enable long-distance matching
+    """
+    if zstandard is None:
+        raise RuntimeError('zstd compression requires zstandard module')
+    kwargs = {}
+    if long_distance:
+        kwargs = {'enable_ldm': True, 'window_log': ZSTD_WINDOW_LOG}
+    # threads=0 compresses in the calling thread
+    params = zstandard.ZstdCompressionParameters.from_level(
+        level, threads=threads if threads > 1 else 0, **kwargs)
+    compressor = zstandard.ZstdCompressor(compression_params=params)
+    return compressor.stream_writer(fileobj, closefd=False)
+
+
+def open_compressor(fileobj, method, level, threads=1, block_size=None, filename=None):
+    """
+    file-like object compressing data written to it into fileobj
+
+    fileobj is not closed by close()
+
+    :param fileobj: file-like object to write compressed data to
+    :param method: str, one of COMPRESSION_METHODS
+    :param level: int, compression level (preset for lzma)
+    :param threads: int, number of compressing threads
+    :param block_size: int, size of blocks compressed in parallel (gzip, lzma)
+    :param filename: str, name of the original file stored in gzip header
+    """
+    if method == 'gzip':
+        if threads > 1:
+            return ParallelGzipFile(fileobj, level, threads, block_size, filename=filename)
+        return gzip.GzipFile(filename, 'wb', compresslevel=level, fileobj=fileobj)
+    elif method == 'lzma':
+        if threads > 1:
+            return ParallelXZFile(fileobj, level, threads, block_size)
+        return lzma.LZMAFile(fileobj, 'wb', preset=level)
+    elif method == 'zstd':
+        return open_zstd(fileobj, level, threads)
+    raise ValueError('Unsupported compression format {0}'.format(method))
+
+
+class _CountingWriter(object):
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def measure_compression(data, method, level, threads=1, block_size=None):
+    """
+    compress data in memory, discarding the output
+
+    :return: tuple, ratio (compressed / uncompressed size) and throughput
+             in uncompressed bytes per second
+    """
+    output = _CountingWriter()
+    start = time.time()
+    compressor = open_compressor(output, method, level, threads, block_size)
+    compressor.write(data)
+    compressor.close()
+    duration = max(time.time() - start, 1e-6)
+    return output.size / max(len(data), 1), len(data) / duration
@@ -92,6 +92,7 @@ PLUGIN_COMPARE_COMPONENTS_KEY = 'compare_components'
 PLUGIN_CHECK_AND_SET_PLATFORMS_KEY = 'check_and_set_platforms'
 PLUGIN_REMOVE_WORKER_METADATA_KEY = 'remove_worker_metadata'
 PLUGIN_RESOLVE_COMPOSES_KEY = 'resolve_composes'
+PLUGIN_PULL_BASE_IMAGE_KEY = 'pull_base_image'
 
 # some shared dict keys for build metadata that gets recorded with koji.
 # for consistency of metadata in historical builds, these values basically cannot change.
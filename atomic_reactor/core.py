@@ -499,6 +499,20 @@ class DockerTasker(LastLogger):
         logger.debug("%d matching images found", len(images))
         return images
 
+    def get_image_ids_by_repo_digest(self):
+        """
+        using `docker images`, map digests of images pulled from registries to
+        image IDs
+
+        :return: dict, repository digest (reg.om/img@sha256:...) -> image ID
+        """
+        index = {}
+        for image in self.d.images():
+            for repo_digest in image.get('RepoDigests') or []:
+                index[repo_digest] = image['Id']
+        logger.debug("%d repository digests of local images found", len(index))
+        return index
+
     def pull_image(self, image, insecure=False):
         """
         pull provided image from registry
@@ -30,10 +30,11 @@ from atomic_reactor.plugin import (
     PreBuildPluginsRunner,
     PrePublishPluginsRunner,
 )
+from atomic_reactor.profiling import get_plugins_profiling_from_env
 from atomic_reactor.source import get_source_instance_for
 from atomic_reactor.constants import INSPECT_ROOTFS, INSPECT_ROOTFS_LAYERS
 from atomic_reactor.constants import CONTAINER_DEFAULT_BUILD_METHOD
-from atomic_reactor.util import ImageName
+from atomic_reactor.util import ImageName, RegistrySessionPool
 from atomic_reactor.build import BuildResult
 from atomic_reactor import get_logging_encoding
 
@@ -327,7 +328,8 @@ class DockerBuildWorkflow(object):
     def __init__(self, source, image, prebuild_plugins=None, prepublish_plugins=None,
                  postbuild_plugins=None, exit_plugins=None, plugin_files=None,
                  openshift_build_selflink=None, client_version=None,
-                 buildstep_plugins=None, **kwargs):
+                 buildstep_plugins=None, plugins_concurrency=None, plugins_profiling=None,
+                 registry_cache=None, **kwargs):
         """
         :param source: dict, where/how to get source code to put in image
         :param image: str, tag for built image ([registry/]image_name[:tag])
@@ -339,6 +341,12 @@ class DockerBuildWorkflow(object):
             on openshift) without the actual hostname/IP address
         :param client_version: str, osbs-client version used to render build json
         :param buildstep_plugins: dict, arguments for build-step plugins
+        :param plugins_concurrency: int, maximum number of plugins which may run
+            concurrently within a phase; plugins are run sequentially by default
+        :param plugins_profiling: dict, options for PluginProfiler; when set, resources
+            used by each plugin are recorded in plugins_profiles, defaults to options
+            from ATOMIC_REACTOR_PLUGINS_PROFILING environment variable
+        :param registry_cache: dict, arguments for RegistryCache used by registry_sessions
         """
         self.source = get_source_instance_for(source, tmpdir=tempfile.mkdtemp())
         self.image = image
@@ -358,11 +366,18 @@ class DockerBuildWorkflow(object):
         self.plugins_timestamps = {}
         self.plugins_durations = {}
         self.plugins_errors = {}
+        self.plugins_profiles = {}
         self.autorebuild_canceled = False
         self.build_canceled = False
         self.plugin_failed = False
         self.plugin_files = plugin_files
+        self.plugins_concurrency = plugins_concurrency
+        if plugins_profiling is None:
+            plugins_profiling = get_plugins_profiling_from_env()
+        self.plugins_profiling = plugins_profiling
         self.fs_watcher = FSWatcher()
+        # registry sessions shared by plugins, see RegistrySessionPool
+        self.registry_sessions = RegistrySessionPool(registry_cache)
 
         self.kwargs = kwargs
 
@@ -439,7 +454,8 @@ class DockerBuildWorkflow(object):
             logger.info("running pre-build plugins")
             prebuild_runner = PreBuildPluginsRunner(self.builder.tasker, self,
                                                     self.prebuild_plugins_conf,
-                                                    plugin_files=self.plugin_files)
+                                                    plugin_files=self.plugin_files,
+                                                    plugins_concurrency=self.plugins_concurrency)
             try:
                 prebuild_runner.run()
             except PluginFailedException as ex:
@@ -469,9 +485,9 @@ class DockerBuildWorkflow(object):
                 self.builder.image_id = self.build_result.image_id
 
             # run prepublish plugins
-            prepublish_runner = PrePublishPluginsRunner(self.builder.tasker, self,
-                                                        self.prepublish_plugins_conf,
-                                                        plugin_files=self.plugin_files)
+            prepublish_runner = PrePublishPluginsRunner(
+                self.builder.tasker, self, self.prepublish_plugins_conf,
+                plugin_files=self.plugin_files, plugins_concurrency=self.plugins_concurrency)
             try:
                 prepublish_runner.run()
             except PluginFailedException as ex:
@@ -491,7 +507,8 @@ class DockerBuildWorkflow(object):
 
             postbuild_runner = PostBuildPluginsRunner(self.builder.tasker, self,
                                                       self.postbuild_plugins_conf,
-                                                      plugin_files=self.plugin_files)
+                                                      plugin_files=self.plugin_files,
+                                                      plugins_concurrency=self.plugins_concurrency)
             try:
                 postbuild_runner.run()
             except PluginFailedException as ex:
@@ -507,7 +524,8 @@ class DockerBuildWorkflow(object):
             signal.signal(signal.SIGTERM, lambda *args: None)
             exit_runner = ExitPluginsRunner(self.builder.tasker, self,
                                             self.exit_plugins_conf,
-                                            plugin_files=self.plugin_files)
+                                            plugin_files=self.plugin_files,
+                                            plugins_concurrency=self.plugins_concurrency)
             try:
                 exit_runner.run(keep_going=True)
             except PluginFailedException as ex:
@@ -516,6 +534,8 @@ class DockerBuildWorkflow(object):
             finally:
                 self.source.remove_tmpdir()
                 self.fs_watcher.finish()
+                logger.debug("registry sessions: %s", self.registry_sessions.get_stats())
+                self.registry_sessions.close()
 
             signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
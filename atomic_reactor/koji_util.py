@@ -12,15 +12,31 @@ from __future__ import print_function
 import koji
 from requests.exceptions import ConnectionError
 
+import hashlib
 import logging
 import os
+import threading
 import time
+import zlib
+from multiprocessing.pool import ThreadPool
 
 from atomic_reactor.constants import (DEFAULT_DOWNLOAD_BLOCK_SIZE,
                                       HTTP_BACKOFF_FACTOR, HTTP_MAX_RETRIES)
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_UPLOAD_BLOCK_SIZE = 1024 * 1024
+# number of times a block is sent again after a hub error
+UPLOAD_RETRIES = 5
+# number of files uploaded concurrently
+UPLOAD_THREADS = 4
+# maximum number of calls sent to the hub in one multicall
+MULTICALL_BATCH_SIZE = 100
+# seconds between the first polls for koji task states, the interval
+# grows by TASK_POLL_BACKOFF after each poll, up to poll_interval
+INITIAL_TASK_POLL_INTERVAL = 1
+TASK_POLL_BACKOFF = 1.5
+
 
 class KojiUploadLogger(object):
     def __init__(self, logger, notable_percent=10):
@@ -53,24 +69,59 @@ class KojiSessionWrapper(object):
     def __init__(self, session):
         self._wrapped_session = session
 
+    @staticmethod
+    def _call_with_retries(func, *a, **kw):
+        retry_delay = HTTP_BACKOFF_FACTOR
+        last_exc = None
+        for retry in range(HTTP_MAX_RETRIES):
+            try:
+                return func(*a, **kw)
+            except ConnectionError as exc:
+                time.sleep(retry_delay * (2 ** retry))
+                last_exc = exc
+                continue
+        raise last_exc
+
     def __getattr__(self, name):
         session_attr = getattr(self._wrapped_session, name)
         if callable(session_attr):
             def call_with_catch(*a, **kw):
-                retry_delay = HTTP_BACKOFF_FACTOR
-                last_exc = None
-                for retry in range(HTTP_MAX_RETRIES):
-                    try:
-                        return session_attr(*a, **kw)
-                    except ConnectionError as exc:
-                        time.sleep(retry_delay * (2 ** retry))
-                        last_exc = exc
-                        continue
-                raise last_exc
+                return self._call_with_retries(session_attr, *a, **kw)
             return call_with_catch
         else:
             return session_attr
 
+    def _multicall(self, calls):
+        session = self._wrapped_session
+        # calls are only queued until multiCall is called
+        session.multicall = True
+        for call in calls:
+            getattr(session, call[0])(*call[1], **(call[2] if len(call) > 2 else {}))
+        # faults are raised as koji exceptions
+        return [result[0] for result in session.multiCall(strict=True)]
+
+    def batch_calls(self, calls, batch_size=MULTICALL_BATCH_SIZE):
+        """
+        Make independent calls in koji multicalls, in one round-trip to
+        the hub per batch_size calls
+
+        Sessions which don't support multicall make the calls one by one.
+
+        :param calls: list of tuples, (method name, args) or
+                      (method name, args, kwargs)
+        :param batch_size: int, maximum number of calls in one multicall
+        :return: list, results of calls, in order
+        """
+        if not hasattr(self._wrapped_session, 'multiCall'):
+            return [getattr(self, call[0])(*call[1], **(call[2] if len(call) > 2 else {}))
+                    for call in calls]
+
+        results = []
+        for start in range(0, len(calls), batch_size):
+            batch = calls[start:start + batch_size]
+            results.extend(self._call_with_retries(self._multicall, batch))
+        return results
+
 
 def koji_login(session,
                proxyuser=None,
@@ -143,17 +194,147 @@ def create_koji_session(hub_url, auth_info=None):
     return session
 
 
+def upload_file(session, path, serverdir, name, checksum=None, checksum_type='md5',
+                blocksize=None, callback=None, retries=UPLOAD_RETRIES):
+    """
+    Upload a local file to koji, block by block
+
+    After a hub error, the upload is resumed from the offset the hub
+    acknowledged last (the hub truncates the file there) instead of
+    starting over. When all blocks are sent, size and checksum of the
+    file on the hub are verified.
+
+    :param session: koji.ClientSession instance
+    :param path: str, local file to upload
+    :param serverdir: str, directory on the hub to upload to
+    :param name: str, file name on the hub
+    :param checksum: str, expected hex digest of the file, computed
+                     while uploading if not given
+    :param checksum_type: str, hash algorithm of checksum, e.g. 'md5'
+    :param blocksize: int, bytes sent in one call
+    :param callback: callable, called as ClientSession.uploadWrapper
+                     calls it: callback(offset, size, block size,
+                     seconds for block, seconds for upload)
+    :param retries: int, number of times a block is sent again
+    :return: str, pathname on server
+    """
+    blocksize = blocksize or DEFAULT_UPLOAD_BLOCK_SIZE
+    size = os.path.getsize(path)
+    digest = hashlib.new(checksum_type) if checksum is None else None
+    hashed = 0
+    offset = 0
+    failures = 0
+    start = time.time()
+    if callback:
+        callback(0, size, 0, 0, 0)
+
+    with open(path, 'rb') as f:
+        while True:
+            f.seek(offset)
+            chunk = f.read(blocksize)
+            # empty file is still created on the hub
+            if not chunk and offset:
+                break
+            if digest is not None and offset == hashed:
+                digest.update(chunk)
+                hashed += len(chunk)
+
+            lap = time.time()
+            try:
+                result = session.rawUpload(chunk, offset, serverdir, name, overwrite=True)
+                if (int(result['size']) != len(chunk) or
+                        result['hexdigest'] != '%08x' % (zlib.adler32(chunk) & 0xffffffff)):
+                    raise koji.GenericError('hub received corrupted block of %s at offset %d' %
+                                            (name, offset))
+            except (koji.GenericError, ConnectionError) as exc:
+                if failures >= retries:
+                    raise
+                failures += 1
+                delay = HTTP_BACKOFF_FACTOR * 2 ** (failures - 1)
+                logger.warning('uploading %s failed at offset %d, resuming in %ds: %r',
+                               name, offset, delay, exc)
+                time.sleep(delay)
+                continue
+
+            failures = 0
+            offset += len(chunk)
+            if callback:
+                now = time.time()
+                callback(offset, size, len(chunk), now - lap, now - start)
+            if not chunk:
+                break
+
+    expected = checksum if digest is None else digest.hexdigest()
+    result = session.checkUpload(serverdir, name, verify=checksum_type)
+    if (not result or int(result['size']) != size or
+            result['hexdigest'].lower() != expected.lower()):
+        raise RuntimeError('Uploaded file %s/%s does not match %s: expected %s bytes '
+                           'with %s %s, got %r' % (serverdir, name, path, size,
+                                                   checksum_type, expected, result))
+    return os.path.join(serverdir, name)
+
+
+def map_in_subsessions(session, func, args, threads=UPLOAD_THREADS):
+    """
+    Call func(session, arg) for each of args, in up to threads threads
+
+    Logged-in koji sessions number their calls, so they can't be used
+    concurrently: each thread calls func with its own subsession of
+    session, logged out when all calls are finished.
+
+    :param session: koji.ClientSession instance
+    :param func: callable, called as func(session, arg)
+    :param args: list, arguments for func
+    :param threads: int, maximum number of concurrent calls
+    :return: list, results of func in order of args
+    """
+    if threads <= 1 or len(args) <= 1:
+        return [func(session, arg) for arg in args]
+
+    local = threading.local()
+    subsessions = []
+
+    def call(arg):
+        if not hasattr(local, 'session'):
+            local.session = KojiSessionWrapper(session.subsession())
+            subsessions.append(local.session)
+        return func(local.session, arg)
+
+    pool = ThreadPool(min(threads, len(args)))
+    try:
+        return pool.map(call, args)
+    finally:
+        pool.close()
+        pool.join()
+        for subsession in subsessions:
+            try:
+                subsession.logout()
+            except Exception:
+                logger.warning('Unable to log out of koji subsession', exc_info=True)
+
+
 class TaskWatcher(object):
-    def __init__(self, session, task_id, poll_interval=5):
+    def __init__(self, session, task_id, poll_interval=5,
+                 initial_poll_interval=INITIAL_TASK_POLL_INTERVAL):
+        """
+        :param session: koji.ClientSession instance
+        :param task_id: int, koji task to watch
+        :param poll_interval: int, maximum seconds between polls
+        :param initial_poll_interval: int, seconds between the first polls
+        """
         self.session = session
         self.task_id = task_id
         self.poll_interval = poll_interval
+        self.initial_poll_interval = min(initial_poll_interval, poll_interval)
         self.state = 'CANCELED'
 
     def wait(self):
         logger.debug("waiting for koji task %r to finish", self.task_id)
+        # frequent polls for quick tasks, less frequent for long-running ones
+        interval = self.initial_poll_interval
         while not self.session.taskFinished(self.task_id):
-            time.sleep(self.poll_interval)
+            time.sleep(interval)
+            interval = min(interval * TASK_POLL_BACKOFF, self.poll_interval)
 
         logger.debug("koji task is finished, getting info")
         task_info = self.session.getTaskInfo(self.task_id, request=True)
@@ -109,25 +109,34 @@ class ODCSClient(object):
                          burst_retry=1,
                          burst_length=30,
                          slow_retry=10,
-                         timeout=1800):
+                         timeout=1800,
+                         backoff_factor=1.5,
+                         canceled=None):
         """Wait for compose request to finalize
 
         :param compose_id: int, compose ID to wait for
         :param burst_retry: int, seconds to wait between retries prior to exceeding
                             the burst length
         :param burst_length: int, seconds to switch to slower retry period
-        :param slow_retry: int, seconds to wait between retries after exceeding
-                           the burst length
+        :param slow_retry: int, maximum seconds to wait between retries after
+                           exceeding the burst length
         :param timeout: int, when to give up waiting for compose request
+        :param backoff_factor: float, after exceeding the burst length, each
+                               wait is this many times longer, up to slow_retry
+        :param canceled: threading.Event, stop waiting once it is set
 
         :return: dict, updated status of compose.
-        :raise RuntimeError: if state_name becomes 'failed'
+        :raise RuntimeError: if state_name becomes 'failed' or waiting is canceled
         """
         logger.debug("Getting compose information for information for compose_id={}"
                      .format(compose_id))
         url = '{}composes/{}'.format(self.url, compose_id)
         start_time = time.time()
+        retry = burst_retry
         while True:
+            if canceled is not None and canceled.is_set():
+                raise RuntimeError('Waiting for compose_id={} canceled'.format(compose_id))
+
             response = self.session.get(url)
             response.raise_for_status()
             response_json = response.json()
@@ -142,7 +151,7 @@ class ODCSClient(object):
                 return response_json
 
             elapsed = time.time() - start_time
-            if elapsed > timeout:
+            if elapsed >= timeout:
                 raise RuntimeError("Retrieving %s timed out after %s seconds" %
                                    (url, timeout))
             else:
@@ -150,6 +159,10 @@ class ODCSClient(object):
                              .format(compose_id, elapsed))
 
                 if elapsed > burst_length:
-                    time.sleep(slow_retry)
+                    retry = min(retry * backoff_factor, slow_retry)
+                # check once more right at the timeout
+                delay = min(retry, timeout - elapsed)
+                if canceled is not None:
+                    canceled.wait(delay)
                 else:
-                    time.sleep(burst_retry)
+                    time.sleep(delay)
@@ -10,21 +10,31 @@ definition of plugin system
 
 plugins are supposed to be run when image is built and we need to extract some information
 """
+import ast
 import copy
 import logging
 import os
+import threading
 import traceback
 import imp
 import datetime
 import inspect
 import time
-from six import PY2
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from six import PY2, string_types
+from six.moves import builtins, queue
 
+import atomic_reactor.constants
 from atomic_reactor.build import BuildResult
+from atomic_reactor.profiling import PluginProfiler
 from atomic_reactor.util import process_substitutions
 from dockerfile_parse import DockerfileParser
 
 MODULE_EXTENSIONS = ('.py', '.pyc', '.pyo')
+# seconds between checks for finished plugins when running them concurrently;
+# blocking without timeout can't be interrupted by signals on Python 2
+PLUGINS_WAIT_INTERVAL = 1
 logger = logging.getLogger(__name__)
 
 
@@ -59,6 +69,13 @@ class Plugin(object):
     key = None
     # by default, if plugin fails (raises exc), execution continues
     is_allowed_to_fail = True
+    # names of data this plugin reads (requires) and writes (provides): workflow
+    # fields, e.g. 'builder.parent_images', or keys of other plugins whose results
+    # are consumed; every plugin implicitly provides its own key
+    # PluginsRunner may run plugins with non-conflicting declarations concurrently;
+    # None means unknown and such plugin is never run concurrently with another one
+    requires = None
+    provides = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -107,6 +124,280 @@ class BuildPlugin(Plugin):
         super(BuildPlugin, self).__init__(*args, **kwargs)
 
 
+ScannedPluginClass = namedtuple('ScannedPluginClass', ['name', 'bases', 'key'])
+# plugin class doesn't define key itself
+NO_KEY = object()
+
+
+def _get_string_literal(node):
+    """
+    :return: value of string literal ast node, or None if node is something else
+    """
+    # python 3.8+ uses ast.Constant, older versions ast.Str
+    value = node.value if hasattr(node, 'value') else getattr(node, 's', None)
+    if isinstance(value, string_types):
+        return value
+    return None
+
+
+class PluginsRegistry(object):
+    """
+    process-wide index of available plugins
+
+    plugin files are scanned only once, without being imported: classes are
+    indexed by their base classes and key; a module is imported (at most once
+    per process) when one of its plugins is requested
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # path -> list of ScannedPluginClass, or None if the file has to be imported
+        self._scanned = {}
+        # path -> module, or None if the module can't be loaded
+        self._modules = {}
+
+    def clear_modules(self):
+        """
+        forget imported modules, they will be imported again when requested
+        """
+        with self._lock:
+            self._modules = {}
+
+    @staticmethod
+    def get_plugin_files(plugin_files=None):
+        # imp.findmodule('atomic_reactor') doesn't work
+        plugins_dir = os.path.join(os.path.dirname(__file__), 'plugins')
+        files = [os.path.join(plugins_dir, f)
+                 for f in sorted(os.listdir(plugins_dir))
+                 if f.endswith(".py")]
+        return files + list(plugin_files or [])
+
+    def load_module(self, path):
+        """
+        import module from file, each file is imported only once
+
+        :param path: str, path to python file
+        :return: module, or None if it can't be loaded
+        """
+        with self._lock:
+            if path not in self._modules:
+                logger.debug("load file '%s'", path)
+                module_name = os.path.basename(path).rsplit('.', 1)[0]
+                try:
+                    self._modules[path] = imp.load_source(module_name, path)
+                except (IOError, OSError, ImportError, SyntaxError) as ex:
+                    logger.warning("can't load module '%s': %r", path, ex)
+                    self._modules[path] = None
+            return self._modules[path]
+
+    def scan(self, path):
+        """
+        find plugin classes defined in file without importing it
+
+        :param path: str, path to python file
+        :return: list of ScannedPluginClass, or None if the classes can't
+                 be determined statically and the file has to be imported
+        """
+        with self._lock:
+            if path not in self._scanned:
+                try:
+                    self._scanned[path] = self._scan_file(path)
+                except (IOError, OSError, SyntaxError, ValueError) as ex:
+                    logger.warning("can't scan module '%s': %r", path, ex)
+                    self._scanned[path] = []
+            return self._scanned[path]
+
+    @staticmethod
+    def _scan_file(path):
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+
+        constants = {}
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom) and node.module == 'atomic_reactor.constants':
+                for alias in node.names:
+                    if hasattr(atomic_reactor.constants, alias.name):
+                        value = getattr(atomic_reactor.constants, alias.name)
+                        constants[alias.asname or alias.name] = value
+            elif isinstance(node, ast.Assign) and _get_string_literal(node.value) is not None:
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        constants[target.id] = _get_string_literal(node.value)
+
+        classes = {}
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+
+            bases = []
+            for base in node.bases:
+                if isinstance(base, ast.Name):
+                    bases.append(base.id)
+                elif isinstance(base, ast.Attribute):
+                    bases.append(base.attr)
+                else:
+                    return None
+
+            key = NO_KEY
+            for statement in node.body:
+                if not isinstance(statement, ast.Assign):
+                    continue
+                if not any(isinstance(target, ast.Name) and target.id == 'key'
+                           for target in statement.targets):
+                    continue
+                if _get_string_literal(statement.value) is not None:
+                    key = _get_string_literal(statement.value)
+                elif (isinstance(statement.value, ast.Name) and
+                      statement.value.id in constants):
+                    key = constants[statement.value.id]
+                else:
+                    return None
+
+            classes[node.name] = (bases, key)
+
+        def resolve(name, bases, key):
+            """
+            :return: tuple, (list of base classes from this module, key)
+            """
+            base_classes = []
+            for base in bases:
+                if base in classes:
+                    base_base_classes, base_key = resolve(base, *classes[base])
+                    base_classes += base_base_classes
+                    if key is NO_KEY:
+                        key = base_key
+                elif base in globals():
+                    base_classes.append(globals()[base])
+                elif not hasattr(builtins, base):
+                    raise ValueError("unknown base class '%s' of '%s'" % (base, name))
+            return base_classes, key
+
+        scanned = []
+        for name, (bases, key) in classes.items():
+            try:
+                base_classes, key = resolve(name, bases, key)
+            except ValueError:
+                return None
+            base_classes = [base for base in base_classes
+                            if isinstance(base, type) and issubclass(base, Plugin)]
+            if base_classes:
+                scanned.append(ScannedPluginClass(name, base_classes,
+                                                  None if key is NO_KEY else key))
+        return scanned
+
+    @staticmethod
+    def _get_module_plugin_classes(module, plugin_class):
+        plugin_classes = {}
+        for name in dir(module):
+            binding = getattr(module, name, None)
+            try:
+                # if you try to compare binding and PostBuildPlugin, python won't match them
+                # if you call this script directly b/c:
+                # ! <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
+                # '__main__.PostBuildPlugin'>
+                # but
+                # <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
+                # 'atomic_reactor.plugin.PostBuildPlugin'>
+                is_sub = issubclass(binding, plugin_class)
+            except TypeError:
+                is_sub = False
+            if binding and is_sub and plugin_class.__name__ != binding.__name__:
+                plugin_classes[binding.key] = binding
+        return plugin_classes
+
+    def get_plugin_classes(self, plugin_class_name, plugin_files=None):
+        """
+        get available plugins of given type
+
+        :param plugin_class_name: str, name of plugin class to filter (e.g. 'PreBuildPlugin')
+        :param plugin_files: list of str, load plugins also from these files
+        :return: LazyPluginClasses, mapping of plugin keys to plugin classes
+        """
+        plugin_class = globals()[plugin_class_name]
+        index = {}
+        for path in self.get_plugin_files(plugin_files):
+            scanned = self.scan(path)
+            if scanned is None:
+                module = self.load_module(path)
+                if module is not None:
+                    index.update(self._get_module_plugin_classes(module, plugin_class))
+                continue
+
+            for scanned_class in scanned:
+                if scanned_class.name == plugin_class.__name__:
+                    continue
+                if any(issubclass(base, plugin_class) for base in scanned_class.bases):
+                    index[scanned_class.key] = (path, scanned_class.name)
+
+        return LazyPluginClasses(self, plugin_class, index)
+
+    def get_plugin_class(self, plugin_class, path, name):
+        """
+        import plugin class found by scan()
+
+        :return: class, or None if it's not available
+        """
+        module = self.load_module(path)
+        binding = getattr(module, name, None)
+        try:
+            is_sub = issubclass(binding, plugin_class)
+        except TypeError:
+            is_sub = False
+        return binding if is_sub else None
+
+
+class LazyPluginClasses(object):
+    """
+    read-only mapping of plugin keys to plugin classes, which imports
+    modules of plugins only when they are accessed
+    """
+
+    def __init__(self, registry, plugin_class, index):
+        """
+        :param registry: PluginsRegistry instance
+        :param plugin_class: class, base class of plugins (e.g. PreBuildPlugin)
+        :param index: dict, plugin key -> plugin class or (path, class name) tuple
+        """
+        self._registry = registry
+        self._plugin_class = plugin_class
+        self._index = index
+
+    def __getitem__(self, key):
+        value = self._index[key]
+        if isinstance(value, tuple):
+            path, name = value
+            value = self._registry.get_plugin_class(self._plugin_class, path, name)
+            if value is None:
+                del self._index[key]
+                raise KeyError(key)
+            self._index[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [key for key in list(self._index) if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._index)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
 class PluginsRunner(object):
 
     def __init__(self, plugin_class_name, plugins_conf, *args, **kwargs):
@@ -115,51 +406,23 @@ class PluginsRunner(object):
 
         :param plugin_class_name: str, name of plugin class to filter (e.g. 'PreBuildPlugin')
         :param plugins_conf: dict, configuration for plugins
+        :param plugins_concurrency: int, maximum number of plugins run at the same
+                                    time (keyword argument, default 1)
         """
         self.plugins_results = getattr(self, "plugins_results", {})
         self.plugins_conf = plugins_conf or []
         self.plugin_files = kwargs.get("plugin_files", [])
+        self.max_workers = kwargs.get("plugins_concurrency") or 1
         self.plugin_classes = self.load_plugins(plugin_class_name)
 
     def load_plugins(self, plugin_class_name):
         """
         load all available plugins
         """
-        # imp.findmodule('atomic_reactor') doesn't work
-        plugins_dir = os.path.join(os.path.dirname(__file__), 'plugins')
-        logger.debug("loading plugins from dir '%s'", plugins_dir)
-        files = [os.path.join(plugins_dir, f)
-                 for f in os.listdir(plugins_dir)
-                 if f.endswith(".py")]
+        logger.debug("loading plugins of type '%s'", plugin_class_name)
         if self.plugin_files:
             logger.debug("loading additional plugins from files '%s'", self.plugin_files)
-            files += self.plugin_files
-        plugin_class = globals()[plugin_class_name]
-        plugin_classes = {}
-        for f in files:
-            logger.debug("load file '%s'", f)
-            module_name = os.path.basename(f).rsplit('.', 1)[0]
-            try:
-                f_module = imp.load_source(module_name, f)
-            except (IOError, OSError, ImportError, SyntaxError) as ex:
-                logger.warning("can't load module '%s': %r", f, ex)
-                continue
-            for name in dir(f_module):
-                binding = getattr(f_module, name, None)
-                try:
-                    # if you try to compare binding and PostBuildPlugin, python won't match them
-                    # if you call this script directly b/c:
-                    # ! <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
-                    # '__main__.PostBuildPlugin'>
-                    # but
-                    # <class 'plugins.plugin_rpmqa.PostBuildRPMqaPlugin'> <= <class
-                    # 'atomic_reactor.plugin.PostBuildPlugin'>
-                    is_sub = issubclass(binding, plugin_class)
-                except TypeError:
-                    is_sub = False
-                if binding and is_sub and plugin_class.__name__ != binding.__name__:
-                    plugin_classes[binding.key] = binding
-        return plugin_classes
+        return plugins_registry.get_plugin_classes(plugin_class_name, self.plugin_files)
 
     def create_instance_from_plugin(self, plugin_class, plugin_conf):
         """
@@ -181,58 +444,38 @@ class PluginsRunner(object):
     def save_plugin_duration(self, plugin, duration):
         pass
 
-    def run(self, keep_going=False, buildstep_phase=False):
+    def get_plugin_profiler(self, plugin):
         """
-        run all requested plugins
-
-        :param keep_going: bool, whether to keep going after unexpected
-                                 failure (only used for exit plugins)
-        :param buildstep_phase: bool, when True remaining plugins will
-                                not be executed after a plugin completes
-                                (only used for build-step plugins)
+        :return: PluginProfiler instance if plugin should be profiled, None otherwise
         """
-        failed_msgs = []
-        plugin_successful = False
-        plugin_response = None
-        for plugin_request in self.plugins_conf:
-            plugin_successful = False
-            try:
-                plugin_name = plugin_request['name']
-            except (TypeError, KeyError):
-                msg = "invalid plugin request, no key 'name': %s" % plugin_request
-                exc = None if keep_going else PluginFailedException(msg)
-                self.on_plugin_failed('?', exc)
-                logger.error(msg)
-                if keep_going:
-                    continue
-                raise exc
+        return None
 
-            plugin_conf = plugin_request.get("args", {})
-            try:
-                plugin_class = self.plugin_classes[plugin_name]
-            except KeyError:
-                if plugin_request.get('required', True):
-                    msg = ("no such plugin: '%s', did you set "
-                           "the correct plugin type?") % plugin_name
-                    exc = PluginFailedException(msg)
-                    self.on_plugin_failed(plugin_name, exc)
-                    logger.error(msg)
-                    raise exc
-                else:
-                    # This plugin is marked as not being required
-                    logger.warning("plugin '%s' requested but not available",
-                                   plugin_name)
-                    continue
-            try:
-                plugin_is_allowed_to_fail = plugin_request['is_allowed_to_fail']
-            except (TypeError, KeyError):
-                plugin_is_allowed_to_fail = getattr(plugin_class, "is_allowed_to_fail", True)
+    def save_plugin_profile(self, plugin, profile):
+        pass
 
-            logger.debug("running plugin '%s'", plugin_name)
-            start_time = datetime.datetime.now()
+    def _run_plugin(self, plugin_class, plugin_conf, plugin_is_allowed_to_fail,
+                    keep_going, buildstep_phase, failed_msgs):
+        """
+        run single plugin and record its timestamp, duration and profile
+
+        :param plugin_class: plugin class
+        :param plugin_conf: dict, configuration for plugin
+        :param plugin_is_allowed_to_fail: bool, whether failure of the plugin is fatal
+        :param keep_going: bool, whether to keep going after unexpected failure
+        :param buildstep_phase: bool, whether this is a build-step plugin
+        :param failed_msgs: list, messages of failed plugins are appended to it
+        :return: tuple, (plugin_successful, plugin_response, skip_response)
+        """
+        logger.debug("running plugin '%s'", plugin_class.key)
+        start_time = datetime.datetime.now()
 
-            plugin_response = None
-            skip_response = False
+        plugin_successful = False
+        plugin_response = None
+        skip_response = False
+        profiler = self.get_plugin_profiler(plugin_class.key)
+        if profiler:
+            profiler.start()
+        try:
             try:
                 plugin_instance = self.create_instance_from_plugin(plugin_class, plugin_conf)
                 self.save_plugin_timestamp(plugin_class.key, start_time)
@@ -247,8 +490,6 @@ class PluginsRunner(object):
                         self.on_plugin_failed(plugin_class.key,
                                               plugin_response.fail_reason)
                         plugin_successful = False
-                        self.plugins_results[plugin_class.key] = plugin_response
-                        break
 
             except AutoRebuildCanceledException as ex:
                 # if auto rebuild is canceled, then just reraise
@@ -279,20 +520,206 @@ class PluginsRunner(object):
                     raise PluginFailedException(msg)
 
                 plugin_response = ex
+        finally:
+            if profiler:
+                try:
+                    self.save_plugin_profile(plugin_class.key, profiler.stop())
+                except Exception:
+                    logger.exception("failed to save plugin profile")
+
+        try:
+            finish_time = datetime.datetime.now()
+            duration = finish_time - start_time
+            seconds = duration.total_seconds()
+            logger.debug("plugin '%s' finished in %ds", plugin_class.key, seconds)
+            self.save_plugin_duration(plugin_class.key, seconds)
+        except Exception:
+            logger.exception("failed to save plugin duration")
+
+        return plugin_successful, plugin_response, skip_response
+
+    def get_plugins_schedule(self):
+        """
+        resolve requested plugins and figure out which of them depend on each other
+
+        plugin depends on every plugin requested before it which reads data it writes
+        or writes data it reads or writes; plugins without declared requirements
+        depend on all preceding plugins and all following plugins depend on them
+
+        :return: list of tuples (plugin_class, plugin_conf, plugin_is_allowed_to_fail,
+                 set of indexes of plugins in this list to wait for), or None if some
+                 plugin request is invalid and plugins have to be run sequentially
+        """
+        schedule = []
+        declarations = []
+        for plugin_request in self.plugins_conf:
+            try:
+                plugin_name = plugin_request['name']
+            except (TypeError, KeyError):
+                return None
+
+            try:
+                plugin_class = self.plugin_classes[plugin_name]
+            except KeyError:
+                if plugin_request.get('required', True):
+                    return None
+                logger.warning("plugin '%s' requested but not available", plugin_name)
+                continue
+
+            plugin_is_allowed_to_fail = plugin_request.get(
+                'is_allowed_to_fail', getattr(plugin_class, "is_allowed_to_fail", True))
+
+            requires = plugin_request.get('requires', plugin_class.requires)
+            provides = plugin_request.get('provides', plugin_class.provides)
+            if requires is None or provides is None:
+                reads = writes = None
+            else:
+                reads = set(requires)
+                writes = set(provides) | set([plugin_class.key])
+
+            depends_on = set()
+            for index, (other_reads, other_writes) in enumerate(declarations):
+                if (reads is None or other_reads is None or
+                        writes & (other_reads | other_writes) or
+                        reads & other_writes):
+                    depends_on.add(index)
+
+            declarations.append((reads, writes))
+            schedule.append((plugin_class, plugin_request.get("args", {}),
+                             plugin_is_allowed_to_fail, depends_on))
+
+        return schedule
+
+    def _run_plugins_concurrently(self, schedule, keep_going):
+        """
+        run plugins on a thread pool, each of them as soon as all plugins
+        it depends on are finished
+
+        once a plugin fails fatally, no more plugins are started; plugins
+        which are already running are waited for and the failure is reraised
+
+        :param schedule: list, as returned by get_plugins_schedule()
+        :param keep_going: bool, whether to keep going after unexpected failure
+        """
+        failed_msgs = []
+        finished = queue.Queue()
+
+        def run_plugin(index):
+            plugin_class, plugin_conf, plugin_is_allowed_to_fail, _ = schedule[index]
+            try:
+                _, plugin_response, skip_response = self._run_plugin(
+                    plugin_class, plugin_conf, plugin_is_allowed_to_fail, keep_going,
+                    False, failed_msgs)
+                if not skip_response:
+                    self.plugins_results[plugin_class.key] = plugin_response
+            except Exception as ex:
+                finished.put((index, ex))
+            else:
+                finished.put((index, None))
+
+        pending = list(range(len(schedule)))
+        running = set()
+        done = set()
+        fatal_exc = None
+        logger.debug("running plugins using %d threads", self.max_workers)
+        thread_pool = ThreadPool(self.max_workers)
+        try:
+            while pending or running:
+                if fatal_exc is None:
+                    for index in [i for i in pending if schedule[i][3] <= done]:
+                        pending.remove(index)
+                        running.add(index)
+                        thread_pool.apply_async(run_plugin, (index,))
+
+                if not running:
+                    break
+
+                try:
+                    index, exc = finished.get(timeout=PLUGINS_WAIT_INTERVAL)
+                except queue.Empty:
+                    continue
+                running.remove(index)
+                done.add(index)
+                if exc is not None and fatal_exc is None:
+                    fatal_exc = exc
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+        if fatal_exc is not None:
+            raise fatal_exc
+
+        if len(failed_msgs) == 1:
+            raise PluginFailedException(failed_msgs[0])
+        elif len(failed_msgs) > 1:
+            raise PluginFailedException("Multiple plugins raised an exception: " +
+                                        str(failed_msgs))
+
+        return self.plugins_results
+
+    def run(self, keep_going=False, buildstep_phase=False):
+        """
+        run all requested plugins
+
+        :param keep_going: bool, whether to keep going after unexpected
+                                 failure (only used for exit plugins)
+        :param buildstep_phase: bool, when True remaining plugins will
+                                not be executed after a plugin completes
+                                (only used for build-step plugins)
+        """
+        if self.max_workers > 1 and not buildstep_phase:
+            schedule = self.get_plugins_schedule()
+            if schedule is not None:
+                return self._run_plugins_concurrently(schedule, keep_going)
+
+        failed_msgs = []
+        plugin_successful = False
+        plugin_response = None
+        for plugin_request in self.plugins_conf:
+            plugin_successful = False
+            try:
+                plugin_name = plugin_request['name']
+            except (TypeError, KeyError):
+                msg = "invalid plugin request, no key 'name': %s" % plugin_request
+                exc = None if keep_going else PluginFailedException(msg)
+                self.on_plugin_failed('?', exc)
+                logger.error(msg)
+                if keep_going:
+                    continue
+                raise exc
 
+            plugin_conf = plugin_request.get("args", {})
+            try:
+                plugin_class = self.plugin_classes[plugin_name]
+            except KeyError:
+                if plugin_request.get('required', True):
+                    msg = ("no such plugin: '%s', did you set "
+                           "the correct plugin type?") % plugin_name
+                    exc = PluginFailedException(msg)
+                    self.on_plugin_failed(plugin_name, exc)
+                    logger.error(msg)
+                    raise exc
+                else:
+                    # This plugin is marked as not being required
+                    logger.warning("plugin '%s' requested but not available",
+                                   plugin_name)
+                    continue
             try:
-                if start_time:
-                    finish_time = datetime.datetime.now()
-                    duration = finish_time - start_time
-                    seconds = duration.total_seconds()
-                    logger.debug("plugin '%s' finished in %ds", plugin_name, seconds)
-                    self.save_plugin_duration(plugin_class.key, seconds)
-            except Exception:
-                logger.exception("failed to save plugin duration")
+                plugin_is_allowed_to_fail = plugin_request['is_allowed_to_fail']
+            except (TypeError, KeyError):
+                plugin_is_allowed_to_fail = getattr(plugin_class, "is_allowed_to_fail", True)
+
+            plugin_successful, plugin_response, skip_response = self._run_plugin(
+                plugin_class, plugin_conf, plugin_is_allowed_to_fail, keep_going,
+                buildstep_phase, failed_msgs)
 
             if not skip_response:
                 self.plugins_results[plugin_class.key] = plugin_response
 
+            if buildstep_phase and isinstance(plugin_response, BuildResult) and \
+                    plugin_response.is_failed():
+                break
+
             if plugin_successful and buildstep_phase:
                 logger.debug('stopping further execution of plugins '
                              'after first successful plugin')
@@ -336,6 +763,15 @@ class BuildPluginsRunner(PluginsRunner):
     def save_plugin_duration(self, plugin, duration):
         self.workflow.plugins_durations[plugin] = duration
 
+    def get_plugin_profiler(self, plugin):
+        options = getattr(self.workflow, 'plugins_profiling', None)
+        if options is None:
+            return None
+        return PluginProfiler(plugin, per_thread=self.max_workers > 1, **options)
+
+    def save_plugin_profile(self, plugin, profile):
+        self.workflow.plugins_profiles[plugin] = profile
+
     def _translate_special_values(self, obj_to_translate):
         """
         you may want to write plugins for values which are not known before build:
@@ -593,3 +1029,7 @@ class PreBuildSleepPlugin(PreBuildPlugin):
 
     def run(self):
         time.sleep(self.seconds)
+
+
+# shared by all plugin runners of this process
+plugins_registry = PluginsRegistry()
@@ -11,7 +11,7 @@ import subprocess
 from six import PY2
 import os
 
-from atomic_reactor.util import get_exported_image_metadata
+from atomic_reactor.util import export_image_stream
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.build import BuildResult
 from atomic_reactor.constants import CONTAINER_IMAGEBUILDER_BUILD_METHOD
@@ -73,9 +73,9 @@ class ImagebuilderPlugin(BuildStepPlugin):
         # since we need no squash, export the image for local operations like squash would have
         self.log.info("fetching image %s from docker", image)
         output_path = os.path.join(self.workflow.source.workdir, EXPORTED_SQUASHED_IMAGE_NAME)
-        with open(output_path, "w") as image_file:
-            image_file.write(self.tasker.d.get_image(image).data)
-        img_metadata = get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE)
+        with self.tasker.d.get_image(image) as image_stream:
+            img_metadata = export_image_stream(image_stream, IMAGE_TYPE_DOCKER_ARCHIVE,
+                                               output_path)
         self.workflow.exported_image_sequence.append(img_metadata)
 
         return BuildResult(logs=output, image_id=image_id, skip_layer_squash=True)
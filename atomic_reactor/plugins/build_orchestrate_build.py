@@ -22,9 +22,11 @@ from datetime import timedelta
 import datetime as dt
 import copy
 import platform
+import threading
 
 from atomic_reactor.build import BuildResult
-from atomic_reactor.plugin import BuildStepPlugin
+from atomic_reactor.cluster_scheduling import ClusterHistory, get_scheduling_policy
+from atomic_reactor.plugin import BuildCanceledException, BuildStepPlugin
 from atomic_reactor.plugins.pre_reactor_config import (get_config,
                                                        get_arrangement_version, get_koji,
                                                        get_odcs, get_pdc, get_pulp,
@@ -54,8 +56,14 @@ WORKSPACE_KEY_BUILD_INFO = 'build_info'
 WORKSPACE_KEY_UPLOAD_DIR = 'koji_upload_dir'
 WORKSPACE_KEY_OVERRIDE_KWARGS = 'override_kwargs'
 FIND_CLUSTER_RETRY_DELAY = 15.0
+# seconds for which the number of active builds on a cluster is reused
+CLUSTER_LOAD_TTL = 5.0
 FAILURE_RETRY_DELAY = 10.0
 MAX_CLUSTER_FAILS = 20
+# seconds between checks of worker builds status
+MONITOR_INTERVAL = 5.0
+# logged by worker build once it starts pushing and uploading its outputs
+POSTBUILD_LOG_MARKER = 'initializing runner of post-build plugins'
 
 
 def get_worker_build_info(workflow, platform):
@@ -74,6 +82,14 @@ def get_koji_upload_dir(workflow):
     return workspace[WORKSPACE_KEY_UPLOAD_DIR]
 
 
+def get_worker_koji_upload_dir(workflow, platform):
+    """
+    Obtain koji_upload_dir value used by the worker build for a given platform,
+    a speculative duplicate uploads to a subdirectory of get_koji_upload_dir
+    """
+    return get_worker_build_info(workflow, platform).koji_upload_dir
+
+
 def override_build_kwarg(workflow, k, v, platform=None):
     """
     Override a build-kwarg for all worker builds
@@ -148,26 +164,49 @@ def wait_for_any_cluster(contexts):
 
 class WorkerBuildInfo(object):
 
-    def __init__(self, build, cluster_info, logger):
+    def __init__(self, build, cluster_info, logger, koji_upload_dir=None):
         self.build = build
         self.cluster = cluster_info.cluster
         self.osbs = cluster_info.osbs
         self.platform = cluster_info.platform
+        self.koji_upload_dir = koji_upload_dir
         self.log = logging.LoggerAdapter(logger, {'arch': self.platform})
 
         self.monitor_exception = None
+        self.started = time.time()
+        self.last_output = self.started
+        self.watching_logs = False
+        # when watching logs stopped, they don't tell anything about the build since
+        self.logs_ended = None
+        # when the build was last seen running
+        self.last_running = None
+        self.straggling = False
+        # speculative duplicate of this build, or the build this one duplicates
+        self.twin = None
+        # whether the build got to pushing and uploading its outputs
+        self.publishing = False
+        self.cancelled = False
 
     @property
     def name(self):
         return self.build.get_build_name() if self.build else 'N/A'
 
-    def wait_to_finish(self):
-        self.build = self.osbs.wait_for_build_to_finish(self.name)
+    def update_status(self):
+        self.build = self.osbs.get_build(self.name)
         return self.build
 
-    def watch_logs(self):
+    def watch_logs(self, publishing_callback=None):
+        """
+        :param publishing_callback: callable, called with this build once
+                                    it logs it is starting post-build plugins
+        """
         for line in self.osbs.get_build_logs(self.name, follow=True):
+            self.last_output = time.time()
             self.log.info(line)
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            if publishing_callback and POSTBUILD_LOG_MARKER in line:
+                publishing_callback(self)
 
     def get_annotations(self):
         build_annotations = self.build.get_annotations() or {}
@@ -263,7 +302,10 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                  failure_retry_delay=FAILURE_RETRY_DELAY,
                  max_cluster_fails=MAX_CLUSTER_FAILS,
                  url=None, verify_ssl=True, use_auth=True,
-                 goarch=None):
+                 goarch=None, cluster_load_ttl=CLUSTER_LOAD_TTL,
+                 scheduling_policy='load', cluster_history=None,
+                 monitor_interval=MONITOR_INTERVAL, fail_fast=False,
+                 straggler_factor=None, straggler_log_timeout=None):
         """
         constructor
 
@@ -280,6 +322,20 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         :param max_cluster_fails: the maximum number of times a cluster can fail before being
                                   ignored
         :param goarch: dict, keys are platform, values are go language platform names
+        :param cluster_load_ttl: the time in seconds for which the load of a cluster is
+                                 reused by all platforms before it's fetched again
+        :param scheduling_policy: str, policy ordering clusters of each platform,
+                                  'load' or 'history', see cluster_scheduling
+        :param cluster_history: str, path to file keeping durations and results of
+                                worker builds by cluster, shared by builds on this node
+        :param monitor_interval: the delay in seconds between checks of worker builds status
+        :param fail_fast: bool, cancel worker builds of all platforms once a worker build
+                          of one platform fails
+        :param straggler_factor: float, start duplicate of worker build on another cluster
+                                 once it runs this many times longer than the mean duration
+                                 of builds on its cluster (from cluster_history)
+        :param straggler_log_timeout: the time in seconds without log output after which
+                                      worker build is duplicated on another cluster
         """
         super(OrchestrateBuildPlugin, self).__init__(tasker, workflow)
         self.platforms = self.get_platforms(platforms)
@@ -295,7 +351,15 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         self.find_cluster_retry_delay = find_cluster_retry_delay
         self.failure_retry_delay = failure_retry_delay
         self.max_cluster_fails = max_cluster_fails
+        self.cluster_load_ttl = cluster_load_ttl
+        self.monitor_interval = monitor_interval
+        self.fail_fast = fail_fast
+        self.straggler_factor = straggler_factor
+        self.straggler_log_timeout = straggler_log_timeout
+        self.scheduling_policy = get_scheduling_policy(scheduling_policy,
+                                                       ClusterHistory(cluster_history))
         self.koji_upload_dir = self.get_koji_upload_dir()
+        self._publishing_lock = threading.Lock()
         self.fs_task_id = self.get_fs_task_id()
         self.release = self.get_release()
 
@@ -315,9 +379,17 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
             self.log.warning('worker_build_image is deprecated')
 
         self.worker_builds = []
+        # duplicates of straggling worker builds, see start_speculative_build
+        self.speculative_builds = []
         self.namespace = get_build_json().get('metadata', {}).get('namespace', None)
         self.build_image_digests = {}  # by platform
         self._openshift_session = None
+        # OSBS clients by cluster name and platform, build image differs by platform
+        self._osbs_clients = {}
+        # (time fetched, number of active builds) by cluster name, shared by platforms
+        self._cluster_builds = {}
+        self._cluster_locks = {}
+        self._clusters_lock = threading.Lock()
         self.build_image_override = get_build_image_override(workflow, {})
         self.platform_descriptors = get_platform_descriptors(self.workflow, self.plat_des_fallback)
 
@@ -439,7 +511,17 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         conf = Configuration(**kwargs)
         return OSBS(conf, conf)
 
-    def get_cluster_info(self, cluster, platform):
+    def get_osbs_client(self, cluster, platform):
+        """
+        OSBS client for cluster, created once per cluster and platform
+
+        :return: OSBS instance
+        """
+        with self._clusters_lock:
+            osbs = self._osbs_clients.get((cluster.name, platform))
+        if osbs is not None:
+            return osbs
+
         kwargs = deepcopy(self.config_kwargs)
         kwargs['conf_section'] = cluster.name
         kwargs['conf_file'] = get_clusters_client_config_path(self.workflow,
@@ -451,38 +533,92 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
             raise RuntimeError("build_image for platform '%s' not available" % platform)
 
         osbs = self._get_openshift_session(kwargs)
+        with self._clusters_lock:
+            return self._osbs_clients.setdefault((cluster.name, platform), osbs)
+
+    def _get_cluster_lock(self, cluster):
+        with self._clusters_lock:
+            return self._cluster_locks.setdefault(cluster.name, threading.Lock())
+
+    def get_cluster_current_builds(self, cluster, osbs):
+        """
+        number of active builds on cluster, fetched at most once per
+        cluster_load_ttl seconds for all platforms; while it's being fetched,
+        other platforms wait for the result rather than fetch it as well
+
+        :raises: OsbsException, failures are not remembered
+        """
+        with self._get_cluster_lock(cluster):
+            fetched = self._cluster_builds.get(cluster.name)
+            if fetched is not None and time.time() - fetched[0] < self.cluster_load_ttl:
+                return fetched[1]
+
+            current_builds = self.get_current_builds(osbs)
+            self._cluster_builds[cluster.name] = (time.time(), current_builds)
+            return current_builds
+
+    def _add_cluster_build(self, cluster):
+        """
+        count build started on cluster in its remembered load
+        """
+        with self._get_cluster_lock(cluster):
+            fetched = self._cluster_builds.get(cluster.name)
+            if fetched is not None:
+                self._cluster_builds[cluster.name] = (fetched[0], fetched[1] + 1)
 
-        current_builds = self.get_current_builds(osbs)
+    def get_cluster_info(self, cluster, platform):
+        osbs = self.get_osbs_client(cluster, platform)
+
+        current_builds = self.get_cluster_current_builds(cluster, osbs)
 
         load = current_builds / cluster.max_concurrent_builds
         self.log.debug('enabled cluster %s for platform %s has load %s and active builds %s/%s',
                        cluster.name, platform, load, current_builds, cluster.max_concurrent_builds)
         return ClusterInfo(cluster, platform, osbs, load)
 
+    def _get_cluster_info_no_raise(self, args):
+        cluster, platform = args
+        try:
+            return self.get_cluster_info(cluster, platform), None
+        except Exception as ex:
+            return None, ex
+
     def get_clusters(self, platform, retry_contexts, all_clusters):
-        ''' return clusters sorted by load. '''
+        ''' return clusters sorted by scheduling policy. '''
 
         possible_cluster_info = {}
         candidates = set(copy.copy(all_clusters))
         while candidates and not possible_cluster_info:
             wait_for_any_cluster(retry_contexts)
 
-            for cluster in sorted(candidates, key=attrgetter('priority')):
-                ctx = retry_contexts[cluster.name]
-                if ctx.in_retry_wait:
-                    continue
-                if ctx.failed:
-                    continue
+            clusters = [cluster for cluster in sorted(candidates, key=attrgetter('priority'))
+                        if not retry_contexts[cluster.name].in_retry_wait and
+                        not retry_contexts[cluster.name].failed]
+
+            # query clusters concurrently, slow cluster delays only its own result
+            if len(clusters) > 1:
+                thread_pool = ThreadPool(len(clusters))
                 try:
-                    cluster_info = self.get_cluster_info(cluster, platform)
+                    results = list(thread_pool.imap(self._get_cluster_info_no_raise,
+                                                    [(cluster, platform) for cluster in clusters]))
+                finally:
+                    thread_pool.close()
+                    thread_pool.join()
+            else:
+                results = [self._get_cluster_info_no_raise((cluster, platform))
+                           for cluster in clusters]
+
+            for cluster, (cluster_info, ex) in zip(clusters, results):
+                if isinstance(ex, OsbsException):
+                    retry_contexts[cluster.name].try_again_later(self.find_cluster_retry_delay)
+                elif ex is not None:
+                    raise ex
+                else:
                     possible_cluster_info[cluster] = cluster_info
-                except OsbsException:
-                    ctx.try_again_later(self.find_cluster_retry_delay)
             candidates -= set([c for c in candidates if retry_contexts[c.name].failed])
 
-        ret = sorted(possible_cluster_info.values(), key=lambda c: c.cluster.priority)
-        ret = sorted(ret, key=lambda c: c.load)
-        return ret
+        return self.scheduling_policy.sort_clusters(platform,
+                                                    list(possible_cluster_info.values()))
 
     def get_release(self):
         labels = Labels(df_parser(self.workflow.builder.df_path, workflow=self.workflow).labels)
@@ -558,6 +694,25 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                 'primary': sorted(list(primary)),
             }
 
+    def _record_worker_builds(self, worker_annotations):
+        """
+        let scheduling policy learn from finished worker builds, the duration
+        of a build is the sum of durations of its plugins
+
+        :param worker_annotations: dict, annotations of worker builds by platform
+        """
+        for build_info in self.worker_builds:
+            if not build_info.build or not build_info.build.is_finished():
+                continue
+            if build_info.build.is_cancelled():
+                # not the cluster's fault
+                continue
+            metadata = worker_annotations[build_info.platform]['plugins-metadata']
+            durations = metadata.get('durations')
+            duration = sum(durations.values()) if durations else None
+            self.scheduling_policy.record_build(build_info.cluster.name, build_info.platform,
+                                                duration, build_info.build.is_succeeded())
+
     def _make_labels(self):
         labels = {}
         koji_build_id = None
@@ -597,8 +752,18 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         return task_id
 
     def do_worker_build(self, cluster_info):
+        self.worker_builds.append(self.create_worker_build(cluster_info))
+
+    def create_worker_build(self, cluster_info, koji_upload_dir=None):
+        """
+        :param koji_upload_dir: str, path to upload outputs to, self.koji_upload_dir
+                                if not specified
+        :return: WorkerBuildInfo, without build if it couldn't be created
+        :raises: OsbsException, if the cluster failed to create the build
+        """
         workspace = self.workflow.plugin_workspace.get(self.key, {})
         override_kwargs = workspace.get(WORKSPACE_KEY_OVERRIDE_KWARGS, {})
+        koji_upload_dir = koji_upload_dir or self.koji_upload_dir
 
         build = None
 
@@ -612,7 +777,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                 }
             }
             kwargs = self.get_worker_build_kwargs(self.release, cluster_info.platform,
-                                                  self.koji_upload_dir, self.fs_task_id,
+                                                  koji_upload_dir, self.fs_task_id,
                                                   worker_openshift)
             # Set overrides for all platforms
             if None in override_kwargs:
@@ -624,6 +789,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                 kwargs.update(override_kwargs[cluster_info.platform])
             with cluster_info.osbs.retries_disabled():
                 build = cluster_info.osbs.create_worker_build(**kwargs)
+            self._add_cluster_build(cluster_info.cluster)
         except OsbsException:
             self.log.exception('%s - failed to create worker build.',
                                cluster_info.platform)
@@ -632,26 +798,247 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
             self.log.exception('%s - failed to create worker build',
                                cluster_info.platform)
 
-        build_info = WorkerBuildInfo(build=build, cluster_info=cluster_info, logger=self.log)
-        self.worker_builds.append(build_info)
+        build_info = WorkerBuildInfo(build=build, cluster_info=cluster_info, logger=self.log,
+                                     koji_upload_dir=koji_upload_dir)
 
         if build_info.build:
+            self.log.info('%s - created build %s on cluster %s.', cluster_info.platform,
+                          build_info.name, cluster_info.cluster.name)
+        return build_info
+
+    def _watch_logs(self, build_info):
+        try:
+            build_info.watch_logs(publishing_callback=self._claim_publishing)
+        except Exception:
+            # build status is checked independently
+            self.log.exception('%s - failed to watch logs of worker build', build_info.platform)
+        finally:
+            build_info.watching_logs = False
+            build_info.logs_ended = time.time()
+
+    def _claim_publishing(self, build_info):
+        """
+        Let only one of a worker build and its speculative duplicate push
+        and upload outputs, the other one is cancelled before getting to it
+        """
+        with self._publishing_lock:
+            if build_info.cancelled:
+                return
+            twin = build_info.twin
+            if twin and twin.publishing:
+                loser = build_info
+            else:
+                build_info.publishing = True
+                loser = twin
+            if loser:
+                loser.cancelled = True
+        if loser:
+            self.log.info('%s - worker build %s is publishing outputs, cancelling %s',
+                          build_info.platform, loser.twin.name, loser.name)
+            self._cancel_worker_build(loser)
+
+    def _cancel_worker_build(self, build_info):
+        build_info.cancelled = True
+        try:
+            build_info.cancel_build()
+        except OsbsException:
+            pass
+
+    def _start_watching_logs(self, build_info):
+        thread = threading.Thread(target=self._watch_logs, args=(build_info,),
+                                  name='logs-{}'.format(build_info.name))
+        thread.daemon = True
+        build_info.watching_logs = True
+        thread.start()
+        return thread
+
+    def _update_worker_build(self, build_info):
+        """
+        :return: bool, whether the worker build is finished or can't be monitored
+        """
+        try:
+            build = build_info.update_status()
+        except Exception as e:
+            build_info.monitor_exception = e
+            self.log.exception('%s - failed to monitor worker build', build_info.platform)
+            # Attempt to cancel it rather than leave it running
+            # unmonitored.
+            self._cancel_worker_build(build_info)
+            return True
+
+        if build.is_finished():
+            self.log.info('%s - worker build %s finished with status %s',
+                          build_info.platform, build_info.name, build.status)
+            return True
+        build_info.last_running = time.time()
+        return False
+
+    def _replace_worker_build(self, old, new):
+        if old in self.worker_builds:
+            self.worker_builds[self.worker_builds.index(old)] = new
+
+    def get_straggling_reason(self, build_info):
+        """
+        :return: str, why the worker build is considered straggling, or None
+        """
+        now = time.time()
+        if self.straggler_factor:
+            expected = self.scheduling_policy.history.get_stats(build_info.cluster.name,
+                                                                build_info.platform)['duration']
+            if expected and now - build_info.started > self.straggler_factor * expected:
+                return 'running for {:.0f}s, builds on cluster {} take {:.0f}s'.format(
+                    now - build_info.started, build_info.cluster.name, expected)
+        # without logs being watched, last output says nothing about the build
+        if (self.straggler_log_timeout and build_info.watching_logs and
+                now - build_info.last_output > self.straggler_log_timeout):
+            return 'no log output for {:.0f}s'.format(now - build_info.last_output)
+        return None
+
+    def start_speculative_build(self, build_info):
+        """
+        Start duplicate of straggling worker build on another cluster
+
+        The duplicate uploads its outputs to a subdirectory of koji_upload_dir,
+        so neither of them overwrites files of the other one.
+
+        :return: WorkerBuildInfo, the duplicate, or None if no other cluster
+                 could start it
+        """
+        clusters = [cluster for cluster in
+                    self.reactor_config.get_enabled_clusters_for_platform(build_info.platform)
+                    if cluster.name != build_info.cluster.name]
+        # each cluster is tried once, straggling build keeps running meanwhile
+        retry_contexts = {cluster.name: ClusterRetryContext(1) for cluster in clusters}
+        try:
+            cluster_infos = self.get_clusters(build_info.platform, retry_contexts, clusters)
+        except AllClustersFailedException:
+            cluster_infos = []
+
+        koji_upload_dir = os.path.join(self.koji_upload_dir,
+                                       '{}-duplicate'.format(build_info.platform))
+        for cluster_info in cluster_infos:
             try:
-                self.log.info('%s - created build %s on cluster %s.', cluster_info.platform,
-                              build_info.name, cluster_info.cluster.name)
-                build_info.watch_logs()
-                build_info.wait_to_finish()
-            except Exception as e:
-                build_info.monitor_exception = e
-                self.log.exception('%s - failed to monitor worker build',
-                                   cluster_info.platform)
-
-                # Attempt to cancel it rather than leave it running
-                # unmonitored.
-                try:
-                    build_info.cancel_build()
-                except OsbsException:
-                    pass
+                duplicate = self.create_worker_build(cluster_info, koji_upload_dir)
+            except OsbsException:
+                continue
+            if duplicate.build:
+                self.speculative_builds.append(duplicate)
+                return duplicate
+        return None
+
+    def _drop_duplicate(self, build_info):
+        """
+        Cancel the speculative duplicate when logs of the worker build or of
+        the duplicate stop being watched while neither of them is publishing;
+        either of them could then publish unnoticed, the original one is kept
+
+        :return: bool, whether the duplicate was cancelled
+        """
+        twin = build_info.twin
+        with self._publishing_lock:
+            if (build_info.publishing or twin.publishing or
+                    build_info.cancelled or twin.cancelled):
+                return False
+            if not (self.logs_lost(build_info) or self.logs_lost(twin)):
+                return False
+            duplicate = build_info if build_info in self.speculative_builds else twin
+            duplicate.cancelled = True
+        self.log.warning('%s - logs of worker build %s or %s are not watched, cancelling '
+                         'duplicate %s', build_info.platform, build_info.name, twin.name,
+                         duplicate.name)
+        self._cancel_worker_build(duplicate)
+        return True
+
+    def logs_lost(self, build_info):
+        """
+        :return: bool, whether logs of the worker build stopped being watched
+                 while it kept running, so it may get to publishing outputs unnoticed
+        """
+        # logs end a bit before the build is seen finished
+        return (build_info.logs_ended is not None and build_info.last_running is not None and
+                build_info.last_running - build_info.logs_ended >= self.monitor_interval)
+
+    def monitor_worker_builds(self):
+        """
+        Wait for all started worker builds to finish
+
+        Status of all worker builds is checked by a single loop, every
+        monitor_interval seconds, so a failure is noticed as soon as it
+        happens regardless of the platform. osbs-client streams logs only
+        by blocking calls, each build's logs are watched by a daemon thread.
+
+        Straggling worker build (see get_straggling_reason) is duplicated
+        on another cluster; the first of them to start post-build plugins,
+        which push and upload its outputs, or to finish successfully, is
+        used, the other one is cancelled. When logs of either of them stop
+        being watched while they run, publishing can't be noticed and the
+        duplicate is cancelled.
+        """
+        pending = [build_info for build_info in self.worker_builds if build_info.build]
+        log_threads = [self._start_watching_logs(build_info) for build_info in pending]
+
+        failed_platform = None
+        cancelled = False
+        while True:
+            for build_info in list(pending):
+                if build_info not in pending:
+                    # twin of a build finished in this round
+                    continue
+                if not self._update_worker_build(build_info):
+                    if build_info.twin in pending and self._drop_duplicate(build_info):
+                        continue
+                    # without logs, publishing outputs wouldn't be noticed
+                    if (build_info.straggling or build_info.twin or build_info.publishing or
+                            not build_info.watching_logs or cancelled):
+                        continue
+                    reason = self.get_straggling_reason(build_info)
+                    if reason:
+                        self.log.warning('%s - worker build %s is straggling, %s',
+                                         build_info.platform, build_info.name, reason)
+                        build_info.straggling = True
+                        duplicate = self.start_speculative_build(build_info)
+                        if duplicate:
+                            build_info.twin, duplicate.twin = duplicate, build_info
+                            pending.append(duplicate)
+                            log_threads.append(self._start_watching_logs(duplicate))
+                    continue
+
+                pending.remove(build_info)
+                succeeded = build_info.build.is_succeeded() and not build_info.monitor_exception
+                twin = build_info.twin
+                if twin in pending:
+                    if succeeded:
+                        self.log.info('%s - worker build %s finished first, cancelling %s',
+                                      build_info.platform, build_info.name, twin.name)
+                        pending.remove(twin)
+                        # unless cancelled already, e.g. when this one started publishing
+                        if not twin.cancelled:
+                            self._cancel_worker_build(twin)
+                        self._replace_worker_build(twin, build_info)
+                    else:
+                        self.log.info('%s - worker build %s failed, waiting for %s',
+                                      build_info.platform, build_info.name, twin.name)
+                        self._replace_worker_build(build_info, twin)
+                elif not succeeded:
+                    failed_platform = failed_platform or build_info.platform
+
+            if self.fail_fast and failed_platform and pending and not cancelled:
+                self.log.warning('worker build for platform %s failed, cancelling worker '
+                                 'builds for other platforms', failed_platform)
+                for build_info in pending:
+                    build_info.monitor_exception = BuildCanceledException(
+                        'worker build for platform {} failed'.format(failed_platform))
+                    self._cancel_worker_build(build_info)
+                # cancelled builds are still checked, to get their final status
+                cancelled = True
+
+            if not pending:
+                break
+            time.sleep(self.monitor_interval)
+
+        # logs end with builds
+        for thread in log_threads:
+            thread.join()
 
     def select_and_start_cluster(self, platform):
         ''' Choose a cluster and start a build on it '''
@@ -731,7 +1118,10 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         repo, tag = image.rsplit(':', 1)
 
         registry = ImageName(registry=registry_name, repo=repo, tag=tag)
-        manifest_list = get_manifest_list(registry, registry_name, insecure=True)
+        registry_session = self.workflow.registry_sessions.get_session(registry_name,
+                                                                       insecure=True)
+        manifest_list = get_manifest_list(registry, registry_name, insecure=True,
+                                          registry_session=registry_session)
 
         # we don't have manifest list, but we want to build on different platforms
         if not manifest_list:
@@ -882,14 +1272,19 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
 
         try:
             result.get()
+            self.monitor_worker_builds()
         # Always clean up worker builds on any error to avoid
         # runaway worker builds (includes orchestrator build cancellation)
         except Exception:
             thread_pool.terminate()
             self.log.info('build cancelled, cancelling worker builds')
-            if self.worker_builds:
-                ThreadPool(len(self.worker_builds)).map(
-                    lambda bi: bi.cancel_build(), self.worker_builds)
+            # duplicates replacing worker builds are listed in both
+            worker_builds = self.worker_builds + [build_info for build_info
+                                                  in self.speculative_builds
+                                                  if build_info not in self.worker_builds]
+            if worker_builds:
+                ThreadPool(len(worker_builds)).map(
+                    lambda bi: bi.cancel_build(), worker_builds)
             while not result.ready():
                 result.wait(1)
             raise
@@ -903,6 +1298,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         }}
 
         self._apply_repositories(annotations)
+        self._record_worker_builds(annotations['worker-builds'])
 
         labels = self._make_labels()
 
@@ -9,13 +9,30 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals
 
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
+import random
+import threading
+import time
 import requests
 
 from atomic_reactor.plugin import ExitPlugin, PluginFailedException
-from atomic_reactor.util import RegistrySession, registry_hostname
+from atomic_reactor.util import registry_hostname
 from atomic_reactor.plugins.pre_reactor_config import get_registries
 from atomic_reactor.constants import PLUGIN_GROUP_MANIFESTS_KEY
-from requests.exceptions import HTTPError, RetryError, Timeout
+from requests.exceptions import ConnectionError, HTTPError, RetryError, Timeout
+
+# maximum number of DELETE requests sent to a registry concurrently
+DELETE_THREADS = 4
+# retries of deletions failed because of throttling or connection errors
+DELETE_RETRIES = 2
+# seconds, doubled for each retry and randomized to spread retries of concurrent deletions
+DELETE_RETRY_DELAY = 2.0
+
+# outcomes of deletions
+DELETED = 'deleted'
+NOT_FOUND = 'not found'
+NOT_ALLOWED = 'not allowed'
+FAILED = 'failed'
 
 
 class DeleteFromRegistryPlugin(ExitPlugin):
@@ -26,7 +43,8 @@ class DeleteFromRegistryPlugin(ExitPlugin):
     key = "delete_from_registry"
     is_allowed_to_fail = False
 
-    def __init__(self, tasker, workflow, registries=None):
+    def __init__(self, tasker, workflow, registries=None, delete_threads=DELETE_THREADS,
+                 delete_retries=DELETE_RETRIES, delete_retry_delay=DELETE_RETRY_DELAY):
         """
         :param tasker: DockerTasker instance
         :param workflow: DockerBuildWorkflow instance
@@ -35,31 +53,135 @@ class DeleteFromRegistryPlugin(ExitPlugin):
                            Params:
                             * "secret" optional string - path to the secret, which stores
                               login and password for remote registry
+        :param delete_threads: int, maximum number of manifests deleted from a registry
+                               concurrently
+        :param delete_retries: int, number of retries of a deletion failed because of
+                               throttling (429) or connection errors
+        :param delete_retry_delay: float, seconds to wait before the first retry
         """
         super(DeleteFromRegistryPlugin, self).__init__(tasker, workflow)
 
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
+        self.delete_threads = delete_threads
+        self.delete_retries = delete_retries
+        self.delete_retry_delay = delete_retry_delay
+        self.deleted_digests = set()
+        # manifests by outcome of their deletion
+        self.summary = {outcome: [] for outcome in (DELETED, NOT_FOUND, NOT_ALLOWED, FAILED)}
+        # (registry, repo, digest) of manifests deletion was requested for
+        self._requested = set()
+        self._lock = threading.Lock()
+
+    def _get_retry_delay(self, attempt):
+        delay = self.delete_retry_delay * 2 ** (attempt - 1)
+        return delay * random.uniform(0.5, 1.5)
 
     def request_delete(self, session, url, manifest):
-        try:
-            response = session.delete(url)
-            response.raise_for_status()
-            self.log.info("deleted manifest %s", manifest)
-            return True
+        """
+        :return: str, outcome of the deletion, DELETED, NOT_FOUND or NOT_ALLOWED
+        :raises PluginFailedException: when deleting failed
+        """
+        attempt = 0
+        while True:
+            try:
+                response = session.delete(url)
+                response.raise_for_status()
+                self.log.info("deleted manifest %s", manifest)
+                return DELETED
+
+            except (HTTPError, RetryError, Timeout, ConnectionError) as ex:
+                response = ex.response
+                status_code = response.status_code if response is not None else None
+
+                if status_code == requests.codes.NOT_FOUND:
+                    self.log.warning("cannot delete %s: not found", manifest)
+                    return NOT_FOUND
+                elif status_code == requests.codes.METHOD_NOT_ALLOWED:
+                    self.log.warning("cannot delete %s: image deletion disabled on registry",
+                                     manifest)
+                    return NOT_ALLOWED
+                elif attempt < self.delete_retries and \
+                        status_code in (None, requests.codes.TOO_MANY_REQUESTS):
+                    attempt += 1
+                    delay = self._get_retry_delay(attempt)
+                    self.log.warning("failed to delete %s: %r, retrying in %.1fs",
+                                     manifest, ex, delay)
+                    time.sleep(delay)
+                elif response is not None:
+                    msg = "failed to delete %s: %s" % (manifest, response.reason)
+                    self.log.error("%s\n%s", msg, response.text)
+                    raise PluginFailedException(msg)
+                else:
+                    msg = "failed to delete %s: %r" % (manifest, ex)
+                    self.log.error("%s", msg)
+                    raise PluginFailedException(msg)
 
-        except (HTTPError, RetryError, Timeout) as ex:
+    def delete_manifests(self, deletions):
+        """
+        Deletes manifests concurrently, sending up to delete_threads requests to each
+        registry at a time. Manifests whose deletion was requested before are skipped.
 
-            if ex.response.status_code == requests.codes.NOT_FOUND:
-                self.log.warning("cannot delete %s: not found", manifest)
-            elif ex.response.status_code == requests.codes.METHOD_NOT_ALLOWED:
-                self.log.warning("cannot delete %s: image deletion disabled on registry",
-                                 manifest)
-            else:
-                msg = "failed to delete %s: %s" % (manifest, ex.response.reason)
-                self.log.error("%s\n%s", msg, ex.response.text)
-                raise PluginFailedException(msg)
+        :param deletions: list of (session, repo, digest) tuples
+        :return: list of ((session, repo, digest), PluginFailedException) tuples,
+                 failed deletions and their errors
+        """
+        pending = []
+        with self._lock:
+            for session, repo, digest in deletions:
+                key = (registry_hostname(session.registry), repo, digest)
+                if key in self._requested:
+                    # Manifest schema version 2 uses the same digest
+                    # for all tags
+                    self.log.info('deletion of %s already requested', digest)
+                    continue
+                self._requested.add(key)
+                pending.append((session, repo, digest))
+
+        counts = {}
+        for session, _, _ in pending:
+            registry = registry_hostname(session.registry)
+            counts[registry] = counts.get(registry, 0) + 1
+        semaphores = {registry: threading.BoundedSemaphore(self.delete_threads)
+                      for registry in counts}
+
+        def delete(args):
+            session, repo, digest = args
+            registry = registry_hostname(session.registry)
+            manifest = self.make_manifest(registry, repo, digest)
+            error = None
+            with semaphores[registry]:
+                try:
+                    outcome = self.request_delete(session, self.make_url(repo, digest),
+                                                  manifest)
+                except PluginFailedException as ex:
+                    outcome, error = FAILED, ex
+            with self._lock:
+                self.summary[outcome].append(manifest)
+                if outcome == DELETED:
+                    self.deleted_digests.add(digest)
+            return args, error
+
+        threads = sum(min(self.delete_threads, count) for count in counts.values())
+        if threads <= 1:
+            results = [delete(args) for args in pending]
+        else:
+            pool = ThreadPool(threads)
+            try:
+                results = pool.map(delete, pending)
+            finally:
+                pool.close()
+                pool.join()
+        return [(args, error) for args, error in results if error is not None]
 
-        return False
+    def log_summary(self):
+        """
+        Logs deleted, not found, not allowed and failed manifests
+        """
+        with self._lock:
+            for outcome, manifests in sorted(self.summary.items()):
+                if manifests:
+                    self.log.info("%s: %d manifests: %s", outcome, len(manifests),
+                                  ', '.join(sorted(manifests)))
 
     def make_manifest(self, registry, repo, digest):
         return "{registry}/{repo}@{digest}".format(**vars())
@@ -74,39 +196,26 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
         return None
 
-    def handle_registry(self, session, push_conf_registry, deleted_digests):
-        registry_noschema = registry_hostname(session.registry)
-        deleted = False
-
+    def handle_registry(self, session, push_conf_registry):
+        """
+        :return: list of (session, repo, digest), manifests to delete
+        """
+        deletions = []
         for tag, digests in push_conf_registry.digests.items():
-            digest = digests.default
-            if digest in deleted_digests:
-                # Manifest schema version 2 uses the same digest
-                # for all tags
-                self.log.info('digest already deleted %s', digest)
-                deleted = True
-                continue
-
             repo = tag.split(':')[0]
-            url = self.make_url(repo, digest)
-            manifest = self.make_manifest(registry_noschema, repo, digest)
-
-            if self.request_delete(session, url, manifest):
-                deleted_digests.add(digest)
-                deleted = True
+            deletions.append((session, repo, digests.default))
+        return deletions
 
-        return deleted
-
-    def delete_manifest_lists(self, session, registry_noschema, deleted_digests):
+    def get_manifest_lists(self, session):
+        """
+        :return: list of (session, repo, digest), manifest lists to delete
+        """
         manifest_list_digests = self.workflow.postbuild_results.get(PLUGIN_GROUP_MANIFESTS_KEY)
         if not manifest_list_digests:
-            return
+            return []
 
-        for repo, digest in manifest_list_digests.items():
-            url = self.make_url(repo, digest.default)
-            manifest = self.make_manifest(registry_noschema, repo, digest.default)
-            self.request_delete(session, url, manifest)
-            deleted_digests.add(digest.default)
+        return [(session, repo, digest.default)
+                for repo, digest in manifest_list_digests.items()]
 
     def get_worker_digests(self):
         """
@@ -133,36 +242,25 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
         return worker_digests
 
-    def handle_worker_digests(self, session, worker_digests, deleted_digests):
+    def handle_worker_digests(self, session, worker_digests):
+        """
+        :return: list of (session, repo, digest), manifests to delete, or None if
+                 there are no worker digests for the registry
+        """
         registry_noschema = registry_hostname(session.registry)
 
         if registry_noschema not in worker_digests:
-            return False
-
-        # Remove manifest list first to avoid broken lists in case an error occurs
-        self.delete_manifest_lists(session, registry_noschema, deleted_digests)
-
-        digests = worker_digests[registry_noschema]
-        for digest in digests:
-            if digest['digest'] in deleted_digests:
-                # Manifest schema version 2 uses the same digest
-                # for all tags
-                self.log.info('digest already deleted %s', digest['digest'])
-                return True
+            return None
 
-            url = self.make_url(digest['repository'], digest['digest'])
-            manifest = self.make_manifest(registry_noschema, digest['repository'],
-                                          digest['digest'])
-
-            if self.request_delete(session, url, manifest):
-                deleted_digests.add(digest['digest'])
-
-        return True
+        return [(session, digest['repository'], digest['digest'])
+                for digest in worker_digests[registry_noschema]]
 
     def run(self):
-        deleted_digests = set()
-
         worker_digests = self.get_worker_digests()
+        manifest_lists = []
+        manifests = []
+        # push_conf registries and their manifests
+        pushed = []
 
         for registry, registry_conf in self.registries.items():
             registry_noschema = registry_hostname(registry)
@@ -183,22 +281,45 @@ class DeleteFromRegistryPlugin(ExitPlugin):
 
             secret_path = registry_conf.get('secret')
 
-            session = RegistrySession(registry, insecure=insecure, dockercfg_path=secret_path)
+            session = self.workflow.registry_sessions.get_session(registry, insecure=insecure,
+                                                                  dockercfg_path=secret_path)
 
             # orchestrator builds use worker_digests
-            orchestrator_delete = self.handle_worker_digests(session, worker_digests,
-                                                             deleted_digests)
+            worker_manifests = self.handle_worker_digests(session, worker_digests)
+            if worker_manifests is not None:
+                manifest_lists.extend(self.get_manifest_lists(session))
+                manifests.extend(worker_manifests)
 
             if not push_conf_registry:
                 # only warn if we're not running in the orchestrator
-                if not orchestrator_delete:
+                if worker_manifests is None:
                     self.log.warning("requested deleting image from %s but we haven't pushed there",
                                      registry_noschema)
                 continue
 
             # worker node and manifests use push_conf_registry
-            if self.handle_registry(session, push_conf_registry, deleted_digests):
+            registry_manifests = self.handle_registry(session, push_conf_registry)
+            manifests.extend(registry_manifests)
+            pushed.append((push_conf_registry, [digest for _, _, digest in registry_manifests]))
+
+        # Remove manifest lists first to avoid broken lists in case an error occurs
+        failures = self.delete_manifests(manifest_lists)
+        # manifests referenced by manifest lists which couldn't be deleted are kept
+        kept_repos = set((registry_hostname(session.registry), repo)
+                         for (session, repo, _), _ in failures)
+        for registry, repo in sorted(kept_repos):
+            self.log.warning("not deleting manifests from %s/%s, its manifest list "
+                             "couldn't be deleted", registry, repo)
+        failures.extend(self.delete_manifests(
+            [(session, repo, digest) for session, repo, digest in manifests
+             if (registry_hostname(session.registry), repo) not in kept_repos]))
+        self.log_summary()
+        if failures:
+            raise failures[0][1]
+
+        for push_conf_registry, digests in pushed:
+            if self.deleted_digests.intersection(digests):
                 # delete these temp registries
                 self.workflow.push_conf.remove_docker_registry(push_conf_registry)
 
-        return deleted_digests
+        return self.deleted_digests
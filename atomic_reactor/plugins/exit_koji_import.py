@@ -16,7 +16,8 @@ from atomic_reactor import start_time as atomic_reactor_start_time
 from atomic_reactor.plugin import ExitPlugin
 from atomic_reactor.source import GitSource
 from atomic_reactor.plugins.build_orchestrate_build import (get_worker_build_info,
-                                                            get_koji_upload_dir)
+                                                            get_koji_upload_dir,
+                                                            get_worker_koji_upload_dir)
 from atomic_reactor.plugins.pre_add_filesystem import AddFilesystemPlugin
 from atomic_reactor.plugins.pre_check_and_set_rebuild import is_rebuild
 from atomic_reactor.util import OSBSLogs, get_parent_image_koji_data
@@ -136,9 +137,15 @@ class KojiImportPlugin(ExitPlugin):
         except (KeyError, IndexError):
             crane_registry = None
 
+        server_dir = get_koji_upload_dir(self.workflow)
         for platform in worker_metadatas:
+            # speculative duplicate of worker build uploads to a subdirectory
+            relpath = os.path.relpath(get_worker_koji_upload_dir(self.workflow, platform),
+                                      server_dir)
             for instance in worker_metadatas[platform]['output']:
                 instance['buildroot_id'] = '{}-{}'.format(platform, instance['buildroot_id'])
+                if relpath != os.curdir:
+                    instance['relpath'] = relpath
 
                 if instance['type'] == 'docker-image':
                     # update image ID with pulp_pull results;
@@ -52,7 +52,8 @@ from atomic_reactor.util import (Output, get_version_of_tools, get_checksums,
                                  are_plugins_in_order,
                                  get_image_upload_filename,
                                  get_manifest_media_type)
-from atomic_reactor.koji_util import (tag_koji_build, KojiUploadLogger, get_koji_task_owner)
+from atomic_reactor.koji_util import (tag_koji_build, KojiUploadLogger, get_koji_task_owner,
+                                      UPLOAD_THREADS, map_in_subsessions, upload_file)
 from atomic_reactor.rpm_util import parse_rpm_output, rpm_qf_args
 from osbs.exceptions import OsbsException
 from osbs.utils import Labels
@@ -92,7 +93,7 @@ class KojiPromotePlugin(ExitPlugin):
                  koji_ssl_certs=None, koji_proxy_user=None,
                  koji_principal=None, koji_keytab=None,
                  metadata_only=False, blocksize=None,
-                 target=None, poll_interval=5):
+                 target=None, poll_interval=5, upload_threads=UPLOAD_THREADS):
         """
         constructor
 
@@ -110,6 +111,7 @@ class KojiPromotePlugin(ExitPlugin):
         :param blocksize: int, blocksize to use for uploading files
         :param target: str, koji target
         :param poll_interval: int, seconds between Koji task status requests
+        :param upload_threads: int, number of files uploaded concurrently
         """
         super(KojiPromotePlugin, self).__init__(tasker, workflow)
 
@@ -131,6 +133,7 @@ class KojiPromotePlugin(ExitPlugin):
 
         self.metadata_only = metadata_only
         self.blocksize = blocksize
+        self.upload_threads = upload_threads
         self.target = target
         self.poll_interval = poll_interval
 
@@ -641,14 +644,14 @@ class KojiPromotePlugin(ExitPlugin):
         self.log.debug("uploading %r to %r as %r",
                        output.file.name, serverdir, name)
 
-        kwargs = {}
         if self.blocksize is not None:
-            kwargs['blocksize'] = self.blocksize
             self.log.debug("using blocksize %d", self.blocksize)
 
         upload_logger = KojiUploadLogger(self.log)
-        session.uploadWrapper(output.file.name, serverdir, name=name,
-                              callback=upload_logger.callback, **kwargs)
+        upload_file(session, output.file.name, serverdir, name,
+                    checksum=output.metadata.get('checksum'),
+                    checksum_type=output.metadata.get('checksum_type', 'md5'),
+                    blocksize=self.blocksize, callback=upload_logger.callback)
         path = os.path.join(serverdir, name)
         self.log.debug("uploaded %r", path)
         return path
@@ -680,9 +683,10 @@ class KojiPromotePlugin(ExitPlugin):
 
         try:
             server_dir = self.get_upload_server_dir()
-            for output in output_files:
-                if output.file:
-                    self.upload_file(self.koji_session, output, server_dir)
+            map_in_subsessions(self.koji_session,
+                               lambda s, output: self.upload_file(s, output, server_dir),
+                               [output for output in output_files if output.file],
+                               self.upload_threads)
         finally:
             for output in output_files:
                 if output.file:
@@ -23,6 +23,7 @@ from atomic_reactor.constants import (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
                                       PLUGIN_ADD_FILESYSTEM_KEY,
                                       PLUGIN_BUILD_ORCHESTRATE_KEY,
                                       PLUGIN_GROUP_MANIFESTS_KEY,
+                                      PLUGIN_PULL_BASE_IMAGE_KEY,
                                       MEDIA_TYPE_DOCKER_V1)
 from atomic_reactor.plugin import ExitPlugin
 from atomic_reactor.util import get_build_json
@@ -147,11 +148,17 @@ class StoreMetadataInOSv3Plugin(ExitPlugin):
         return pullspecs
 
     def get_plugin_metadata(self):
-        return {
+        metadata = {
             "errors": self.workflow.plugins_errors,
             "timestamps": self.workflow.plugins_timestamps,
             "durations": self.workflow.plugins_durations,
         }
+        if self.workflow.plugins_profiles:
+            metadata["profiles"] = self.workflow.plugins_profiles
+        parent_images_cache = self.workflow.prebuild_results.get(PLUGIN_PULL_BASE_IMAGE_KEY)
+        if parent_images_cache:
+            metadata["parent_images_cache"] = parent_images_cache
+        return metadata
 
     def get_filesystem_metadata(self):
         data = {}
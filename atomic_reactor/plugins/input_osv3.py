@@ -176,6 +176,13 @@ class OSv3InputPlugin(InputPlugin):
         # make sure the final json is valid
         read_yaml(json.dumps(self.plugins_json), 'schemas/plugins.json')
 
+        if self.reactor_env and self.get_value('plugins_concurrency'):
+            input_json['plugins_concurrency'] = self.get_value('plugins_concurrency')
+        if self.reactor_env and self.get_value('plugins_profiling') is not None:
+            input_json['plugins_profiling'] = self.get_value('plugins_profiling')
+        if self.reactor_env and self.get_value('registry_cache') is not None:
+            input_json['registry_cache'] = self.get_value('registry_cache')
+
         return input_json
 
     @classmethod
@@ -6,19 +6,53 @@ This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
 
-import gzip
-try:
-    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
-    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
-    from backports import lzma
-except ImportError:
-    import lzma
+from __future__ import division
+
+import io
 import os
+import time
 
+from atomic_reactor.compression import (COMPRESSION_EXTENSIONS, COMPRESSION_METHODS,
+                                        measure_compression, open_compressor, zstandard)
 from atomic_reactor.constants import (EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE,
                                       IMAGE_TYPE_DOCKER_ARCHIVE)
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.util import get_exported_image_metadata, human_size
+from atomic_reactor.util import export_image_stream, human_size
+
+# (method, level) pairs tried by auto method, the fastest first; slow
+# levels are left out, sampling them would take longer than it saves
+AUTO_CANDIDATES = [
+    ('zstd', 1),
+    ('zstd', 3),
+    ('gzip', 1),
+    ('zstd', 9),
+    ('gzip', 6),
+    ('lzma', 1),
+]
+# candidates are sampled one after another, so that they don't skew
+# each other's throughput; the sample is kept small
+AUTO_SAMPLE_SIZE_MIB = 8
+
+
+class ChainedReader(object):
+    """
+    file-like object reading from streams one after another
+    """
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = b''.join(stream.read() for stream in self.streams)
+            self.streams = []
+            return data
+        while self.streams:
+            data = self.streams[0].read(size)
+            if data:
+                return data
+            self.streams.pop(0)
+        return b''
 
 
 class CompressPlugin(PostBuildPlugin):
@@ -28,53 +62,147 @@ class CompressPlugin(PostBuildPlugin):
             "name": "compress",
             "args": {
                     "method": "gzip",
-                    "load_exported_image": true
+                    "load_exported_image": true,
+                    "threads": 4
             }
     }]
 
-    Currently supported compression methods are gzip and lzma; gzip is default.
+    Currently supported compression methods are gzip, lzma and zstd (requires
+    zstandard module); gzip is default. zstd uses long-distance matching.
     By default, the plugin doesn't work on exported image, you have to explicitly
     ask for it by using `load_exported_image: true`.
+
+    With `threads` greater than 1, the image is compressed in blocks on that
+    many threads; gzip output is still a single gzip member, lzma output
+    consists of concatenated xz streams.
+
+    Method `auto` compresses the first `auto_sample_size` MiB of the image
+    with each of `auto_candidates` ([method, level] pairs) and uses the one
+    with the best ratio among those compressing at least `min_throughput`
+    MiB/s with ratio (compressed / uncompressed size) at most `max_ratio`;
+    when no candidate meets both targets, the fastest one is used.
+
+    Method, level, ratio and throughput (MiB/s) of the compression are
+    recorded in "compression" of the image metadata.
     """
     key = 'compress'
     is_allowed_to_fail = False
 
     # TODO: add remove_former_image?
-    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip'):
+    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip',
+                 level=None, threads=1, block_size=None, auto_sample_size=AUTO_SAMPLE_SIZE_MIB,
+                 auto_candidates=None, min_throughput=None, max_ratio=None):
         """
         :param tasker: DockerTasker instance
         :param workflow: DockerBuildWorkflow instance
         :param load_exported_image: bool, when running squash plugin with `dont_load=True`,
                                     you may load the exported tar with this switch
+        :param method: str, compression method, gzip, lzma, zstd or auto
+        :param level: int, compression level (preset for lzma), by default 6 for
+                      gzip and lzma and 3 for zstd
+        :param threads: int, number of threads compressing the image
+        :param block_size: int, size of blocks compressed in parallel,
+                           by default 1 MiB for gzip and 16 MiB for lzma
+        :param auto_sample_size: int, MiB of the image sampled by auto method
+        :param auto_candidates: list of [method, level] pairs tried by auto method
+        :param min_throughput: float, MiB/s, throughput target of auto method
+        :param max_ratio: float, compressed / uncompressed size target of auto method
         """
         super(CompressPlugin, self).__init__(tasker, workflow)
         self.load_exported_image = load_exported_image
         self.method = method
+        self.level = level
+        self.threads = threads
+        self.block_size = block_size
+        self.auto_sample_size = auto_sample_size
+        self.auto_candidates = auto_candidates or AUTO_CANDIDATES
+        self.min_throughput = min_throughput
+        self.max_ratio = max_ratio
         self.uncompressed_size = 0
 
-    def _compress_image_stream(self, stream):
+    def _select_method(self, sample):
+        """
+        compress sample with each of auto candidates and pick the best one
+
+        :return: tuple, method and level
+        """
+        results = []
+        for method, level in self.auto_candidates:
+            if method == 'zstd' and zstandard is None:
+                continue
+            ratio, throughput = measure_compression(sample, method, level, self.threads,
+                                                    self.block_size)
+            throughput /= 1024**2
+            self.log.debug('sampled %s level %d: ratio %.3f, %.1f MiB/s',
+                           method, level, ratio, throughput)
+            results.append((method, level, ratio, throughput))
+        if not results:
+            raise RuntimeError('No usable compression method in {0}'
+                               .format(self.auto_candidates))
+
+        eligible = [result for result in results
+                    if (self.min_throughput is None or result[3] >= self.min_throughput) and
+                    (self.max_ratio is None or result[2] <= self.max_ratio)]
+        if eligible:
+            method, level, _, _ = min(eligible, key=lambda result: result[2])
+        else:
+            method, level, _, _ = max(results, key=lambda result: result[3])
+            self.log.warning('no compression method meets targets (%s MiB/s, ratio %s), '
+                             'using the fastest one', self.min_throughput, self.max_ratio)
+        self.log.info('selected %s compression, level %d', method, level)
+        return method, level
+
+    def _read_sample(self, stream):
+        size = int(self.auto_sample_size * 1024**2)
+        chunks = []
+        while size > 0:
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _compress_image_stream(self, stream, image_type, layers=None):
+        method, level = self.method, self.level
+        if method == 'auto':
+            sample = self._read_sample(stream)
+            method, level = self._select_method(sample)
+            stream = ChainedReader(io.BytesIO(sample), stream)
+        if method not in COMPRESSION_METHODS:
+            raise RuntimeError('Unsupported compression format {0}'.format(method))
+        if method == 'zstd' and zstandard is None:
+            raise RuntimeError('zstd compression requires zstandard module')
+        if level is None:
+            level = 3 if method == 'zstd' else 6
+
         outfile = os.path.join(self.workflow.source.workdir,
                                EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE)
-        if self.method == 'gzip':
-            outfile = outfile.format('gz')
-            fp = gzip.open(outfile, 'wb', compresslevel=6)
-        elif self.method == 'lzma':
-            outfile = outfile.format('xz')
-            fp = lzma.open(outfile, 'wb')
-        else:
-            raise RuntimeError('Unsupported compression format {0}'.format(self.method))
+        outfile = outfile.format(COMPRESSION_EXTENSIONS[method])
 
-        _chunk_size = 1024**2  # 1 MB chunk size for reading/writing
-        self.log.info('compressing image %s to %s using %s method',
-                      self.workflow.image, outfile, self.method)
-        data = stream.read(_chunk_size)
-        while data != b'':
-            fp.write(data)
-            data = stream.read(_chunk_size)
+        def compress(fileobj):
+            return open_compressor(fileobj, method, level, self.threads, self.block_size,
+                                   filename=outfile)
 
-        self.uncompressed_size = stream.tell()
+        self.log.info('compressing image %s to %s using %s method (%d threads)',
+                      self.workflow.image, outfile, method, self.threads)
+        start = time.time()
+        # checksums, sizes and layers are computed while compressing,
+        # the compressed image is not read again
+        metadata = export_image_stream(stream, image_type, outfile, compress,
+                                       index_layers=layers is None)
+        duration = max(time.time() - start, 1e-6)
+        if layers is not None:
+            metadata['layers'] = layers
+        self.uncompressed_size = metadata['uncompressed_size']
+        metadata['compression'] = {
+            'method': method,
+            'level': level,
+            'ratio': metadata['size'] / max(self.uncompressed_size, 1),
+            'throughput': self.uncompressed_size / duration / 1024**2,
+        }
 
-        return outfile
+        return metadata
 
     def run(self):
         if self.load_exported_image and len(self.workflow.exported_image_sequence) > 0:
@@ -83,17 +211,17 @@ class CompressPlugin(PostBuildPlugin):
             image_type = image_metadata.get('type')
             self.log.info('preparing to compress image %s', image)
             with open(image, 'rb') as image_stream:
-                outfile = self._compress_image_stream(image_stream)
+                metadata = self._compress_image_stream(image_stream, image_type,
+                                                       image_metadata.get('layers'))
         else:
             image = self.workflow.image
             image_type = IMAGE_TYPE_DOCKER_ARCHIVE
             self.log.info('fetching image %s from docker', image)
             with self.tasker.d.get_image(image) as image_stream:
-                outfile = self._compress_image_stream(image_stream)
-        metadata = get_exported_image_metadata(outfile, image_type)
+                metadata = self._compress_image_stream(image_stream, image_type)
+        outfile = metadata['path']
 
         if self.uncompressed_size != 0:
-            metadata['uncompressed_size'] = self.uncompressed_size
             savings = 1 - metadata['size'] / float(metadata['uncompressed_size'])
             self.log.debug('uncompressed: %s, compressed: %s, ratio: %.2f %% saved',
                            human_size(metadata['uncompressed_size']),
@@ -14,14 +14,15 @@ tags.
 from __future__ import unicode_literals
 import json
 import requests
+import threading
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 
 from atomic_reactor.plugin import PostBuildPlugin, PluginFailedException
 from atomic_reactor.plugins.pre_reactor_config import (get_group_manifests,
                                                        get_platform_descriptors,
                                                        get_registries)
-from atomic_reactor.util import (RegistrySession, registry_hostname, ManifestDigest,
-                                 get_manifest_media_type)
+from atomic_reactor.util import (registry_hostname, ManifestDigest, get_manifest_media_type)
 from atomic_reactor.constants import (PLUGIN_GROUP_MANIFESTS_KEY, MEDIA_TYPE_DOCKER_V2_SCHEMA2,
                                       MEDIA_TYPE_DOCKER_V2_MANIFEST_LIST, MEDIA_TYPE_OCI_V1,
                                       MEDIA_TYPE_OCI_V1_INDEX)
@@ -33,6 +34,9 @@ from atomic_reactor.constants import (PLUGIN_GROUP_MANIFESTS_KEY, MEDIA_TYPE_DOC
 # code to copy registries is possible, but would be more involved because of the
 # size of layers and the complications of the protocol for copying them.
 
+# maximum number of requests sent to a registry concurrently
+REGISTRY_THREADS = 8
+
 
 class GroupManifestsPlugin(PostBuildPlugin):
     is_allowed_to_fail = False
@@ -44,7 +48,8 @@ class GroupManifestsPlugin(PostBuildPlugin):
         MEDIA_TYPE_OCI_V1_INDEX
     ]
 
-    def __init__(self, tasker, workflow, registries=None, group=True, goarch=None):
+    def __init__(self, tasker, workflow, registries=None, group=True, goarch=None,
+                 registry_threads=REGISTRY_THREADS):
         """
         constructor
 
@@ -58,6 +63,8 @@ class GroupManifestsPlugin(PostBuildPlugin):
         :param group: bool, if true, create a manifest list; otherwise only add tags to
                       amd64 image manifest
         :param goarch: dict, keys are platform, values are go language platform names
+        :param registry_threads: int, maximum number of requests (blob mounts, manifest
+                                 uploads) sent to a registry concurrently
         """
         # call parent constructor
         super(GroupManifestsPlugin, self).__init__(tasker, workflow)
@@ -78,6 +85,26 @@ class GroupManifestsPlugin(PostBuildPlugin):
 
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
         self.worker_registries = {}
+        self.registry_threads = registry_threads
+        # (registry, target repository, digest) of blobs linked by this build
+        self._linked_blobs = set()
+        self._linked_blobs_lock = threading.Lock()
+
+    def _map(self, func, args):
+        """
+        Calls func for each of args, concurrently using up to registry_threads threads.
+        Returns the results in the order of args.
+        """
+        args = list(args)
+        if self.registry_threads <= 1 or len(args) <= 1:
+            return [func(arg) for arg in args]
+
+        pool = ThreadPool(min(self.registry_threads, len(args)))
+        try:
+            return pool.map(func, args)
+        finally:
+            pool.close()
+            pool.join()
 
     def get_manifest(self, session, repository, ref):
         """
@@ -102,12 +129,31 @@ class GroupManifestsPlugin(PostBuildPlugin):
         Links ("mounts" in Docker Registry terminology) a blob from one repository in a
         registry into another repository in the same registry.
         """
+        key = (session.registry, target_repo, digest)
+        with self._linked_blobs_lock:
+            if key in self._linked_blobs:
+                return
+
         self.log.debug("%s: Linking blob %s from %s to %s",
                        session.registry, digest, source_repo, target_repo)
 
+        # Check whether it is already in the target repository, it may
+        # have been removed since a cached response was received
+        url = "/v2/{}/blobs/{}".format(target_repo, digest)
+        result = session.head(url, use_cache=False)
+        if result.status_code == requests.codes.OK:
+            self.log.debug("%s: blob %s already present in %s",
+                           session.registry, digest, target_repo)
+        else:
+            self._mount_blob(session, digest, source_repo, target_repo)
+
+        with self._linked_blobs_lock:
+            self._linked_blobs.add(key)
+
+    def _mount_blob(self, session, digest, source_repo, target_repo):
         # Check that it exists in the source repository
         url = "/v2/{}/blobs/{}".format(source_repo, digest)
-        result = session.head(url)
+        result = session.head(url, use_cache=False)
         if result.status_code == requests.codes.NOT_FOUND:
             self.log.debug("%s: blob %s, not present in %s, skipping",
                            session.registry, digest, source_repo)
@@ -124,29 +170,53 @@ class GroupManifestsPlugin(PostBuildPlugin):
             # we're starting an upload - but we've checked that above
             raise RuntimeError("Blob mount had unexpected status {}".format(result.status_code))
 
-    def link_manifest_references_into_repository(self, session, manifest, media_type,
-                                                 source_repo, target_repo):
+    def link_blobs_into_repositories(self, session, links):
         """
-        Links all the blobs referenced by the manifest from source_repo into target_repo.
+        Links blobs concurrently. links is an iterable of (digest, source_repo, target_repo)
+        tuples; each blob is linked into a repository only once.
         """
+        pending = []
+        with self._linked_blobs_lock:
+            for digest, source_repo, target_repo in links:
+                if source_repo == target_repo:
+                    continue
+                link = (digest, source_repo, target_repo)
+                if (session.registry, target_repo, digest) in self._linked_blobs or \
+                        link in pending:
+                    continue
+                pending.append(link)
 
-        if source_repo == target_repo:
-            return
+        self._map(lambda link: self.link_blob_into_repository(session, *link), pending)
 
+    def get_manifest_references(self, manifest, media_type):
+        """
+        Returns digests of the blobs (config and layers) referenced by the manifest.
+        """
         parsed = json.loads(manifest.decode('utf-8'))
 
         references = []
         if media_type in (MEDIA_TYPE_DOCKER_V2_SCHEMA2, MEDIA_TYPE_OCI_V1):
             references.append(parsed['config']['digest'])
-            for l in parsed['layers']:
-                references.append(l['digest'])
+            for layer in parsed['layers']:
+                references.append(layer['digest'])
         else:
             # manifest list support could be added here, but isn't needed currently, since
             # we never copy a manifest list as a whole between repositories
             raise RuntimeError("Unhandled media-type {}".format(media_type))
+        return references
 
-        for digest in references:
-            self.link_blob_into_repository(session, digest, source_repo, target_repo)
+    def link_manifest_references_into_repository(self, session, manifest, media_type,
+                                                 source_repo, target_repo):
+        """
+        Links all the blobs referenced by the manifest from source_repo into target_repo.
+        """
+
+        if source_repo == target_repo:
+            return
+
+        references = self.get_manifest_references(manifest, media_type)
+        self.link_blobs_into_repositories(session, [(digest, source_repo, target_repo)
+                                                    for digest in references])
 
     def store_manifest_in_repository(self, session, manifest, media_type,
                                      source_repo, target_repo, digest=None, tag=None):
@@ -243,19 +313,38 @@ class GroupManifestsPlugin(PostBuildPlugin):
         # Now push the manifest list to the registry once per each tag
         self.log.info("%s: Tagging manifest list", session.registry)
 
+        target_repos = []
         for image in self.workflow.tag_conf.images:
             target_repo = image.to_str(registry=False, tag=False)
-            # We have to call store_manifest_in_repository directly for each
-            # referenced manifest, since they potentially come from different repos
-            for manifest in manifests:
-                self.store_manifest_in_repository(session,
-                                                  manifest['content'],
-                                                  manifest['media_type'],
-                                                  manifest['repository'],
-                                                  target_repo,
-                                                  digest=manifest['digest'])
+            if target_repo not in target_repos:
+                target_repos.append(target_repo)
+
+        # Link the blobs of all the referenced manifests at once, they potentially
+        # come from different repos
+        self.link_blobs_into_repositories(session, [
+            (blob_digest, manifest['repository'], target_repo)
+            for target_repo in target_repos
+            for manifest in manifests
+            for blob_digest in self.get_manifest_references(manifest['content'],
+                                                            manifest['media_type'])
+        ])
+
+        def store_manifest(args):
+            target_repo, manifest = args
+            self.store_manifest_in_repository(session, manifest['content'],
+                                              manifest['media_type'], manifest['repository'],
+                                              target_repo, digest=manifest['digest'])
+
+        def store_list(image):
+            target_repo = image.to_str(registry=False, tag=False)
             self.store_manifest_in_repository(session, list_json, list_type,
                                               target_repo, target_repo, tag=image.tag)
+
+        # The referenced manifests have to be stored before the manifest list
+        self._map(store_manifest, [(target_repo, manifest)
+                                   for target_repo in target_repos for manifest in manifests])
+        self._map(store_list, self.workflow.tag_conf.images)
+
         # Get the digest of the manifest list using one of the tags
         registry_image = self.workflow.tag_conf.unique_images[0]
         _, digest_str, _, _ = self.get_manifest(session,
@@ -295,13 +384,23 @@ class GroupManifestsPlugin(PostBuildPlugin):
             raise RuntimeError("Unexpected media type found in worker repository: {}"
                                .format(media_type))
 
+        def store_tag(image):
+            self.store_manifest_in_repository(session, image_manifest, media_type, source_repo,
+                                              image.to_str(registry=False, tag=False),
+                                              tag=image.tag)
+
+        # Link the blobs into all target repos first, then tag in parallel
+        references = self.get_manifest_references(image_manifest, media_type)
+        self.link_blobs_into_repositories(session, [
+            (blob_digest, source_repo, image.to_str(registry=False, tag=False))
+            for image in self.workflow.tag_conf.images
+            for blob_digest in references
+        ])
+        self._map(store_tag, self.workflow.tag_conf.images)
+
         push_conf_registry = self.workflow.push_conf.add_docker_registry(session.registry,
                                                                          insecure=session.insecure)
         for image in self.workflow.tag_conf.images:
-            target_repo = image.to_str(registry=False, tag=False)
-            self.store_manifest_in_repository(session, image_manifest, media_type,
-                                              source_repo, target_repo, tag=image.tag)
-
             # add a tag for any plugins running later that expect it
             push_conf_registry.digests[image.tag] = digests
 
@@ -358,7 +457,8 @@ class GroupManifestsPlugin(PostBuildPlugin):
         insecure = registry_conf.get('insecure', False)
         secret_path = registry_conf.get('secret')
 
-        return RegistrySession(registry, insecure=insecure, dockercfg_path=secret_path)
+        return self.workflow.registry_sessions.get_session(registry, insecure=insecure,
+                                                           dockercfg_path=secret_path)
 
     def run(self):
         digests = dict()
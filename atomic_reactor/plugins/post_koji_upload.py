@@ -25,6 +25,7 @@ from atomic_reactor.util import (get_version_of_tools, get_checksums,
                                  get_build_json, get_docker_architecture,
                                  get_image_upload_filename,
                                  get_manifest_media_type)
+from atomic_reactor.koji_util import UPLOAD_THREADS, map_in_subsessions, upload_file
 from atomic_reactor.rpm_util import parse_rpm_output, rpm_qf_args
 from osbs.exceptions import OsbsException
 
@@ -83,7 +84,8 @@ class KojiUploadPlugin(PostBuildPlugin):
                  koji_ssl_certs_dir=None, koji_proxy_user=None,
                  koji_principal=None, koji_keytab=None,
                  blocksize=None, prefer_schema1_digest=True,
-                 platform='x86_64', report_multiple_digests=False):
+                 platform='x86_64', report_multiple_digests=False,
+                 upload_threads=UPLOAD_THREADS):
         """
         constructor
 
@@ -105,6 +107,7 @@ class KojiUploadPlugin(PostBuildPlugin):
         :param platform: str, platform name for this build
         :param report_multiple_digests: bool, whether to report both schema 1
             and schema 2 digests; if truthy, prefer_schema1_digest is ignored
+        :param upload_threads: int, number of files uploaded concurrently
         """
         super(KojiUploadPlugin, self).__init__(tasker, workflow)
 
@@ -126,6 +129,7 @@ class KojiUploadPlugin(PostBuildPlugin):
         }
 
         self.blocksize = blocksize
+        self.upload_threads = upload_threads
         self.koji_upload_dir = koji_upload_dir
         self.prefer_schema1_digest = get_prefer_schema1_digest(self.workflow, prefer_schema1_digest)
         self.report_multiple_digests = report_multiple_digests
@@ -302,11 +306,19 @@ class KojiUploadPlugin(PostBuildPlugin):
 
         """
 
-        saved_image = self.workflow.exported_image_sequence[-1].get('path')
-        image_name = get_image_upload_filename(self.workflow.exported_image_sequence[-1],
+        image_metadata = self.workflow.exported_image_sequence[-1]
+        saved_image = image_metadata.get('path')
+        image_name = get_image_upload_filename(image_metadata,
                                                self.workflow.builder.image_id,
                                                self.platform)
-        metadata = self.get_output_metadata(saved_image, image_name)
+        if 'md5sum' in image_metadata and 'size' in image_metadata:
+            # computed when the image was exported, don't read it again
+            metadata = {'filename': image_name,
+                        'filesize': image_metadata['size'],
+                        'checksum': image_metadata['md5sum'],
+                        'checksum_type': 'md5'}
+        else:
+            metadata = self.get_output_metadata(saved_image, image_name)
         output = Output(file=open(saved_image), metadata=metadata)
 
         return metadata, output
@@ -493,14 +505,14 @@ class KojiUploadPlugin(PostBuildPlugin):
         self.log.debug("uploading %r to %r as %r",
                        output.file.name, serverdir, name)
 
-        kwargs = {}
         if self.blocksize is not None:
-            kwargs['blocksize'] = self.blocksize
             self.log.debug("using blocksize %d", self.blocksize)
 
         upload_logger = KojiUploadLogger(self.log)
-        session.uploadWrapper(output.file.name, serverdir, name=name,
-                              callback=upload_logger.callback, **kwargs)
+        upload_file(session, output.file.name, serverdir, name,
+                    checksum=output.metadata.get('checksum'),
+                    checksum_type=output.metadata.get('checksum_type', 'md5'),
+                    blocksize=self.blocksize, callback=upload_logger.callback)
         path = os.path.join(serverdir, name)
         self.log.debug("uploaded %r", path)
         return path
@@ -518,9 +530,11 @@ class KojiUploadPlugin(PostBuildPlugin):
 
         try:
             session = get_koji_session(self.workflow, self.koji_fallback)
-            for output in output_files:
-                if output.file:
-                    self.upload_file(session, output, self.koji_upload_dir)
+            map_in_subsessions(session,
+                               lambda s, output: self.upload_file(s, output,
+                                                                  self.koji_upload_dir),
+                               [output for output in output_files if output.file],
+                               self.upload_threads)
         finally:
             for output in output_files:
                 if output.file:
@@ -24,12 +24,17 @@ from atomic_reactor.constants import (PLUGIN_PULP_PUSH_KEY, PLUGIN_PULP_SYNC_KEY
 
 from atomic_reactor.plugin import PostBuildPlugin, ExitPlugin
 from atomic_reactor.plugins.exit_remove_built_image import defer_removal
-from atomic_reactor.util import get_manifest_digests
+from atomic_reactor.pulp_util import get_crane_publish_time
+from atomic_reactor.util import get_manifest_digests, ManifestDigest
 from atomic_reactor.plugins.pre_reactor_config import (get_prefer_schema1_digest,
                                                        get_platform_to_goarch_mapping)
+import random
 import requests
 from time import time, sleep
 
+# seconds before the first retry, delays then grow with the time spent waiting
+INITIAL_RETRY_DELAY = 0.5
+
 
 class CraneTimeoutError(Exception):
     """The expected image did not appear in the required time"""
@@ -47,35 +52,75 @@ class PulpPullPlugin(ExitPlugin, PostBuildPlugin):
     def __init__(self, tasker, workflow,
                  timeout=1200, retry_delay=30,
                  insecure=False, secret=None,
-                 expect_v2schema2=False):
+                 expect_v2schema2=False, initial_retry_delay=INITIAL_RETRY_DELAY):
         """
         constructor
 
         :param tasker: DockerTasker instance
         :param workflow: DockerBuildWorkflow instance
         :param timeout: int, maximum number of seconds to wait
-        :param retry_delay: int, seconds between pull attempts
+        :param retry_delay: int, maximum seconds between pull attempts
         :param insecure: bool, allow non-https pull if true
         :param secret: str, path to secret
         :param expect_v2schema2: bool, require Pulp to return a schema 2 digest and
                                        retry until it does
+        :param initial_retry_delay: float, seconds before the first retry; later
+                                    delays grow with the time since the image was
+                                    published to crane, up to retry_delay
         """
         # call parent constructor
         super(PulpPullPlugin, self).__init__(tasker, workflow)
         self.timeout = timeout
         self.retry_delay = retry_delay
+        self.initial_retry_delay = initial_retry_delay
         self.insecure = insecure
         self.secret = secret
         self.expect_v2schema2 = not get_prefer_schema1_digest(workflow, not expect_v2schema2)
         self.expect_v2schema2list = False  # automatically set in run()
         self.expect_v2schema2list_only = False  # automatically set in run()
 
-    def retry_if_not_found(self, func, *args, **kwargs):
-        start = time()
+    def get_retry_delay(self, waiting_since):
+        """
+        Exponential backoff: the delay is the time spent waiting so far, so
+        it doubles with each attempt, with jitter added
+
+        :param waiting_since: float, time the image was published to crane
+                              or the wait started
+        """
+        delay = min(self.retry_delay, max(self.initial_retry_delay, time() - waiting_since))
+        return delay * random.uniform(1, 1.5)
 
+    def wait_for_digests(self, image, registry):
+        """
+        Probes crane until manifests of the image are available as expected;
+        media types already found are not probed again
+
+        :param image: ImageName, the image on crane
+        :param registry: PulpRegistry
+        :return: ManifestDigest
+        """
+        start = time()
+        published = get_crane_publish_time(self.workflow)
+        waiting_since = published if published and published <= start else start
+        session = self.workflow.registry_sessions.get_session(
+            registry.uri, insecure=self.insecure, dockercfg_path=self.secret)
+        context = '/'.join([x for x in [image.namespace, image.repo] if x])
+        manifest_url = '/v2/{}/manifests/{}'.format(context, image.tag or 'latest')
+
+        versions = ('v1', 'v2', 'v2_list', 'oci', 'oci_index')
+        found = ManifestDigest()
+        attempt = 0
         while True:
+            attempt += 1
+            if session.cache is not None:
+                # tags are cached for a while, crane is expected to change
+                session.cache.invalidate(session.registry, manifest_url)
+            probed = tuple(version for version in versions if version not in found)
             try:
-                digests = func(*args, **kwargs)
+                digests = get_manifest_digests(image, registry.uri,
+                                               self.insecure, self.secret,
+                                               versions=probed, require_digest=False,
+                                               registry_session=session)
             except requests.exceptions.HTTPError as ex:
                 # Retry for 404 not-found because we assume Crane has
                 # not spotted the new Pulp content yet. For all other
@@ -96,20 +141,25 @@ class PulpPullPlugin(ExitPlugin, PostBuildPlugin):
                         # OK, really give up now.
                         raise
             else:
-                if self.expect_v2schema2list and not digests.v2_list:
+                found.update(digests)
+                if self.expect_v2schema2list and not found.v2_list:
                     self.log.warn("Expected schema 2 manifest list")
                 elif (not self.expect_v2schema2list_only and self.expect_v2schema2 and
-                      not digests.v2):
+                      not found.v2):
                     self.log.warn("Expected schema 2 manifest")
                 else:
-                    return digests
+                    self.log.info("%s available after %d attempts, %.1fs after %s",
+                                  image, attempt, time() - waiting_since,
+                                  'publishing' if published else 'starting to wait')
+                    return found
 
             if time() - start > self.timeout:
                 raise CraneTimeoutError("{} seconds exceeded"
                                         .format(self.timeout))
 
-            self.log.info("not found; will try again in %ss", self.retry_delay)
-            sleep(self.retry_delay)
+            delay = self.get_retry_delay(waiting_since)
+            self.log.info("not found; will try again in %.1fs", delay)
+            sleep(delay)
 
     def run(self):
         # Only run if the build was successful
@@ -141,10 +191,7 @@ class PulpPullPlugin(ExitPlugin, PostBuildPlugin):
         # pulp_sync plugin was used. If we do find a v2 digest, there
         # is no need to pull the image.
         if registry.server_side_sync:
-            digests = self.retry_if_not_found(get_manifest_digests,
-                                              pullspec, registry.uri,
-                                              self.insecure, self.secret,
-                                              require_digest=False)
+            digests = self.wait_for_digests(pullspec, registry)
             if digests:
                 if digests.v2_list:
                     self.log.info("Manifest list found")
@@ -54,7 +54,7 @@ from atomic_reactor.constants import PLUGIN_PULP_SYNC_KEY, PLUGIN_PULP_PUSH_KEY
 from atomic_reactor.plugin import PostBuildPlugin
 from atomic_reactor.util import ImageName, Dockercfg, are_plugins_in_order
 # import pulp_util to get the dockpulp.log set up once
-from atomic_reactor.pulp_util import PulpLog
+from atomic_reactor.pulp_util import PulpLog, record_crane_publish
 from atomic_reactor.plugins.pre_reactor_config import get_pulp, get_docker_registry
 import dockpulp
 import os
@@ -263,6 +263,7 @@ class PulpSyncPlugin(PostBuildPlugin):
         if self.publish:
             self.log.info("publishing to crane")
             pulp.crane(list(repos.values()), wait=True)
+            record_crane_publish(self.workflow)
 
             for image_name in images:
                 self.log.info("image available at %s", image_name.to_str())
@@ -40,15 +40,23 @@ pulp_secret_path:
 
 from __future__ import print_function, unicode_literals
 
+import bz2
+import gzip
 import tempfile
 import os
-import subprocess
+import shutil
+import time
 
+from atomic_reactor.compression import lzma, open_compressor, zstandard
 from atomic_reactor.constants import PLUGIN_PULP_SYNC_KEY, PLUGIN_PULP_PUSH_KEY
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.util import ImageName, are_plugins_in_order
+from atomic_reactor.util import (ImageName, are_plugins_in_order, human_size,
+                                 strip_tar_members, EXPORT_CHUNK_SIZE)
 from atomic_reactor.plugins.pre_reactor_config import get_pulp_session
 
+# number of threads compressing the uploaded archive
+COMPRESS_THREADS = 4
+
 
 class PulpPushPlugin(PostBuildPlugin):
     key = PLUGIN_PULP_PUSH_KEY
@@ -56,7 +64,8 @@ class PulpPushPlugin(PostBuildPlugin):
 
     def __init__(self, tasker, workflow, pulp_registry_name=None, load_squashed_image=None,
                  load_exported_image=None, image_names=None, pulp_secret_path=None,
-                 username=None, password=None, dockpulp_loglevel=None, publish=True):
+                 username=None, password=None, dockpulp_loglevel=None, publish=True,
+                 compress_threads=COMPRESS_THREADS):
         """
         constructor
 
@@ -71,6 +80,7 @@ class PulpPushPlugin(PostBuildPlugin):
         :param username: pulp username, used in preference to certificate and key
         :param password: pulp password, used in preference to certificate and key
         :param publish: Bool, whether to publish to crane or not
+        :param compress_threads: int, number of threads compressing the uploaded archive
         """
         # call parent constructor
         super(PulpPushPlugin, self).__init__(tasker, workflow)
@@ -97,44 +107,95 @@ class PulpPushPlugin(PostBuildPlugin):
         self.publish = publish and not are_plugins_in_order(self.workflow.postbuild_plugins_conf,
                                                             self.key, PLUGIN_PULP_SYNC_KEY)
 
+        self.compress_threads = compress_threads
+
         self.pulp_handler = get_pulp_session(self.workflow, self.log, self.pulp_fallback)
 
-    def _deduplicate_layers(self, layers, filename, file_extension):
+    def _open_tar(self, filename, file_extension):
+        """
+        Opens (compressed) tar archive for reading uncompressed data
+        """
+        self.log.debug("opening %s for extension %s", filename, file_extension)
+        if file_extension == '.tar':
+            return open(filename, 'rb')
+        elif file_extension == '.gz':
+            return gzip.GzipFile(filename, 'rb')
+        elif file_extension == '.xz':
+            return lzma.LZMAFile(filename, 'rb')
+        elif file_extension == '.bz2':
+            return bz2.BZ2File(filename, 'rb')
+        elif file_extension == '.zst' and zstandard is not None:
+            return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+        raise Exception("Unknown tarball format: %s" % filename)
+
+    def _deduplicate_layers(self, layers, filename, file_extension, layers_index=None):
+        """
+        Write gzipped copy of the image archive without layers already in pulp
+
+        Only uncompressed archives are skipped through: data of removed
+        layers are not read. Compressed archives are decompressed as a
+        single stream and read whole, the offsets in layers_index are
+        only used to tell which layers the archive contains.
+
+        :param layers: list of str, layer IDs of the image
+        :param filename: str, path to the image archive
+        :param file_extension: str, extension of the image archive
+        :param layers_index: list of dict, layers found in the archive
+                             when it was exported
+        :return: str, path to the new archive, or None to upload the
+                 original one
+        """
         # getImageIdsExist was introduced in rh-dockpulp 0.6+
         existing_imageids = self.pulp_handler.get_image_ids_existing(layers)
         self.log.debug("existing layers: %s", existing_imageids)
 
+        if layers_index is not None:
+            # the index of exported image tells which layers are in the tar
+            indexed = set(layer['id'] for layer in layers_index)
+            existing_imageids = [x for x in existing_imageids if x in indexed]
+            if not existing_imageids:
+                self.log.info("no layers to deduplicate")
+                if file_extension != '.tar':
+                    return None
+                return self._gzip_file(filename)
+
         # Strip existing layers from the tar and repack it
         remove_layers = [str(os.path.join(x, 'layer.tar')) for x in existing_imageids]
+        return self._repack(filename, file_extension, 'strip_tar_', remove_layers)
 
-        commands = {'.xz': 'xzcat', '.gz': 'zcat', '.bz2': 'bzcat', '.tar': 'cat'}
-        unpacker = commands.get(file_extension, None)
-        self.log.debug("using unpacker %s for extension %s", unpacker, file_extension)
-        if unpacker is None:
-            raise Exception("Unknown tarball format: %s" % filename)
+    def _gzip_file(self, filename):
+        return self._repack(filename, '.tar', 'full_tar_')
 
-        fd, compressed_filename = tempfile.mkstemp(prefix='strip_tar_', suffix='.gz')
-        os.close(fd)
-        cmd = "set -o pipefail; {0} {1} | tar --delete {2} | gzip - > {3}".format(
-            unpacker, filename, ' '.join(remove_layers), compressed_filename)
-        return self._run_command(cmd, compressed_filename)
+    def _repack(self, filename, file_extension, prefix, remove_layers=None):
+        """
+        Writes gzipped copy of tar archive, without members remove_layers
 
-    def _gzip_file(self, filename):
-        fd, compressed_filename = tempfile.mkstemp(prefix='full_tar_', suffix='.gz')
-        os.close(fd)
-        cmd = "set -o pipefail; cat {0} | gzip - > {1}".format(
-            filename, compressed_filename)
-        return self._run_command(cmd, compressed_filename)
-
-    def _run_command(self, cmd, filename):
-        self.log.debug("running %s", cmd)
+        :return: str, path to the new archive
+        """
+        fd, compressed_filename = tempfile.mkstemp(prefix=prefix, suffix='.gz')
+        start = time.time()
         try:
-            subprocess.check_call(cmd, shell=True)
-            return filename
+            with os.fdopen(fd, 'wb') as f:
+                source = self._open_tar(filename, file_extension)
+                try:
+                    compressor = open_compressor(f, 'gzip', 6, self.compress_threads)
+                    if remove_layers:
+                        saved = strip_tar_members(source, compressor, remove_layers)
+                    else:
+                        shutil.copyfileobj(source, compressor, EXPORT_CHUNK_SIZE)
+                        saved = 0
+                    compressor.close()
+                finally:
+                    source.close()
         except Exception:
-            self._unlink_file(filename)
+            self._unlink_file(compressed_filename)
             raise
 
+        if remove_layers:
+            self.log.info("removing layers already in pulp from %s saved %s (%.1fs)",
+                          filename, human_size(saved), time.time() - start)
+        return compressed_filename
+
     def _unlink_file(self, filename):
         if filename:
             try:
@@ -142,7 +203,7 @@ class PulpPushPlugin(PostBuildPlugin):
             except (IOError, OSError):
                 pass
 
-    def push_tar(self, filename, image_names=None, repo_prefix="redhat-"):
+    def push_tar(self, filename, image_names=None, repo_prefix="redhat-", layers_index=None):
         # Find out how to tag this image.
         self.log.info("image names: %s", [str(image_name) for image_name in image_names])
 
@@ -152,10 +213,19 @@ class PulpPushPlugin(PostBuildPlugin):
         pulp_repos = self.pulp_handler.create_dockpulp_and_repos(image_names, repo_prefix)
         _, file_extension = os.path.splitext(filename)
         compressed_filename = None
+        repacked_filename = None
+
+        if file_extension not in ('.tar', '.gz'):
+            # dockpulp reads image metadata with tarfile, which doesn't
+            # know every format the image can be exported in
+            self.log.info("repacking %s to gzip", filename)
+            repacked_filename = self._repack(filename, file_extension, 'full_tar_')
+            filename, file_extension = repacked_filename, '.gz'
 
         try:
             top_layer, layers = self.pulp_handler.get_tar_metadata(filename)
-            compressed_filename = self._deduplicate_layers(layers, filename, file_extension)
+            compressed_filename = self._deduplicate_layers(layers, filename, file_extension,
+                                                           layers_index)
         except Exception:
             self.log.debug("Error on creating deduplicated layers tar", exc_info=True)
             try:
@@ -175,6 +245,7 @@ class PulpPushPlugin(PostBuildPlugin):
             if in_rh_everything:
                 break
         self._unlink_file(compressed_filename)
+        self._unlink_file(repacked_filename)
 
         for repo_id, pulp_repo in pulp_repos.items():
             if in_rh_everything:
@@ -210,14 +281,16 @@ class PulpPushPlugin(PostBuildPlugin):
             image_names += [ImageName.parse(x) for x in self.image_names]
 
         if self.load_exported_image and len(self.workflow.exported_image_sequence) > 0:
-            export_path = self.workflow.exported_image_sequence[-1].get("path")
-            top_layer, crane_repos = self.push_tar(export_path, image_names)
+            exported_image = self.workflow.exported_image_sequence[-1]
+            top_layer, crane_repos = self.push_tar(exported_image.get("path"), image_names,
+                                                   layers_index=exported_image.get("layers"))
         else:
             # Work out image ID
             image = self.workflow.image
             self.log.info("fetching image %s from docker", image)
             with tempfile.NamedTemporaryFile(prefix='docker-image-', suffix='.tar') as image_file:
-                image_file.write(self.tasker.d.get_image(image).data)
+                with self.tasker.d.get_image(image) as image_stream:
+                    shutil.copyfileobj(image_stream, image_file, EXPORT_CHUNK_SIZE)
                 # This file will be referenced by its filename, not file
                 # descriptor - must ensure contents are written to disk
                 image_file.flush()
@@ -6,19 +6,28 @@ This software may be modified and distributed under the terms
 of the BSD license. See the LICENSE file for details.
 """
 
+from collections import OrderedDict
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 import re
 import subprocess
 
+from six import string_types
+
 from atomic_reactor.constants import IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
 from atomic_reactor.plugin import PostBuildPlugin
 from atomic_reactor.plugins.exit_remove_built_image import defer_removal
 from atomic_reactor.plugins.pre_reactor_config import get_registries
-from atomic_reactor.util import (get_manifest_digests, get_config_from_registry, Dockercfg)
+from atomic_reactor.util import (get_manifest, get_manifest_digests, get_manifest_media_type,
+                                 get_config_from_registry, query_registry, Dockercfg,
+                                 ManifestDigest)
 
 
 __all__ = ('TagAndPushPlugin', )
 
+# number of registries pushed to concurrently
+PUSH_THREADS = 4
+
 
 class TagAndPushPlugin(PostBuildPlugin):
     """
@@ -28,7 +37,7 @@ class TagAndPushPlugin(PostBuildPlugin):
     key = "tag_and_push"
     is_allowed_to_fail = False
 
-    def __init__(self, tasker, workflow, registries=None):
+    def __init__(self, tasker, workflow, registries=None, push_threads=PUSH_THREADS):
         """
         constructor
 
@@ -41,11 +50,29 @@ class TagAndPushPlugin(PostBuildPlugin):
                               plain HTTP.
                             * "secret" optional string - path to the secret, which stores
                               email, login and password for remote registry
+        :param push_threads: int, number of registries pushed to concurrently
         """
         # call parent constructor
         super(TagAndPushPlugin, self).__init__(tasker, workflow)
 
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
+        self.push_threads = push_threads
+
+    def _map(self, func, args):
+        """
+        Calls func for each of args, concurrently using up to push_threads threads.
+        Returns the results in the order of args.
+        """
+        args = list(args)
+        if self.push_threads <= 1 or len(args) <= 1:
+            return [func(arg) for arg in args]
+
+        pool = ThreadPool(min(self.push_threads, len(args)))
+        try:
+            return pool.map(func, args)
+        finally:
+            pool.close()
+            pool.join()
 
     def need_skopeo_push(self):
         if len(self.workflow.exported_image_sequence) > 0:
@@ -97,59 +124,155 @@ class TagAndPushPlugin(PostBuildPlugin):
             e.cmd = log_cmd  # hide credentials
             raise
 
-    def run(self):
-        pushed_images = []
+    def push_image(self, registry_image, insecure, docker_push_secret):
+        """
+        Uploads the built image to registry under the name of registry_image
+        """
+        if self.need_skopeo_push():
+            self.push_with_skopeo(registry_image, insecure, docker_push_secret)
+        else:
+            self.tasker.tag_and_push_image(self.workflow.builder.image_id,
+                                           registry_image, insecure=insecure,
+                                           force=True, dockercfg=docker_push_secret)
+
+    def retag_manifest(self, session, registry_image, digest, version):
+        """
+        Stores the manifest already uploaded to the repository of registry_image
+        under its tag, without pushing the image again
+        """
+        self.log.info("%s: Tagging manifest %s as %s", session.registry, digest,
+                      registry_image.to_str(registry=False))
+        response = query_registry(session, registry_image, digest=digest, version=version)
 
+        context = '/'.join([x for x in [registry_image.namespace, registry_image.repo] if x])
+        url = '/v2/{}/manifests/{}'.format(context, registry_image.tag or 'latest')
+        headers = {'Content-Type': get_manifest_media_type(version)}
+        response = session.put(url, data=response.content, headers=headers)
+        response.raise_for_status()
+
+    def get_retagged_digests(self, session, registry_image, digests):
+        """
+        Returns digests of the manifest stored by retag_manifest; v1 manifest is
+        created by the registry for each tag, so its digest has to be looked up
+        """
+        retagged = ManifestDigest(digests)
+        retagged.pop('v1', None)
+        if digests.v1:
+            response, _ = get_manifest(registry_image, session, 'v1', head=True)
+            if response is not None:
+                retagged['v1'] = response.headers.get('Docker-Content-Digest', True)
+        return retagged
+
+    def push_to_registry(self, registry, registry_conf, images):
+        """
+        Pushes the image once for each repository in registry, the other tags
+        in the repository are set to the uploaded manifest
+
+        :return: tuple, list of images pushed by docker, dict mapping image
+                 names to their digests, and the image config
+        """
+        insecure = registry_conf.get('insecure', False)
+        docker_push_secret = registry_conf.get('secret', None)
+        registry_session = self.workflow.registry_sessions.get_session(
+            registry, insecure=insecure, dockercfg_path=docker_push_secret)
+
+        repositories = OrderedDict()
+        for image in images:
+            registry_image = image.copy()
+            registry_image.registry = registry
+            repository = registry_image.to_str(registry=False, tag=False)
+            tags = repositories.setdefault(repository, OrderedDict())
+            tags.setdefault(registry_image.to_str(registry=False), registry_image)
+
+        docker_pushed = []
+        image_digests = {}
+        config_image = None
+        config_digest = None
+        config_type = None
+        for repository, tags in repositories.items():
+            # all tags usually refer to the same manifest
+            digests_cache = {}
+            pushed_digests = None
+            for tag, registry_image in tags.items():
+                retag_version = None
+                if pushed_digests:
+                    # v1 manifest is specific to its tag and can't be copied
+                    for version in ('v2', 'oci'):
+                        if isinstance(getattr(pushed_digests, version), string_types):
+                            retag_version = version
+                            break
+
+                if retag_version:
+                    self.retag_manifest(registry_session, registry_image,
+                                        getattr(pushed_digests, retag_version), retag_version)
+                    image_digests[tag] = self.get_retagged_digests(registry_session,
+                                                                   registry_image, pushed_digests)
+                    continue
+
+                self.push_image(registry_image, insecure, docker_push_secret)
+                if not self.need_skopeo_push():
+                    docker_pushed.append(registry_image)
+
+                digests = get_manifest_digests(registry_image, registry,
+                                               insecure, docker_push_secret,
+                                               registry_session=registry_session,
+                                               concurrent=True, head=True,
+                                               digests_cache=digests_cache)
+                image_digests[tag] = digests
+                pushed_digests = pushed_digests or digests
+
+                if not config_digest and (digests.v2 or digests.oci):
+                    if digests.v2:
+                        config_digest = digests.v2
+                        config_type = 'v2'
+                    else:
+                        config_digest = digests.oci
+                        config_type = 'oci'
+                    config_image = registry_image
+
+        config = None
+        if config_digest:
+            config = get_config_from_registry(
+                config_image, registry, config_digest, insecure,
+                docker_push_secret, config_type,
+                registry_session=registry_session)
+        else:
+            self.log.info("%s: V2 schema 2 or OCI manifest is not available to get config from",
+                          registry)
+        return docker_pushed, image_digests, config
+
+    def run(self):
         if not self.workflow.tag_conf.unique_images:
             self.workflow.tag_conf.add_unique_image(self.workflow.image)
 
-        config_manifest_digest = None
-        config_manifest_type = None
-        config_registry_image = None
+        images = self.workflow.tag_conf.images
+        for image in images:
+            if image.registry:
+                raise RuntimeError("Image name must not contain registry: %r" % image.registry)
+
+        push_conf_registries = []
         for registry, registry_conf in self.registries.items():
             insecure = registry_conf.get('insecure', False)
-            push_conf_registry = \
-                self.workflow.push_conf.add_docker_registry(registry, insecure=insecure)
-
-            docker_push_secret = registry_conf.get('secret', None)
-            self.log.info("Registry %s secret %s", registry, docker_push_secret)
+            push_conf_registries.append(
+                self.workflow.push_conf.add_docker_registry(registry, insecure=insecure))
+            self.log.info("Registry %s secret %s", registry, registry_conf.get('secret', None))
 
-            for image in self.workflow.tag_conf.images:
-                if image.registry:
-                    raise RuntimeError("Image name must not contain registry: %r" % image.registry)
+        results = self._map(lambda args: self.push_to_registry(*args),
+                            [(registry, registry_conf, images)
+                             for registry, registry_conf in self.registries.items()])
 
+        pushed_images = []
+        for registry, push_conf_registry, (docker_pushed, image_digests, config) in \
+                zip(self.registries, push_conf_registries, results):
+            for image in docker_pushed:
+                defer_removal(self.workflow, image)
+            push_conf_registry.digests.update(image_digests)
+            push_conf_registry.config = config
+
+            for image in images:
                 registry_image = image.copy()
                 registry_image.registry = registry
-                if self.need_skopeo_push():
-                    self.push_with_skopeo(registry_image, insecure, docker_push_secret)
-                else:
-                    self.tasker.tag_and_push_image(self.workflow.builder.image_id,
-                                                   registry_image, insecure=insecure,
-                                                   force=True, dockercfg=docker_push_secret)
-                    defer_removal(self.workflow, registry_image)
-
                 pushed_images.append(registry_image)
 
-                digests = get_manifest_digests(registry_image, registry,
-                                               insecure, docker_push_secret)
-                tag = registry_image.to_str(registry=False)
-                push_conf_registry.digests[tag] = digests
-
-                if not config_manifest_digest and (digests.v2 or digests.oci):
-                    if digests.v2:
-                        config_manifest_digest = digests.v2
-                        config_manifest_type = 'v2'
-                    else:
-                        config_manifest_digest = digests.oci
-                        config_manifest_type = 'oci'
-                    config_registry_image = registry_image
-
-            if config_manifest_digest:
-                push_conf_registry.config = get_config_from_registry(
-                    config_registry_image, registry, config_manifest_digest, insecure,
-                    docker_push_secret, config_manifest_type)
-            else:
-                self.log.info("V2 schema 2 or OCI manifest is not available to get config from")
-
         self.log.info("All images were tagged and pushed")
         return pushed_images
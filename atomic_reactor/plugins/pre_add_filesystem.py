@@ -29,7 +29,8 @@ import os
 from atomic_reactor.constants import (DEFAULT_DOWNLOAD_BLOCK_SIZE, PLUGIN_ADD_FILESYSTEM_KEY,
                                       PLUGIN_CHECK_AND_SET_PLATFORMS_KEY)
 from atomic_reactor.plugin import PreBuildPlugin, BuildCanceledException
-from atomic_reactor.plugins.exit_remove_built_image import defer_removal
+from atomic_reactor.plugins.exit_remove_built_image import (defer_removal,
+                                                            GarbageCollectionPlugin)
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session
 from atomic_reactor.koji_util import TaskWatcher, stream_task_output
 from atomic_reactor.util import get_retrying_requests_session
@@ -60,6 +61,10 @@ class AddFilesystemPlugin(PreBuildPlugin):
 
     key = PLUGIN_ADD_FILESYSTEM_KEY
     is_allowed_to_fail = False
+    requires = ('reactor_config', 'source', PLUGIN_CHECK_AND_SET_PLATFORMS_KEY,
+                'builder.base_image')
+    provides = ('builder.base_image', 'builder.parent_images',
+                'plugin_workspace.' + GarbageCollectionPlugin.key)
 
     DEFAULT_IMAGE_BUILD_CONF = dedent('''\
         [image-build]
@@ -262,17 +267,22 @@ class AddFilesystemPlugin(PreBuildPlugin):
         return task_id, filesystem_regex
 
     def find_filesystem(self, task_id, filesystem_regex):
-        for f in self.session.listTaskOutput(task_id):
-            f = f.strip()
-            match = filesystem_regex.match(f)
-            if match:
-                return task_id, match.group(0)
-
-        # Not found in this task, search sub tasks
-        for sub_task in self.session.getTaskChildren(task_id):
-            found = self.find_filesystem(sub_task['id'], filesystem_regex)
-            if found:
-                return found
+        # search level by level, listing sibling tasks in one multicall
+        task_ids = [task_id]
+        while task_ids:
+            outputs = self.session.batch_calls([('listTaskOutput', (sub_task_id,))
+                                                for sub_task_id in task_ids])
+            for sub_task_id, output in zip(task_ids, outputs):
+                for f in output:
+                    f = f.strip()
+                    match = filesystem_regex.match(f)
+                    if match:
+                        return sub_task_id, match.group(0)
+
+            # Not found in these tasks, search sub tasks
+            children = self.session.batch_calls([('getTaskChildren', (sub_task_id,))
+                                                 for sub_task_id in task_ids])
+            task_ids = [sub_task['id'] for sub_tasks in children for sub_task in sub_tasks]
 
         return None
 
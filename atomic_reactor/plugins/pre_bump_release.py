@@ -13,6 +13,9 @@ from atomic_reactor.util import df_parser
 from osbs.utils import Labels
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session
 
+# number of candidate releases checked in one koji multicall
+RELEASE_CANDIDATES = 20
+
 
 class BumpReleasePlugin(PreBuildPlugin):
     """
@@ -22,6 +25,9 @@ class BumpReleasePlugin(PreBuildPlugin):
 
     key = "bump_release"
     is_allowed_to_fail = False  # We really want to stop the process
+    # base image is inspected to resolve ENV in labels
+    requires = ('reactor_config', 'dockerfile', 'builder.base_image')
+    provides = ('dockerfile',)
 
     # The target parameter is no longer used by this plugin. It's
     # left as an optional parameter to allow a graceful transition
@@ -70,6 +76,23 @@ class BumpReleasePlugin(PreBuildPlugin):
         return '.'.join([part for part in [release, suffix, rest]
                          if part is not None])
 
+    def get_first_free_release(self, component, version, candidates):
+        """
+        Check candidate releases in one koji multicall
+
+        :param candidates: list of str, releases to check, in order
+        :return: str, first release without a build, or None
+        """
+        build_infos = [{'name': component, 'version': version, 'release': release}
+                       for release in candidates]
+        self.log.debug('checking that the builds do not exist: %s', build_infos)
+        builds = self.xmlrpc.batch_calls([('getBuild', (build_info,))
+                                          for build_info in build_infos])
+        for release, build in zip(candidates, builds):
+            if not build:
+                return release
+        return None
+
     def get_next_release_standard(self, component, version):
         build_info = {'name': component, 'version': version}
         self.log.debug('getting next release from build info: %s', build_info)
@@ -80,13 +103,15 @@ class BumpReleasePlugin(PreBuildPlugin):
         # allow reuploading builds, so instead we should increment next_release
         # and make sure the build doesn't exist
         while True:
-            build_info = {'name': component, 'version': version, 'release': next_release}
-            self.log.debug('checking that the build does not exist: %s', build_info)
-            build = self.xmlrpc.getBuild(build_info)
-            if not build:
-                return next_release
+            candidates = [next_release]
+            for _ in range(RELEASE_CANDIDATES - 1):
+                candidates.append(self.get_patched_release(candidates[-1], increment=True))
 
-            next_release = self.get_patched_release(next_release, increment=True)
+            release = self.get_first_free_release(component, version, candidates)
+            if release:
+                return release
+
+            next_release = self.get_patched_release(candidates[-1], increment=True)
 
     def get_next_release_append(self, component, version, base_release):
         # This is brute force, but trying to use getNextRelease() would be fragile
@@ -95,14 +120,13 @@ class BumpReleasePlugin(PreBuildPlugin):
         release = base_release or '1'
         suffix = 1
         while True:
-            next_release = '%s.%s' % (release, suffix)
-            build_info = {'name': component, 'version': version, 'release': next_release}
-            self.log.debug('checking that the build does not exist: %s', build_info)
-            build = self.xmlrpc.getBuild(build_info)
-            if not build:
+            candidates = ['%s.%s' % (release, suffix + offset)
+                          for offset in range(RELEASE_CANDIDATES)]
+            next_release = self.get_first_free_release(component, version, candidates)
+            if next_release:
                 return next_release
 
-            suffix += 1
+            suffix += RELEASE_CANDIDATES
 
     def run(self):
         """
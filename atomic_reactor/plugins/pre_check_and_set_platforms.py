@@ -24,6 +24,9 @@ from atomic_reactor.constants import PLUGIN_CHECK_AND_SET_PLATFORMS_KEY
 class CheckAndSetPlatformsPlugin(PreBuildPlugin):
     key = PLUGIN_CHECK_AND_SET_PLATFORMS_KEY
     is_allowed_to_fail = False
+    # container.yaml in source limits the platforms
+    requires = ('reactor_config', 'source', 'buildstep_plugins_conf')
+    provides = ()
 
     def __init__(self, tasker, workflow, koji_target):
 
@@ -8,6 +8,7 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals
 
+from atomic_reactor.constants import PLUGIN_BUILD_ORCHESTRATE_KEY
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.plugins.pre_reactor_config import get_openshift_session
 from atomic_reactor.util import get_build_json
@@ -48,6 +49,9 @@ class CheckAndSetRebuildPlugin(PreBuildPlugin):
     """
 
     key = "check_and_set_rebuild"
+    requires = ('reactor_config', 'source')
+    # source is reset to the latest commit for rebuilds from_latest
+    provides = ('source', 'plugin_workspace.' + PLUGIN_BUILD_ORCHESTRATE_KEY)
     is_allowed_to_fail = False  # We really want to stop the process
 
     def __init__(self, tasker, workflow, label_key, label_value,
@@ -69,6 +69,8 @@ class FetchMavenArtifactsPlugin(PreBuildPlugin):
 
     key = 'fetch_maven_artifacts'
     is_allowed_to_fail = False
+    requires = ('reactor_config', 'source')
+    provides = ('source.artifacts',)
 
     NVR_REQUESTS_FILENAME = 'fetch-artifacts-koji.yaml'
     URL_REQUESTS_FILENAME = 'fetch-artifacts-url.yaml'
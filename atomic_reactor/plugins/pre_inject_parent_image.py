@@ -9,7 +9,8 @@ from __future__ import print_function, unicode_literals
 
 from atomic_reactor.build import ImageName
 from atomic_reactor.plugin import PreBuildPlugin
-from atomic_reactor.plugins.exit_remove_built_image import defer_removal
+from atomic_reactor.plugins.exit_remove_built_image import (defer_removal,
+                                                            GarbageCollectionPlugin)
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session
 from osbs.utils import graceful_chain_get
 
@@ -37,6 +38,9 @@ class InjectParentImage(PreBuildPlugin):
 
     key = 'inject_parent_image'
     is_allowed_to_fail = False
+    requires = ('reactor_config', 'builder.base_image')
+    provides = ('builder.base_image', 'builder.parent_images',
+                'plugin_workspace.' + GarbageCollectionPlugin.key)
 
     def __init__(self, tasker, workflow, koji_parent_build, koji_hub=None, koji_ssl_certs_dir=None):
         """
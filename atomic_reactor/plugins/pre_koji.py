@@ -19,6 +19,8 @@ from atomic_reactor.plugins.pre_reactor_config import (get_koji_session, get_yum
 class KojiPlugin(PreBuildPlugin):
     key = "koji"
     is_allowed_to_fail = False
+    requires = ('reactor_config',)
+    provides = ('files',)
 
     def __init__(self, tasker, workflow, target, hub=None, root=None, proxy=None,
                  koji_ssl_certs_dir=None):
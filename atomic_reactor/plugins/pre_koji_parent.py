@@ -44,6 +44,8 @@ class KojiParentPlugin(PreBuildPlugin):
 
     key = PLUGIN_KOJI_PARENT_KEY
     is_allowed_to_fail = False
+    requires = ('reactor_config', 'builder.base_image', 'builder.parent_images')
+    provides = ()
 
     def __init__(self, tasker, workflow, koji_hub=None, koji_ssl_certs_dir=None,
                  poll_interval=DEFAULT_POLL_INTERVAL, poll_timeout=DEFAULT_POLL_TIMEOUT):
@@ -12,32 +12,46 @@ If this build is an auto-rebuild, use the base image from the image change
 trigger instead of what is in the Dockerfile.
 Tag each image to a unique name (the build name plus a nonce) to be used during
 this build so that it isn't removed by other builds doing clean-up.
+Optionally, images already present on the node with the digest the parent image
+refers to in the registry are used without pulling them again.
 """
 
 from __future__ import unicode_literals
 
 import docker
 import platform
+import six
+from multiprocessing.pool import ThreadPool
 
 from atomic_reactor.plugin import PreBuildPlugin
-from atomic_reactor.util import (get_build_json, get_manifest_list,
+from atomic_reactor.util import (get_build_json, get_manifest_list, get_manifest_digests,
                                  get_config_from_registry, ImageName,
                                  get_orchestrator_platforms)
-from atomic_reactor.constants import PLUGIN_CHECK_AND_SET_PLATFORMS_KEY
+from atomic_reactor.constants import (PLUGIN_CHECK_AND_SET_PLATFORMS_KEY,
+                                      PLUGIN_PULL_BASE_IMAGE_KEY)
 from atomic_reactor.core import RetryGeneratorException
 from atomic_reactor.plugins.pre_reactor_config import (get_source_registry,
                                                        get_platform_to_goarch_mapping,
                                                        get_goarch_to_platform_mapping)
-from requests.exceptions import HTTPError, RetryError, Timeout
+from requests.exceptions import HTTPError, RequestException, RetryError, Timeout
 from osbs.utils import RegistryURI
 
+# maximum number of parent images pulled concurrently
+PULL_THREADS = 4
+# manifest versions local images are looked up by, docker records the digest
+# of the manifest list when pulling through it
+LOCAL_CACHE_DIGEST_VERSIONS = ('v2_list', 'oci_index', 'v2', 'oci')
+
 
 class PullBaseImagePlugin(PreBuildPlugin):
-    key = "pull_base_image"
+    key = PLUGIN_PULL_BASE_IMAGE_KEY
     is_allowed_to_fail = False
+    requires = ('reactor_config', PLUGIN_CHECK_AND_SET_PLATFORMS_KEY, 'buildstep_plugins_conf',
+                'builder.base_image', 'builder.parent_images')
+    provides = ('builder.base_image', 'builder.parent_images', 'pulled_base_images')
 
     def __init__(self, tasker, workflow, parent_registry=None, parent_registry_insecure=False,
-                 check_platforms=False):
+                 check_platforms=False, pull_threads=PULL_THREADS, local_cache=False):
         """
         constructor
 
@@ -46,11 +60,21 @@ class PullBaseImagePlugin(PreBuildPlugin):
         :param parent_registry: registry to enforce pulling from
         :param parent_registry_insecure: allow connecting to the registry over plain http
         :param check_platforms: validate parent images provide all platforms expected for the build
+        :param pull_threads: int, maximum number of parent images pulled concurrently
+        :param local_cache: bool, resolve parent images to digests and use images with
+                            those digests present on the node instead of pulling them;
+                            pulled images are pinned by digest and left on the node for
+                            later builds (only their unique tags are removed)
         """
         # call parent constructor
         super(PullBaseImagePlugin, self).__init__(tasker, workflow)
 
         self.check_platforms = check_platforms
+        self.pull_threads = pull_threads
+        self.local_cache = local_cache
+        self.local_images = {}
+        self.cache_hits = []
+        self.cache_misses = []
         source_registry = get_source_registry(self.workflow, {
             'uri': RegistryURI(parent_registry) if parent_registry else None,
             'insecure': parent_registry_insecure})
@@ -65,30 +89,126 @@ class PullBaseImagePlugin(PreBuildPlugin):
     def run(self):
         """
         Pull parent images and retag them uniquely for this build.
+
+        :return: dict, parent images found on the node ('hits') and pulled
+                 ('misses') when local_cache is enabled, otherwise None
         """
         build_json = get_build_json()
         base_image_str = str(self.workflow.builder.original_base_image)
         current_platform = platform.processor() or 'x86_64'
         self.manifest_list_cache = {}
-        for nonce, parent in enumerate(sorted(self.workflow.builder.parent_images.keys())):
+        self.manifest_list_errors = {}
+
+        parents = sorted(self.workflow.builder.parent_images.keys())
+        images = []
+        for parent in parents:
             image = ImageName.parse(parent)
             if parent == base_image_str:
                 image = self._resolve_base_image(build_json)
-            image = self._ensure_image_registry(image)
+            images.append(self._ensure_image_registry(image))
 
-            if self.check_platforms:
+        if self.check_platforms:
+            self._prefetch_manifest_lists(images)
+            for index, image in enumerate(images):
                 self._validate_platforms_in_image(image)
 
                 new_arch_image = self._get_image_for_different_arch(image, current_platform)
                 if new_arch_image:
-                    image = new_arch_image
+                    images[index] = new_arch_image
+
+        if self.local_cache:
+            self.local_images = self.tasker.get_image_ids_by_repo_digest()
+
+        new_images = self._map(lambda args: self._pull_and_tag_image(args[1], build_json,
+                                                                     str(args[0])),
+                               list(enumerate(images)))
 
-            new_image = self._pull_and_tag_image(image, build_json, str(nonce))
+        for parent, new_image in zip(parents, new_images):
             self.workflow.builder.parent_images[parent] = str(new_image)
 
             if parent == base_image_str:
                 self.workflow.builder.set_base_image(str(new_image))
 
+        if not self.local_cache:
+            return None
+        self.log.info("parent images found on the node: %d, pulled: %d",
+                      len(self.cache_hits), len(self.cache_misses))
+        return {'hits': sorted(self.cache_hits), 'misses': sorted(self.cache_misses)}
+
+    def _resolve_digests(self, image):
+        """Return digests of manifests the image refers to in the registry"""
+        if image.tag and ':' in image.tag:
+            # already referenced by digest
+            return [image.tag]
+        if not image.registry:
+            return []
+
+        registry_session = self.workflow.registry_sessions.get_session(
+            image.registry, insecure=self.parent_registry_insecure)
+        try:
+            digests = get_manifest_digests(image, image.registry,
+                                           insecure=self.parent_registry_insecure,
+                                           versions=LOCAL_CACHE_DIGEST_VERSIONS,
+                                           require_digest=False,
+                                           registry_session=registry_session,
+                                           concurrent=True, head=True)
+        except (RequestException, RuntimeError) as ex:
+            self.log.info("unable to resolve digest of %s: %r", image, ex)
+            return []
+
+        return [digests[version] for version in LOCAL_CACHE_DIGEST_VERSIONS
+                if isinstance(digests.get(version), six.string_types)]
+
+    def _find_local_image(self, image):
+        """
+        Pin image by the digest it refers to and look for it on the node
+
+        :return: tuple, ImageName pinned by digest (None if the digest cannot be
+                 resolved) and bool, whether it is present on the node
+        """
+        digests = self._resolve_digests(image)
+        if not digests:
+            return None, False
+
+        for digest in digests:
+            pinned = image.copy()
+            pinned.tag = digest
+            if pinned.to_str() in self.local_images:
+                self.log.info("using %s present on the node as %s", pinned,
+                              self.local_images[pinned.to_str()])
+                return pinned, True
+
+        pinned = image.copy()
+        pinned.tag = digests[0]
+        return pinned, False
+
+    def _map(self, func, args):
+        """Call func for each of args using up to pull_threads threads, return results in order"""
+        if self.pull_threads <= 1 or len(args) <= 1:
+            return [func(arg) for arg in args]
+
+        pool = ThreadPool(min(self.pull_threads, len(args)))
+        try:
+            return pool.map(func, args)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _prefetch_manifest_lists(self, images):
+        """Fetch manifest lists of all images concurrently, errors are raised when used"""
+        def prefetch(image):
+            try:
+                self._get_manifest_list(image)
+            except Exception as ex:
+                self.log.debug('unable to prefetch manifest list for %s: %r', image, ex)
+                self.manifest_list_errors[image] = ex
+
+        unique_images = []
+        for image in images:
+            if image.registry and image not in unique_images:
+                unique_images.append(image)
+        self._map(prefetch, unique_images)
+
     def _get_image_for_different_arch(self, image, platform):
         manifest_list = self._get_manifest_list(image)
         new_image = None
@@ -153,31 +273,39 @@ class PullBaseImagePlugin(PreBuildPlugin):
     def _pull_and_tag_image(self, image, build_json, nonce):
         """Docker pull the image and tag it uniquely for use by this build"""
         image = image.copy()
+        present = False
+        if self.local_cache:
+            pinned_image, present = self._find_local_image(image)
+            if pinned_image:
+                image = pinned_image
         first_library_exc = None
         for _ in range(20):
             # retry until pull and tag is successful or definitively fails.
             # should never require 20 retries but there's a race condition at work.
             # just in case something goes wildly wrong, limit to 20 so it terminates.
-            try:
-                self.tasker.pull_image(image, insecure=self.parent_registry_insecure)
-                self.workflow.pulled_base_images.add(image.to_str())
-            except RetryGeneratorException as exc:
-                # getting here means the pull itself failed. we may want to retry if the
-                # image being pulled lacks a namespace, like e.g. "rhel7". we cannot count
-                # on the registry mapping this into the docker standard "library/rhel7" so
-                # need to retry with that.
-                if first_library_exc:
-                    # we already tried and failed; report the first failure.
-                    raise first_library_exc
-                if image.namespace:
-                    # already namespaced, do not retry with "library/", just fail.
-                    raise
-
-                self.log.info("'%s' not found", image.to_str())
-                image.namespace = 'library'
-                self.log.info("trying '%s'", image.to_str())
-                first_library_exc = exc  # report first failure if retry also fails
-                continue
+            if not present:
+                # when the image is present on the node, just tag it
+                try:
+                    self.tasker.pull_image(image, insecure=self.parent_registry_insecure)
+                    if not self.local_cache:
+                        self.workflow.pulled_base_images.add(image.to_str())
+                except RetryGeneratorException as exc:
+                    # getting here means the pull itself failed. we may want to retry if the
+                    # image being pulled lacks a namespace, like e.g. "rhel7". we cannot count
+                    # on the registry mapping this into the docker standard "library/rhel7" so
+                    # need to retry with that.
+                    if first_library_exc:
+                        # we already tried and failed; report the first failure.
+                        raise first_library_exc
+                    if image.namespace:
+                        # already namespaced, do not retry with "library/", just fail.
+                        raise
+
+                    self.log.info("'%s' not found", image.to_str())
+                    image.namespace = 'library'
+                    self.log.info("trying '%s'", image.to_str())
+                    first_library_exc = exc  # report first failure if retry also fails
+                    continue
 
             # Attempt to tag it using a unique ID. We might have to retry
             # if another build with the same parent image is finishing up
@@ -192,12 +320,17 @@ class PullBaseImagePlugin(PreBuildPlugin):
                 response = self.tasker.tag_image(image, new_image)
                 self.workflow.pulled_base_images.add(response)
                 self.log.debug("image '%s' is available as '%s'", image, new_image)
+                if present:
+                    self.cache_hits.append(image.to_str())
+                elif self.local_cache:
+                    self.cache_misses.append(image.to_str())
                 return new_image
             except docker.errors.NotFound:
                 # If we get here, some other build raced us to remove
                 # the parent image, and that build won.
                 # Retry the pull immediately.
                 self.log.info("re-pulling removed image")
+                present = False
                 continue
 
         # Failed to tag it after 20 tries
@@ -208,16 +341,26 @@ class PullBaseImagePlugin(PreBuildPlugin):
         """try to figure out manifest list"""
         if image in self.manifest_list_cache:
             return self.manifest_list_cache[image]
-
+        if image in self.manifest_list_errors:
+            # prefetching failed
+            raise self.manifest_list_errors[image]
+        requested_image = image
+
+        registry_session = None
+        if image.registry:
+            registry_session = self.workflow.registry_sessions.get_session(
+                image.registry, insecure=self.parent_registry_insecure)
         manifest_list = get_manifest_list(image, image.registry,
-                                          insecure=self.parent_registry_insecure)
+                                          insecure=self.parent_registry_insecure,
+                                          registry_session=registry_session)
         if '@sha256:' in str(image) and not manifest_list:
             # we want to adjust the tag only for manifest list fetching
             image = image.copy()
 
             try:
                 config_blob = get_config_from_registry(image, image.registry, image.tag,
-                                                       insecure=self.parent_registry_insecure)
+                                                       insecure=self.parent_registry_insecure,
+                                                       registry_session=registry_session)
             except (HTTPError, RetryError, Timeout) as ex:
                 self.log.warning('Unable to fetch config for %s, got error %s',
                                  image, ex.response.status_code)
@@ -229,9 +372,10 @@ class PullBaseImagePlugin(PreBuildPlugin):
             image.tag = docker_tag
 
             manifest_list = get_manifest_list(image, image.registry,
-                                              insecure=self.parent_registry_insecure)
-        self.manifest_list_cache[image] = manifest_list
-        return self.manifest_list_cache[image]
+                                              insecure=self.parent_registry_insecure,
+                                              registry_session=registry_session)
+        self.manifest_list_cache[requested_image] = manifest_list
+        return manifest_list
 
     def _validate_platforms_in_image(self, image):
         """Ensure that the image provides all platforms expected for the build."""
@@ -468,6 +468,8 @@ class ReactorConfigPlugin(PreBuildPlugin):
 
     # Name of this plugin
     key = 'reactor_config'
+    requires = ()
+    provides = ('default_image_build_method',)
 
     # Exceptions from this plugin should fail the build
     is_allowed_to_fail = False
@@ -8,7 +8,10 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals
 
 from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 import os
+import threading
+import time
 import yaml
 from collections import defaultdict
 
@@ -25,6 +28,10 @@ from atomic_reactor.plugins.pre_reactor_config import (get_config,
 
 ODCS_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 MINIMUM_TIME_TO_EXPIRE = timedelta(hours=2).total_seconds()
+# seconds to wait for all composes to be available, including renewals
+COMPOSES_TIMEOUT = 1800
+# number of composes waited for concurrently
+WAIT_THREADS = 8
 # flag to let ODCS see hidden pulp repos
 UNPUBLISHED_REPOS = 'include_unpublished_pulp_repos'
 
@@ -38,6 +45,9 @@ class ResolveComposesPlugin(PreBuildPlugin):
 
     key = PLUGIN_RESOLVE_COMPOSES_KEY
     is_allowed_to_fail = False
+    requires = ('reactor_config', 'source', 'check_and_set_rebuild', PLUGIN_KOJI_PARENT_KEY,
+                PLUGIN_CHECK_AND_SET_PLATFORMS_KEY, 'buildstep_plugins_conf')
+    provides = ('plugin_workspace.' + PLUGIN_BUILD_ORCHESTRATE_KEY,)
 
     def __init__(self, tasker, workflow,
                  odcs_url=None,
@@ -50,6 +60,8 @@ class ResolveComposesPlugin(PreBuildPlugin):
                  signing_intent=None,
                  compose_ids=tuple(),
                  minimum_time_to_expire=MINIMUM_TIME_TO_EXPIRE,
+                 composes_timeout=COMPOSES_TIMEOUT,
+                 wait_threads=WAIT_THREADS,
                  ):
         """
         :param tasker: DockerTasker instance
@@ -67,6 +79,8 @@ class ResolveComposesPlugin(PreBuildPlugin):
         :param compose_ids: use the given compose_ids instead of requesting a new one
         :param minimum_time_to_expire: int, used in deciding when to extend compose's time
                                        to expire in seconds
+        :param composes_timeout: int, seconds to wait for all composes, including renewals
+        :param wait_threads: int, number of composes waited for concurrently
         """
         super(ResolveComposesPlugin, self).__init__(tasker, workflow)
 
@@ -96,6 +110,8 @@ class ResolveComposesPlugin(PreBuildPlugin):
                 raise ValueError('koji_hub is required when koji_target is used')
 
         self.minimum_time_to_expire = minimum_time_to_expire
+        self.composes_timeout = composes_timeout
+        self.wait_threads = wait_threads
 
         self._koji_session = None
         self._odcs_client = None
@@ -218,18 +234,53 @@ class ResolveComposesPlugin(PreBuildPlugin):
             compose_info = self.odcs_client.start_compose(**compose_request)
             self.compose_ids.append(compose_info['id'])
 
-    def wait_for_composes(self):
-        self.log.debug('Waiting for ODCS composes to be available: %s', self.compose_ids)
-        self.composes_info = []
-        for compose_id in self.compose_ids:
-            compose_info = self.odcs_client.wait_for_compose(compose_id)
+    def wait_for_compose(self, odcs_client, compose_id, deadline, canceled):
+        """
+        Wait for a compose, renewing it if needed
+
+        :param odcs_client: ODCSClient, client shared by all waits
+        :param compose_id: int, compose ID to wait for
+        :param deadline: float, time when all waits give up
+        :param canceled: threading.Event, set when any of the waits failed
+        :return: dict, status of the compose or of its renewal
+        """
+        try:
+            compose_info = odcs_client.wait_for_compose(compose_id,
+                                                        timeout=deadline - time.time(),
+                                                        canceled=canceled)
 
             if self._needs_renewal(compose_info):
-                compose_info = self.odcs_client.renew_compose(compose_id)
+                compose_info = odcs_client.renew_compose(compose_id)
                 compose_id = compose_info['id']
-                compose_info = self.odcs_client.wait_for_compose(compose_id)
+                compose_info = odcs_client.wait_for_compose(compose_id,
+                                                            timeout=deadline - time.time(),
+                                                            canceled=canceled)
+        except Exception:
+            # no point in waiting for the other composes
+            canceled.set()
+            raise
 
-            self.composes_info.append(compose_info)
+        return compose_info
+
+    def wait_for_composes(self):
+        self.log.debug('Waiting for ODCS composes to be available: %s', self.compose_ids)
+        odcs_client = self.odcs_client
+        deadline = time.time() + self.composes_timeout
+        canceled = threading.Event()
+        # the whole wait takes as long as the slowest compose
+        args = [(odcs_client, compose_id, deadline, canceled) for compose_id in self.compose_ids]
+        if self.wait_threads <= 1 or len(args) <= 1:
+            self.composes_info = [self.wait_for_compose(*arg) for arg in args]
+        else:
+            pool = ThreadPool(min(self.wait_threads, len(args)))
+            try:
+                # get() raises the first failure without waiting for the other composes
+                result = pool.map_async(lambda arg: self.wait_for_compose(*arg), args,
+                                        chunksize=1)
+                self.composes_info = result.get()
+            finally:
+                pool.close()
+                pool.join()
 
         self.compose_ids = [item['id'] for item in self.composes_info]
 
@@ -0,0 +1,216 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Measure resources used by plugins
+"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+import cProfile
+
+
+logger = logging.getLogger(__name__)
+
+PLUGINS_PROFILING_ENV = 'ATOMIC_REACTOR_PLUGINS_PROFILING'
+PLUGINS_PROFILING_OPTIONS = ('tracemalloc', 'cprofile_dir')
+
+# fields of /proc/<pid>/io we record, and names we store them under
+IO_FIELDS = {
+    'rchar': 'read_chars',
+    'wchar': 'write_chars',
+    'read_bytes': 'read_bytes',
+    'write_bytes': 'write_bytes',
+}
+
+# tracemalloc is process-wide, stop it only after the last plugin profiled
+# with it finishes
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+
+
+def get_plugins_profiling_from_env():
+    """
+    read profiling options from environment variable
+
+    :return: dict, options for PluginProfiler, or None if profiling is not enabled
+    """
+    value = os.environ.get(PLUGINS_PROFILING_ENV)
+    if not value:
+        return None
+
+    try:
+        options = json.loads(value)
+    except ValueError:
+        options = None
+    if not isinstance(options, dict):
+        logger.warning("%s is not a JSON object, plugins won't be profiled",
+                       PLUGINS_PROFILING_ENV)
+        return None
+
+    for name in set(options) - set(PLUGINS_PROFILING_OPTIONS):
+        logger.warning("unknown option '%s' in %s, ignoring it", name, PLUGINS_PROFILING_ENV)
+        del options[name]
+
+    return options
+
+
+def _read_proc_io(per_thread):
+    """
+    :return: dict, I/O counters of this process (or thread), empty if not available
+    """
+    path = '/proc/thread-self/io' if per_thread else '/proc/self/io'
+    counters = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in IO_FIELDS:
+                    counters[IO_FIELDS[name]] = int(value)
+    except (IOError, OSError, ValueError):
+        logger.debug("can't read %s", path)
+    return counters
+
+
+class PluginProfiler(object):
+    """
+    record resources used by a plugin between start() and stop()
+
+    When plugins run concurrently, CPU time and I/O of the thread which runs
+    the plugin are recorded; peak RSS and time of child processes are always
+    process-wide.
+    """
+
+    def __init__(self, plugin, tracemalloc=0, cprofile_dir=None, per_thread=False):
+        """
+        :param plugin: str, key of profiled plugin
+        :param tracemalloc: int, number of top allocation sites to record,
+                            0 disables tracemalloc
+        :param cprofile_dir: str, directory to store cProfile stats in,
+                             None disables cProfile
+        :param per_thread: bool, record CPU time and I/O of current thread only
+        """
+        self.plugin = plugin
+        self.tracemalloc_top = tracemalloc
+        self.cprofile_dir = cprofile_dir
+        self.per_thread = per_thread and hasattr(resource, 'RUSAGE_THREAD')
+
+        self._start_usage = None
+        self._start_max_rss = None
+        self._start_children_usage = None
+        self._start_io = None
+        self._start_snapshot = None
+        self._profile = None
+
+    def _get_usage(self):
+        who = resource.RUSAGE_THREAD if self.per_thread else resource.RUSAGE_SELF
+        return resource.getrusage(who)
+
+    def start(self):
+        if self.tracemalloc_top:
+            self._start_tracemalloc()
+
+        self._start_usage = self._get_usage()
+        self._start_max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self._start_children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._start_io = _read_proc_io(self.per_thread)
+
+        if self.cprofile_dir:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        """
+        :return: dict, resources used by the plugin
+        """
+        if self._profile:
+            self._profile.disable()
+
+        usage = self._get_usage()
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        io = _read_proc_io(self.per_thread)
+
+        profile = {
+            'cpu_user': usage.ru_utime - self._start_usage.ru_utime,
+            'cpu_system': usage.ru_stime - self._start_usage.ru_stime,
+            'children_user': children_usage.ru_utime - self._start_children_usage.ru_utime,
+            'children_system': children_usage.ru_stime - self._start_children_usage.ru_stime,
+            # ru_maxrss is in kilobytes
+            'max_rss': max_rss * 1024,
+            'max_rss_increase': (max_rss - self._start_max_rss) * 1024,
+        }
+        for name, value in io.items():
+            if name in self._start_io:
+                profile[name] = value - self._start_io[name]
+
+        if self.tracemalloc_top and self._start_snapshot is not None:
+            profile['tracemalloc'] = self._stop_tracemalloc()
+
+        if self._profile:
+            profile['cprofile'] = self._dump_cprofile()
+
+        return profile
+
+    def _start_tracemalloc(self):
+        global _tracemalloc_users, _tracemalloc_started
+
+        if tracemalloc is None:
+            logger.warning("tracemalloc is not available, not tracing allocations of '%s'",
+                           self.plugin)
+            return
+
+        with _tracemalloc_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_started = True
+            _tracemalloc_users += 1
+        self._start_snapshot = tracemalloc.take_snapshot()
+
+    def _stop_tracemalloc(self):
+        global _tracemalloc_users, _tracemalloc_started
+
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self._start_snapshot, 'lineno')
+        self._start_snapshot = None
+
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_started:
+                tracemalloc.stop()
+                _tracemalloc_started = False
+
+        return [{
+            'traceback': str(stat.traceback),
+            'size_diff': stat.size_diff,
+            'count_diff': stat.count_diff,
+        } for stat in stats[:self.tracemalloc_top]]
+
+    def _dump_cprofile(self):
+        try:
+            if not os.path.isdir(self.cprofile_dir):
+                os.makedirs(self.cprofile_dir)
+            path = os.path.join(self.cprofile_dir,
+                                '{0}-{1}.prof'.format(self.plugin, int(time.time())))
+            self._profile.dump_stats(path)
+        except (IOError, OSError) as ex:
+            logger.warning("can't store cProfile stats of '%s': %r", self.plugin, ex)
+            return None
+        return path
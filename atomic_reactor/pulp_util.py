@@ -21,7 +21,8 @@ except (ImportError, SyntaxError):
     dockpulp = None
 
 from atomic_reactor.constants import (LOCKEDPULPREPOSITORY_RETRIES,
-                                      LOCKEDPULPREPOSITORY_BACKOFF)
+                                      LOCKEDPULPREPOSITORY_BACKOFF,
+                                      PLUGIN_PULP_PULL_KEY)
 
 
 PulpRepo = namedtuple('PulpRepo', ['registry_id', 'tags'])
@@ -34,6 +35,22 @@ warnings.filterwarnings("module")
 logger = logging.getLogger(__name__)
 
 
+def record_crane_publish(workflow):
+    """
+    Remember when content was published to crane, pulp_pull waits
+    for it to be available from then
+    """
+    workspace = workflow.plugin_workspace.setdefault(PLUGIN_PULP_PULL_KEY, {})
+    workspace['published'] = time.time()
+
+
+def get_crane_publish_time(workflow):
+    """
+    :return: float, time content was last published to crane, or None
+    """
+    return workflow.plugin_workspace.get(PLUGIN_PULP_PULL_KEY, {}).get('published')
+
+
 class PulpLogWrapper(object):
     def __init__(self):
         if dockpulp:
@@ -224,6 +241,7 @@ class PulpHandler(object):
         self.log.info("waiting for repos to be published to crane, tasks: %s",
                       ", ".join(map(str, task_ids)))
         self.p.watch_tasks(task_ids)
+        record_crane_publish(self.workflow)
 
     def get_registry_hostname(self):
         return re.sub(r'^https?://([^/]*)/?.*', lambda m: m.groups()[0], self.p.registry)
@@ -0,0 +1,300 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Cache of manifests and blobs fetched from registries
+
+Manifests and blobs referenced by digest never change, they are cached
+without expiration, in memory and optionally in a directory which may be
+shared by builds running on the same node. Manifests referenced by tag
+are cached in memory only, for a short time. Responses are cached for each
+set of credentials separately, so one never gets what only another one is
+authorized to see.
+
+HEAD requests for blobs tell whether a blob is in a repository, which may
+change, their responses are never stored in the directory.
+"""
+
+from __future__ import unicode_literals
+
+import base64
+import errno
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_CACHE_MAX_ENTRIES = 1000
+# seconds
+REGISTRY_CACHE_TAG_TTL = 60
+# bigger responses are not cached
+REGISTRY_CACHE_MAX_CONTENT_SIZE = 4 * 1024**2
+# bytes, least recently used responses are removed from the directory
+# above this size
+REGISTRY_CACHE_MAX_DISK_SIZE = 512 * 1024**2
+# the directory is checked for its size on every this many stored responses
+REGISTRY_CACHE_PRUNE_INTERVAL = 100
+
+CACHED_URL_RE = re.compile(r'^/v2/(?P<repo>.+)/(?P<type>manifests|blobs)/(?P<ref>[^/?]+)$')
+DIGEST_RE = re.compile(r'^[a-z0-9]+(?:[.+_-][a-z0-9]+)*:[a-fA-F0-9]{32,}$')
+
+
+def _make_response(entry):
+    response = requests.Response()
+    response.status_code = entry['status_code']
+    response.reason = 'OK'
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.url = entry['url']
+    response._content = entry['content']
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+class RegistryCache(object):
+    """
+    Successful GET and HEAD responses for /v2/<repo>/manifests/<reference>
+    and /v2/<repo>/blobs/<digest>, keyed by registry, credentials scope,
+    method, URL and Accept header
+    """
+
+    def __init__(self, max_entries=REGISTRY_CACHE_MAX_ENTRIES, tag_ttl=REGISTRY_CACHE_TAG_TTL,
+                 directory=None, max_disk_size=REGISTRY_CACHE_MAX_DISK_SIZE):
+        """
+        :param max_entries: int, number of responses kept in memory, least
+                            recently used are dropped
+        :param tag_ttl: int, seconds for which responses for tags are cached,
+                        0 disables caching them
+        :param directory: str, directory to store responses for digests in
+        :param max_disk_size: int, bytes, least recently used responses are
+                              removed from directory when it gets bigger
+        """
+        self.max_entries = max_entries
+        self.tag_ttl = tag_ttl
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if self.directory:
+            self.prune()
+
+    @staticmethod
+    def _parse_url(relative_url):
+        """
+        :return: tuple, repository, type (manifests or blobs) and reference,
+                 or None if URL is not cached
+        """
+        match = CACHED_URL_RE.match(relative_url)
+        if not match:
+            return None
+        if match.group('type') == 'blobs' and not DIGEST_RE.match(match.group('ref')):
+            return None
+        return match.group('repo'), match.group('type'), match.group('ref')
+
+    def _get_file_prefix(self, registry, relative_url):
+        # all entries for URL are found by prefix when invalidating it
+        name = hashlib.sha256(json.dumps([registry, relative_url]).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:32])
+
+    def _get_file_path(self, key):
+        registry, _, _, relative_url, _ = key
+        name = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+        return '{}-{}.json'.format(self._get_file_prefix(registry, relative_url), name[:32])
+
+    def _read_file(self, key):
+        path = self._get_file_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            entry['content'] = base64.b64decode(entry['content'])
+            # least recently used are pruned first
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        except (ValueError, KeyError, TypeError) as ex:
+            logger.warning('corrupted registry cache entry for %s: %r', key, ex)
+            return None
+        entry['expires'] = None
+        return entry
+
+    def _write_file(self, key, entry):
+        data = dict(entry, content=base64.b64encode(entry['content']).decode('ascii'))
+        del data['expires']
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            # builds sharing the directory never see incomplete entries
+            os.rename(path, self._get_file_path(key))
+        except (IOError, OSError) as ex:
+            logger.warning('unable to store registry cache entry for %s: %r', key, ex)
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % REGISTRY_CACHE_PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError as ex:
+            # possibly removed by another build sharing the directory
+            if ex.errno != errno.ENOENT:
+                logger.warning('unable to remove registry cache entry %s: %r', path, ex)
+
+    def prune(self):
+        """
+        remove least recently used responses from directory until it is not
+        bigger than max_disk_size
+        """
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_disk_size:
+                break
+            self._remove_file(path)
+            size -= file_size
+
+    def _lookup(self, key, disk):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires'] is None or entry['expires'] > time.time():
+                    # most recently used last
+                    self._entries[key] = self._entries.pop(key)
+                    return entry
+                del self._entries[key]
+
+        if disk and self.directory:
+            entry = self._read_file(key)
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._store(key, entry)
+                return entry
+        return None
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _is_stored(parsed, method):
+        """
+        :return: bool, whether responses for URL are stored in the directory
+        """
+        _, url_type, reference = parsed
+        if DIGEST_RE.match(reference) is None:
+            return False
+        # blob may be removed from repository
+        return not (url_type == 'blobs' and method == 'HEAD')
+
+    def get(self, registry, method, relative_url, accept, scope=None):
+        """
+        :param scope: str, identifies credentials used for the request
+        :return: requests.Response, or None if not cached
+        """
+        parsed = self._parse_url(relative_url)
+        if parsed is None:
+            return None
+        disk = self._is_stored(parsed, method)
+
+        # HEAD response has the same headers as GET response
+        for cached_method in ([method, 'GET'] if method == 'HEAD' else [method]):
+            entry = self._lookup((registry, scope, cached_method, relative_url, accept), disk)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                logger.debug('registry cache hit: %s %s%s', method, registry, relative_url)
+                return _make_response(entry)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, registry, method, relative_url, accept, response, scope=None):
+        """
+        cache response if it is successful and its URL is cached
+
+        :param scope: str, identifies credentials used for the request
+        """
+        parsed = self._parse_url(relative_url)
+        if parsed is None or response.status_code != requests.codes.ok:
+            return
+        digest = DIGEST_RE.match(parsed[2]) is not None
+        if not digest and not self.tag_ttl:
+            return
+
+        content = response.content if method != 'HEAD' else b''
+        if not isinstance(content, bytes) or len(content) > REGISTRY_CACHE_MAX_CONTENT_SIZE:
+            return
+
+        key = (registry, scope, method, relative_url, accept)
+        entry = {
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'url': response.url,
+            'content': content,
+            'expires': None if digest else time.time() + self.tag_ttl,
+        }
+        self._store(key, entry)
+        if self.directory and self._is_stored(parsed, method):
+            self._write_file(key, entry)
+
+    def invalidate(self, registry, relative_url):
+        """
+        drop responses for the reference in URL (e.g. when it's being
+        updated or deleted) from memory and directory
+        """
+        parsed = self._parse_url(relative_url)
+        if parsed is None:
+            return
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == registry and self._parse_url(key[3]) == parsed:
+                    del self._entries[key]
+        if self.directory:
+            for path in glob.glob(self._get_file_prefix(registry, relative_url) + '-*.json'):
+                self._remove_file(path)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+            }
@@ -21,7 +21,9 @@ from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util import Retry
 import shutil
 import subprocess
+import tarfile
 import tempfile
+import threading
 import logging
 import uuid
 import yaml
@@ -30,9 +32,13 @@ import string
 import time
 from collections import namedtuple
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 
+import six
+from six import string_types
 from six.moves.urllib.parse import urlparse
 
+from atomic_reactor.registry_cache import RegistryCache
 from atomic_reactor.constants import (DOCKERFILE_FILENAME, REPO_CONTAINER_CONFIG, TOOLS_USED,
                                       INSPECT_CONFIG,
                                       IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR,
@@ -57,6 +63,9 @@ Output = namedtuple('Output', ['file', 'metadata'])
 
 logger = logging.getLogger(__name__)
 
+# size of chunks image archives are read in when exported
+EXPORT_CHUNK_SIZE = 1024**2
+
 
 class ImageName(object):
     def __init__(self, registry=None, namespace=None, repo=None, tag=None):
@@ -470,42 +479,107 @@ def _process_plugin_substitution(mapping, key_parts, value):
                            plugin_name, plugins_num)
 
 
-def get_checksums(path, algorithms):
+class ChecksumsCache(object):
+    """
+    Checksums of files computed so far, keyed by device, inode, size and
+    modification time of the file; a file which changed gets a new key
+    """
+
+    def __init__(self):
+        self._checksums = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(path):
+        st = os.stat(path)
+        mtime_ns = getattr(st, 'st_mtime_ns', None)
+        if mtime_ns is None:
+            # python 2
+            mtime_ns = int(st.st_mtime * 10**9)
+        return st.st_dev, st.st_ino, st.st_size, mtime_ns
+
+    def get(self, key):
+        """
+        :return: dict, hexdigests by algorithm
+        """
+        with self._lock:
+            return dict(self._checksums.get(key, {}))
+
+    def update(self, key, checksums):
+        """
+        :param checksums: dict, hexdigests by algorithm
+        """
+        with self._lock:
+            self._checksums.setdefault(key, {}).update(checksums)
+
+    def clear(self):
+        with self._lock:
+            self._checksums.clear()
+
+
+checksums_cache = ChecksumsCache()
+
+
+def _hash_file(f, algorithms, parallel, blocksize=EXPORT_CHUNK_SIZE):
+    """
+    :return: dict, hexdigests by algorithm
+    """
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+    pool = ThreadPool(len(hashes)) if parallel and len(hashes) > 1 else None
+    try:
+        buf = f.read(blocksize)
+        while buf:
+            if pool is None:
+                for digest in hashes:
+                    digest.update(buf)
+                buf = f.read(blocksize)
+            else:
+                # hashlib releases the GIL, update all hashes while reading the next block
+                result = pool.map_async(lambda digest, data=buf: digest.update(data), hashes)
+                buf = f.read(blocksize)
+                result.get()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, hashes)}
+
+
+def get_checksums(path, algorithms, parallel=False):
     """
     Compute a checksum(s) of given file using specified algorithms.
 
+    Checksums are cached (see ChecksumsCache), only those not computed yet
+    for the file are computed.
+
     :param path: path to file
-    :param algorithms: list of cryptographic hash functions, currently supported: md5, sha256
+    :param algorithms: list of cryptographic hash functions supported by hashlib,
+                       e.g. md5, sha256
+    :param parallel: bool, compute checksums on a thread per algorithm,
+                     only worth it for large files such as image archives
     :return: dictionary
     """
     if not algorithms:
         return {}
 
-    compute_md5 = 'md5' in algorithms
-    compute_sha256 = 'sha256' in algorithms
+    key = ChecksumsCache.get_key(path)
+    checksums = checksums_cache.get(key)
+    missing = [algorithm for algorithm in algorithms if algorithm not in checksums]
+    if missing:
+        with open(path, mode='rb') as f:
+            computed = _hash_file(f, missing, parallel)
+        # don't cache checksums of a file modified while reading it
+        if ChecksumsCache.get_key(path) == key:
+            checksums_cache.update(key, computed)
+        checksums.update(computed)
+    else:
+        logger.debug('using cached checksums of %s', path)
 
-    if compute_md5:
-        md5 = hashlib.md5()
-    if compute_sha256:
-        sha256 = hashlib.sha256()
-    blocksize = 65536
-    with open(path, mode='rb') as f:
-        buf = f.read(blocksize)
-        while len(buf) > 0:
-            if compute_md5:
-                md5.update(buf)
-            if compute_sha256:
-                sha256.update(buf)
-            buf = f.read(blocksize)
-
-    checksums = {}
-    if compute_md5:
-        checksums['md5sum'] = md5.hexdigest()
-        logger.debug('md5sum: %s', checksums['md5sum'])
-    if compute_sha256:
-        checksums['sha256sum'] = sha256.hexdigest()
-        logger.debug('sha256sum: %s', checksums['sha256sum'])
-    return checksums
+    result = {}
+    for algorithm in algorithms:
+        result['{}sum'.format(algorithm)] = checksums[algorithm]
+        logger.debug('%ssum: %s', algorithm, checksums[algorithm])
+    return result
 
 
 def get_docker_architecture(tasker):
@@ -519,10 +593,277 @@ def get_docker_architecture(tasker):
 def get_exported_image_metadata(path, image_type):
     logger.info('getting metadata for exported image %s (%s)', path, image_type)
     metadata = {'path': path, 'type': image_type}
-    if image_type != IMAGE_TYPE_OCI:
+    if image_type == IMAGE_TYPE_DOCKER_ARCHIVE and path.endswith('.tar'):
+        # index layers while computing checksums, file is read only once
+        key = ChecksumsCache.get_key(path)
+        with open(path, 'rb') as image_stream:
+            metadata.update(export_image_stream(image_stream, image_type))
+        metadata['path'] = path
+        if ChecksumsCache.get_key(path) == key:
+            checksums_cache.update(key, {'md5': metadata['md5sum'],
+                                         'sha256': metadata['sha256sum']})
+    elif image_type != IMAGE_TYPE_OCI:
         metadata['size'] = os.path.getsize(path)
         logger.debug('size: %d bytes', metadata['size'])
-        metadata.update(get_checksums(path, ['md5', 'sha256']))
+        metadata.update(get_checksums(path, ['md5', 'sha256'], parallel=True))
+    return metadata
+
+
+class ChecksumsWriter(object):
+    """
+    file-like object which computes size and checksums of data written to it,
+    and passes the data on to another file-like object (if any)
+    """
+
+    def __init__(self, fileobj=None):
+        self.fileobj = fileobj
+        self.size = 0
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        self.md5.update(data)
+        self.sha256.update(data)
+        if self.fileobj is not None:
+            self.fileobj.write(data)
+
+    def flush(self):
+        if self.fileobj is not None:
+            self.fileobj.flush()
+
+    def get_checksums(self):
+        return {
+            'md5sum': self.md5.hexdigest(),
+            'sha256sum': self.sha256.hexdigest(),
+        }
+
+
+class TeeReader(object):
+    """
+    file-like object which passes all data read from stream to writer
+    """
+
+    def __init__(self, stream, writer):
+        self.stream = stream
+        self.writer = writer
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if data:
+            self.size += len(data)
+            self.writer.write(data)
+        return data
+
+    def tell(self):
+        return self.size
+
+    def drain(self, chunk_size=EXPORT_CHUNK_SIZE):
+        while self.read(chunk_size):
+            pass
+
+
+def index_image_layers(reader, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Read uncompressed docker image archive and describe its layers
+
+    :param reader: file-like object, only read() is used
+    :param chunk_size: int, size of chunks layers are read in
+    :return: list of dicts with id, offset and size of layer.tar within
+             the archive and its sha256 digest; None if the stream can't
+             be read as tar archive
+    """
+    layers = []
+    try:
+        tar = tarfile.open(fileobj=reader, mode='r|')
+        for member in tar:
+            if not member.isfile() or os.path.basename(member.name) != 'layer.tar':
+                continue
+            digest = hashlib.sha256()
+            layer = tar.extractfile(member)
+            for chunk in iter(lambda: layer.read(chunk_size), b''):
+                digest.update(chunk)
+            layers.append({
+                'id': os.path.dirname(member.name),
+                'offset': member.offset_data,
+                'size': member.size,
+                'digest': 'sha256:{}'.format(digest.hexdigest()),
+            })
+    except tarfile.TarError as ex:
+        logger.warning("can't index layers of image archive: %r", ex)
+        return None
+    return layers
+
+
+def _read_block(reader, size):
+    """
+    read exactly size bytes, unless the stream ends
+    """
+    data = b''
+    while len(data) < size:
+        chunk = reader.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _copy_block(reader, writer, size, chunk_size):
+    """
+    copy size bytes from reader to writer, or drop them if writer is None
+    """
+    while size:
+        chunk = reader.read(min(chunk_size, size))
+        if not chunk:
+            raise tarfile.ReadError('unexpected end of tar archive')
+        if writer is not None:
+            writer.write(chunk)
+        size -= len(chunk)
+
+
+def _parse_pax_path(data):
+    """
+    :return: str, path from pax extended header records, or None
+    """
+    path = None
+    pos = 0
+    while pos < len(data):
+        length, _, _ = data[pos:].partition(b' ')
+        if not length.isdigit():
+            break
+        record = data[pos:pos + int(length)]
+        keyword, _, value = record.partition(b' ')[2].partition(b'=')
+        if keyword == b'path':
+            path = value[:-1].decode('utf-8', 'replace')
+        pos += int(length)
+    return path
+
+
+def strip_tar_members(reader, writer, names, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Copy tar archive from reader to writer without members of given names
+
+    Like `tar --delete`, headers and data of the other members are copied
+    unchanged. When reader is seekable (uncompressed archive in a file),
+    data of removed members are skipped without reading them.
+
+    :param reader: file-like object with uncompressed tar archive
+    :param writer: file-like object to write the archive to
+    :param names: iterable of str, names of members to remove
+    :param chunk_size: int, size of chunks member data are copied in
+    :return: int, number of bytes removed from the archive
+    """
+    names = set(os.path.normpath(name) for name in names)
+    try:
+        seekable = reader.seekable()
+    except AttributeError:
+        # Python 2 file objects have no seekable(), but tell() fails
+        # on those which can't seek
+        try:
+            reader.tell()
+            seekable = hasattr(reader, 'seek')
+        except (AttributeError, IOError, OSError):
+            seekable = False
+
+    removed = 0
+    # extended headers belong to the member which follows them
+    extended = []
+    extended_name = None
+    while True:
+        header = _read_block(reader, tarfile.BLOCKSIZE)
+        if len(header) < tarfile.BLOCKSIZE:
+            raise tarfile.ReadError('unexpected end of tar archive')
+        if header == tarfile.NUL * tarfile.BLOCKSIZE:
+            # end of archive and padding are copied as is
+            writer.write(header)
+            for chunk in iter(lambda: reader.read(chunk_size), b''):
+                writer.write(chunk)
+            return removed
+
+        if six.PY2:
+            info = tarfile.TarInfo.frombuf(header)
+        else:
+            info = tarfile.TarInfo.frombuf(header, tarfile.ENCODING, 'surrogateescape')
+        data_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+        if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+            data = _read_block(reader, data_size)
+            if info.type == tarfile.GNUTYPE_LONGNAME:
+                extended_name = data[:info.size].split(tarfile.NUL, 1)[0]
+                extended_name = extended_name.decode('utf-8', 'replace')
+            else:
+                extended_name = _parse_pax_path(data[:info.size]) or extended_name
+            extended.append(header + data)
+            continue
+
+        name = os.path.normpath(extended_name or info.name)
+        if name in names:
+            logger.debug('removing %s from tar archive', name)
+            removed += sum(len(block) for block in extended) + len(header) + data_size
+            if seekable:
+                reader.seek(data_size, os.SEEK_CUR)
+            else:
+                _copy_block(reader, None, data_size, chunk_size)
+        else:
+            for block in extended:
+                writer.write(block)
+            writer.write(header)
+            _copy_block(reader, writer, data_size, chunk_size)
+        extended = []
+        extended_name = None
+
+
+def export_image_stream(stream, image_type, path=None, compress=None, index_layers=True,
+                        chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Save image archive from stream and describe it, reading the stream only once
+
+    Data from stream are (compressed and) written to path, while size and
+    checksums of the written file, the uncompressed size and index of layers
+    (see index_image_layers) are computed on the way.
+
+    :param stream: file-like object with uncompressed image archive
+    :param image_type: str, type of image archive
+    :param path: str, file to write the archive to; when None, nothing is
+                 written and the metadata describe stream itself
+    :param compress: callable, takes file-like object and returns file-like
+                     object which writes compressed data into it
+    :param index_layers: bool, whether to index layers of docker archive
+    :param chunk_size: int, size of chunks the stream is read in
+    :return: dict, image metadata for workflow.exported_image_sequence
+    """
+    if path:
+        logger.info('exporting image (%s) to %s', image_type, path)
+    outfile = open(path, 'wb') if path else None
+    try:
+        output = ChecksumsWriter(outfile)
+        compressor = compress(output) if compress else None
+        try:
+            reader = TeeReader(stream, compressor or output)
+            layers = None
+            if index_layers and image_type == IMAGE_TYPE_DOCKER_ARCHIVE:
+                layers = index_image_layers(reader, chunk_size)
+            reader.drain(chunk_size)
+        finally:
+            if compressor is not None:
+                compressor.close()
+    finally:
+        if outfile is not None:
+            outfile.close()
+
+    metadata = {'path': path, 'type': image_type, 'size': output.size}
+    metadata.update(output.get_checksums())
+    if path:
+        # the file is described, don't read it again to compute checksums
+        checksums_cache.update(ChecksumsCache.get_key(path),
+                               {'md5': output.md5.hexdigest(),
+                                'sha256': output.sha256.hexdigest()})
+    logger.debug('size: %d bytes, checksums: %s', output.size, output.get_checksums())
+    if compress:
+        metadata['uncompressed_size'] = reader.size
+    if layers is not None:
+        metadata['layers'] = layers
     return metadata
 
 
@@ -675,12 +1016,21 @@ class Dockercfg(object):
 
 
 class RegistrySession(object):
-    def __init__(self, registry, insecure=False, dockercfg_path=None):
+    def __init__(self, registry, insecure=False, dockercfg_path=None, cache=None):
+        """
+        :param registry: str, registry hostname or URL
+        :param insecure: bool, when True registry's cert is not verified
+        :param dockercfg_path: str, dirname of .dockercfg location
+        :param cache: RegistryCache, cache for manifests and blobs
+        """
         self.registry = registry
         self._resolved = None
         self.insecure = insecure
+        self.cache = cache
 
         self.auth = None
+        # responses are cached for each set of credentials separately
+        self.cache_scope = None
         if dockercfg_path:
             dockercfg = Dockercfg(dockercfg_path).get_credentials(registry)
 
@@ -688,6 +1038,8 @@ class RegistrySession(object):
             password = dockercfg.get('password')
             if username and password:
                 self.auth = requests.auth.HTTPBasicAuth(username, password)
+                credentials = '{}:{}'.format(username, password)
+                self.cache_scope = hashlib.sha256(credentials.encode('utf-8')).hexdigest()
 
         self._fallback = None
         if re.match('http(s)?://', self.registry):
@@ -701,35 +1053,145 @@ class RegistrySession(object):
                 self._fallback = 'http://{}'.format(self.registry)
 
         self.session = get_retrying_requests_session()
+        # requests made concurrently wait for the first one to find out
+        # whether to fallback
+        self._fallback_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
 
     def _do(self, f, relative_url, *args, **kwargs):
         kwargs['auth'] = self.auth
         kwargs['verify'] = not self.insecure
+        with self._stats_lock:
+            self.requests += 1
         if self._fallback:
-            try:
-                res = f(self._base + relative_url, *args, **kwargs)
-                self._fallback = None  # don't fallback after one success
-                return res
-            except (SSLError, ConnectionError):
-                self._base = self._fallback
-                self._fallback = None
+            with self._fallback_lock:
+                if self._fallback:
+                    try:
+                        res = f(self._base + relative_url, *args, **kwargs)
+                        self._fallback = None  # don't fallback after one success
+                        return res
+                    except (SSLError, ConnectionError):
+                        self._base = self._fallback
+                        self._fallback = None
         return f(self._base + relative_url, *args, **kwargs)
 
-    def get(self, relative_url, data=None, **kwargs):
-        return self._do(self.session.get, relative_url, **kwargs)
+    def _do_cached(self, f, method, relative_url, use_cache=True, **kwargs):
+        if self.cache is None or not use_cache:
+            return self._do(f, relative_url, **kwargs)
+
+        accept = (kwargs.get('headers') or {}).get('Accept')
+        response = self.cache.get(self.registry, method, relative_url, accept,
+                                  scope=self.cache_scope)
+        if response is None:
+            response = self._do(f, relative_url, **kwargs)
+            self.cache.put(self.registry, method, relative_url, accept, response,
+                           scope=self.cache_scope)
+        return response
+
+    def get(self, relative_url, data=None, use_cache=True, **kwargs):
+        """
+        :param use_cache: bool, whether the response may come from and is stored in cache
+        """
+        return self._do_cached(self.session.get, 'GET', relative_url, use_cache=use_cache,
+                               **kwargs)
 
-    def head(self, relative_url, data=None, **kwargs):
-        return self._do(self.session.head, relative_url, **kwargs)
+    def head(self, relative_url, data=None, use_cache=True, **kwargs):
+        """
+        :param use_cache: bool, whether the response may come from and is stored in cache
+        """
+        return self._do_cached(self.session.head, 'HEAD', relative_url, use_cache=use_cache,
+                               **kwargs)
 
     def post(self, relative_url, data=None, **kwargs):
         return self._do(self.session.post, relative_url, data=data, **kwargs)
 
     def put(self, relative_url, data=None, **kwargs):
+        if self.cache is not None:
+            self.cache.invalidate(self.registry, relative_url)
         return self._do(self.session.put, relative_url, data=data, **kwargs)
 
     def delete(self, relative_url, **kwargs):
+        if self.cache is not None:
+            self.cache.invalidate(self.registry, relative_url)
         return self._do(self.session.delete, relative_url, **kwargs)
 
+    def get_stats(self):
+        """
+        :return: dict, number of requests sent by this session and number of
+                 connections opened and requests sent by its connection pools
+                 (including retries)
+        """
+        connections = pooled_requests = 0
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+        return {
+            'url': self._base,
+            'requests': self.requests,
+            'connections': connections,
+            'pooled_requests': pooled_requests,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class RegistrySessionPool(object):
+    """
+    RegistrySession instances shared by plugins of a build, one per
+    registry, insecure flag and credentials, so that connections,
+    credentials and the scheme found out by https to http fallback are
+    reused; the sessions share a RegistryCache
+    """
+
+    def __init__(self, cache=None):
+        """
+        :param cache: dict, arguments for RegistryCache, or None to use defaults
+        """
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.cache = RegistryCache(**(cache or {}))
+
+    def get_session(self, registry, insecure=False, dockercfg_path=None):
+        """
+        :return: RegistrySession
+        """
+        key = (registry, insecure, dockercfg_path)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = RegistrySession(registry, insecure=insecure,
+                                          dockercfg_path=dockercfg_path, cache=self.cache)
+                self._sessions[key] = session
+            else:
+                self.reused += 1
+        return session
+
+    def get_stats(self):
+        """
+        :return: dict, number of sessions and how many times they were reused,
+                 RegistrySession.get_stats() of each session, statistics of cache
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+        return {
+            'sessions': [dict(session.get_stats(), registry=registry, insecure=insecure)
+                         for (registry, insecure, _), session in sessions],
+            'reused': self.reused,
+            'cache': self.cache.get_stats(),
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
 
 class ManifestDigest(dict):
     """Wrapper for digests for a docker manifest."""
@@ -790,14 +1252,16 @@ def get_digests_map_from_annotations(digests_str):
     return digests
 
 
-def query_registry(registry_session, image, digest=None, version='v1', is_blob=False):
+def query_registry(registry_session, image, digest=None, version='v1', is_blob=False,
+                   head=False):
     """Return manifest digest for image.
 
     :param registry_session: RegistrySession
     :param image: ImageName, the remote image to inspect
     :param digest: str, digest of the image manifest
-    :param version: str, which manifest schema version to fetch digest
+    :param version: str or list, which manifest schema version(s) to fetch digest
     :param is_blob: bool, read blob config if set to True
+    :param head: bool, send HEAD request, response has headers only
 
     :return: requests.Response object
     """
@@ -808,11 +1272,17 @@ def query_registry(registry_session, image, digest=None, version='v1', is_blob=F
     if is_blob:
         object_type = 'blobs'
 
-    headers = {'Accept': (get_manifest_media_type(version))}
+    if isinstance(version, string_types):
+        version = [version]
+    headers = {'Accept': ', '.join(get_manifest_media_type(v) for v in version)}
     url = '/v2/{}/{}/{}'.format(context, object_type, reference)
-    logger.debug("query_registry: querying {}, headers: {}".format(url, headers))
+    logger.debug("query_registry: querying {}{}, headers: {}".format(
+        'HEAD ' if head else '', url, headers))
 
-    response = registry_session.get(url, headers=headers)
+    if head:
+        response = registry_session.head(url, headers=headers, allow_redirects=True)
+    else:
+        response = registry_session.get(url, headers=headers)
     for r in chain(response.history, [response]):
         logger.debug("query_registry: [%s] %s", r.status_code, r.url)
 
@@ -876,11 +1346,12 @@ def manifest_is_media_type(response, media_type):
     return response_h_prefix == request_h_prefix
 
 
-def get_manifest(image, registry_session, version):
+def get_manifest(image, registry_session, version, head=False):
     saved_not_found = None
     media_type = get_manifest_media_type(version)
     try:
-        response = query_registry(registry_session, image, digest=None, version=version)
+        response = query_registry(registry_session, image, digest=None, version=version,
+                                  head=head)
     except (HTTPError, RetryError, Timeout) as ex:
         if ex.response.status_code == requests.codes.not_found:
             saved_not_found = ex
@@ -904,6 +1375,12 @@ def get_manifest(image, registry_session, version):
         else:
             raise
 
+    if head and not (response.headers.get('Content-Type') and
+                     response.headers.get('Docker-Content-Digest')):
+        # media type or digest can't be found out without the manifest
+        logger.debug("HEAD response is not sufficient, fetching %s manifest", version)
+        return get_manifest(image, registry_session, version)
+
     if not manifest_is_media_type(response, media_type):
         logger.warning("content does not match expected media type")
         return None, saved_not_found
@@ -911,8 +1388,21 @@ def get_manifest(image, registry_session, version):
     return response, saved_not_found
 
 
+def _get_manifest_no_raise(args):
+    """
+    call get_manifest in a pool thread, passing its exception back to the
+    caller instead of raising it there
+    """
+    try:
+        return get_manifest(*args), None
+    except Exception as ex:
+        return None, ex
+
+
 def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
-                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True):
+                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True,
+                         registry_session=None, concurrent=False, head=False,
+                         digests_cache=None):
     """Return manifest digest for image.
 
     :param image: ImageName, the remote image to inspect
@@ -923,22 +1413,81 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     :param versions: tuple, which manifest schema versions to fetch digest
     :param require_digest: bool, when True exception is thrown if no digest is
                                  set in the headers.
+    :param registry_session: RegistrySession, session to share between calls,
+                             by default a new one is created
+    :param concurrent: bool, probe media types of all versions concurrently
+    :param head: bool, send HEAD requests, manifest is fetched only when the
+                 response headers don't tell its media type and digest; some
+                 registries (e.g. crane) don't handle HEAD well
+    :param digests_cache: dict, shared between calls for tags of the same
+                          repository in registry; when the tag refers to
+                          a manifest already probed for another tag, only
+                          v1 digest (specific to the tag) is probed again
 
     :return: dict, versions mapped to their digest
     """
 
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    if registry_session is None:
+        registry_session = RegistrySession(registry, insecure=insecure,
+                                           dockercfg_path=dockercfg_path)
+
+    context = '/'.join([x for x in [image.namespace, image.repo] if x])
+    tag = image.tag or 'latest'
+
+    cache_key = None
+    cached = {}
+    shared_versions = tuple(v for v in versions if v != 'v1')
+    if digests_cache is not None and shared_versions:
+        try:
+            response = query_registry(registry_session, image, version=shared_versions,
+                                      head=True)
+            stored_digest = response.headers.get('Docker-Content-Digest')
+        except (HTTPError, RetryError, Timeout):
+            stored_digest = None
+        if stored_digest:
+            cache_key = (context, shared_versions, stored_digest)
+            cached = digests_cache.get(cache_key, {})
+            if cached:
+                logger.debug('Image %s:%s refers to manifest %s, already probed',
+                             context, tag, stored_digest)
+
+    probed = [version for version in versions if version not in cached]
+    pool = ThreadPool(len(probed)) if concurrent and len(probed) > 1 else None
+    try:
+        args = [(image, registry_session, version, head) for version in probed]
+        if pool is None:
+            results = []
+            for arg in args:
+                results.append(_get_manifest_no_raise(arg))
+                if results[-1][1] is not None:
+                    # don't probe the rest, the error is raised anyway
+                    break
+        else:
+            results = pool.map(_get_manifest_no_raise, args)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    results = dict(zip(probed, results))
 
     digests = {}
     # If all of the media types return a 404 NOT_FOUND status, then we rethrow
     # an exception, if all of the media types fail for some other reason - like
     # bad headers - then we return a ManifestDigest object with no digests.
     # This is interesting for the Pulp "retry until the manifest shows up" case.
-    all_not_found = True
+    all_not_found = not cached
     saved_not_found = None
     for version in versions:
+        if version in cached:
+            if cached[version]:
+                digests[version] = cached[version]
+            continue
+
+        result, error = results[version]
+        if error is not None:
+            raise error
+        response, saved_not_found = result
         media_type = get_manifest_media_type(version)
-        response, saved_not_found = get_manifest(image, registry_session, version)
 
         if saved_not_found is None:
             all_not_found = False
@@ -954,11 +1503,13 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
             continue
 
         digests[version] = response.headers['Docker-Content-Digest']
-        context = '/'.join([x for x in [image.namespace, image.repo] if x])
-        tag = image.tag or 'latest'
         logger.debug('Image %s:%s has %s manifest digest: %s',
                      context, tag, version, digests[version])
 
+    if cache_key is not None and not cached:
+        digests_cache[cache_key] = {version: digests.get(version)
+                                    for version in shared_versions}
+
     if not digests:
         if all_not_found and len(versions) > 0:
             raise saved_not_found
@@ -968,7 +1519,8 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     return ManifestDigest(**digests)
 
 
-def get_manifest_list(image, registry, insecure=False, dockercfg_path=None):
+def get_manifest_list(image, registry, insecure=False, dockercfg_path=None,
+                      registry_session=None):
     """Return manifest list for image.
 
     :param image: ImageName, the remote image to inspect
@@ -976,17 +1528,21 @@ def get_manifest_list(image, registry, insecure=False, dockercfg_path=None):
                           https:// will be used
     :param insecure: bool, when True registry's cert is not verified
     :param dockercfg_path: str, dirname of .dockercfg location
+    :param registry_session: RegistrySession, session to share between calls,
+                             by default a new one is created
 
     :return: response, or None, with manifest list
     """
     version = 'v2_list'
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    if registry_session is None:
+        registry_session = RegistrySession(registry, insecure=insecure,
+                                           dockercfg_path=dockercfg_path)
     response, _ = get_manifest(image, registry_session, version)
     return response
 
 
 def get_config_from_registry(image, registry, digest, insecure=False,
-                             dockercfg_path=None, version='v2'):
+                             dockercfg_path=None, version='v2', registry_session=None):
     """Return image config by digest
 
     :param image: ImageName, the remote image to inspect
@@ -996,10 +1552,14 @@ def get_config_from_registry(image, registry, digest, insecure=False,
     :param insecure: bool, when True registry's cert is not verified
     :param dockercfg_path: str, dirname of .dockercfg location
     :param version: str, which manifest schema versions to fetch digest
+    :param registry_session: RegistrySession, session to share between calls,
+                             by default a new one is created
 
     :return: dict, versions mapped to their digest
     """
-    registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    if registry_session is None:
+        registry_session = RegistrySession(registry, insecure=insecure,
+                                           dockercfg_path=dockercfg_path)
 
     response = query_registry(
         registry_session, image, digest=digest, version=version)
@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Compare throughput of single-threaded gzip/lzma compression (as used by the
+compress plugin by default) with block-parallel compression and zstd (with
+long-distance matching) on a synthetic tarball:
+
+    python -m tests.benchmark_compress [--size-mib 2048] [--threads 4] \
+        [--methods gzip lzma zstd]
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import gzip
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+
+from atomic_reactor.compression import ParallelGzipFile, ParallelXZFile, lzma, open_zstd
+
+CHUNK_SIZE = 1024**2
+
+
+def make_tarball(path, size):
+    """
+    create tarball with layer-like content: a mix of compressible text and
+    incompressible random data
+    """
+    rnd = random.Random(0)
+    words = [bytes(bytearray(rnd.randint(97, 122) for _ in range(rnd.randint(2, 10))))
+             for _ in range(5000)]
+    with tarfile.open(path, 'w') as tar:
+        written = 0
+        index = 0
+        while written < size:
+            file_size = min(64 * CHUNK_SIZE, size - written)
+            if index % 4 == 3:
+                content = os.urandom(file_size)
+            else:
+                content = b' '.join(rnd.choice(words) for _ in range(file_size // 6))
+                content = content[:file_size]
+            info = tarfile.TarInfo('layer{}/layer.tar'.format(index))
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+            written += len(content)
+            index += 1
+
+
+def compress(path, output, opener):
+    start = time.time()
+    with open(path, 'rb') as src, open(output, 'wb') as dst:
+        compressed = opener(dst)
+        shutil.copyfileobj(src, compressed, CHUNK_SIZE)
+        compressed.close()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark image compression')
+    parser.add_argument('--size-mib', type=int, default=2048)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() if hasattr(os, 'cpu_count')
+                        else 4)
+    parser.add_argument('--methods', nargs='+', default=['gzip', 'lzma'])
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tarball = os.path.join(tmpdir, 'image.tar')
+        make_tarball(tarball, args.size_mib * CHUNK_SIZE)
+        size = os.path.getsize(tarball)
+        output = os.path.join(tmpdir, 'image.tar.compressed')
+
+        openers = {
+            'gzip': [
+                ('gzip.GzipFile', lambda f: gzip.GzipFile(output, 'wb', 6, f)),
+                ('ParallelGzipFile', lambda f: ParallelGzipFile(f, 6, args.threads)),
+            ],
+            'lzma': [
+                ('lzma.LZMAFile', lambda f: lzma.LZMAFile(f, 'wb', preset=6)),
+                ('ParallelXZFile', lambda f: ParallelXZFile(f, 6, args.threads)),
+            ],
+            'zstd': [
+                ('zstd level 3', lambda f: open_zstd(f, 3, args.threads)),
+                ('zstd level 9', lambda f: open_zstd(f, 9, args.threads)),
+            ],
+        }
+        print('{0} MiB tarball, {1} threads'.format(size // CHUNK_SIZE, args.threads))
+        for method in args.methods:
+            for name, opener in openers[method]:
+                duration = compress(tarball, output, opener)
+                print('{0:18} {1:8.1f} MiB/s, ratio {2:.3f}'.format(
+                    name, size / duration / CHUNK_SIZE, os.path.getsize(output) / size))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
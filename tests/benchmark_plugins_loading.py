@@ -0,0 +1,135 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Compare time spent loading plugins for typical orchestrator and worker builds:
+every phase runner importing all plugin files (how plugins were loaded before
+the process-wide registry) vs. the shared registry, which imports only modules
+of configured plugins.
+
+Each measurement runs in a fresh interpreter:
+
+    python -m tests.benchmark_plugins_loading [--repeat N]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import imp
+import os
+import subprocess
+import sys
+import time
+
+
+ORCHESTRATOR = {
+    'InputPlugin': ['osv3'],
+    'PreBuildPlugin': ['reactor_config', 'check_and_set_platforms', 'pull_base_image',
+                       'koji_parent', 'bump_release', 'add_labels_in_dockerfile',
+                       'resolve_composes', 'add_filesystem', 'inject_parent_image',
+                       'check_and_set_rebuild'],
+    'BuildStepPlugin': ['orchestrate_build'],
+    'PrePublishPlugin': [],
+    'PostBuildPlugin': ['fetch_worker_metadata', 'compare_components', 'tag_from_config',
+                        'group_manifests'],
+    'ExitPlugin': ['delete_from_registry', 'koji_import', 'koji_tag_build',
+                   'store_metadata_in_osv3', 'sendmail', 'remove_built_image',
+                   'remove_worker_metadata'],
+}
+
+WORKER = {
+    'InputPlugin': ['osv3'],
+    'PreBuildPlugin': ['reactor_config', 'pull_base_image', 'add_labels_in_dockerfile',
+                       'change_from_in_dockerfile', 'add_help', 'add_dockerfile',
+                       'distgit_fetch_artefacts', 'fetch_maven_artifacts', 'add_yum_repo_by_url',
+                       'inject_yum_repo', 'hide_files', 'distribution_scope'],
+    'BuildStepPlugin': ['docker_api'],
+    'PrePublishPlugin': ['squash'],
+    'PostBuildPlugin': ['all_rpm_packages', 'tag_and_push', 'pulp_push', 'pulp_sync',
+                        'compress', 'pulp_pull', 'koji_upload', 'fetch_worker_metadata'],
+    'ExitPlugin': ['pulp_publish', 'store_metadata_in_osv3', 'remove_built_image'],
+}
+
+CONFIGS = {
+    'orchestrator': ORCHESTRATOR,
+    'worker': WORKER,
+}
+
+
+def load_all_plugins(plugin_class_name):
+    """
+    import every plugin file, each time it's called
+    """
+    from atomic_reactor import plugin
+
+    plugin_class = getattr(plugin, plugin_class_name)
+    plugins_dir = os.path.join(os.path.dirname(plugin.__file__), 'plugins')
+    plugin_classes = {}
+    for f in sorted(os.listdir(plugins_dir)):
+        if not f.endswith('.py'):
+            continue
+        module_name = f.rsplit('.', 1)[0]
+        try:
+            module = imp.load_source(module_name, os.path.join(plugins_dir, f))
+        except (IOError, OSError, ImportError, SyntaxError):
+            continue
+        plugin_classes.update(
+            plugin.PluginsRegistry._get_module_plugin_classes(module, plugin_class))
+    return plugin_classes
+
+
+def measure(config_name, method):
+    """
+    load plugins for all phases of a build, like DockerBuildWorkflow does
+
+    :return: float, seconds
+    """
+    start = time.time()
+    from atomic_reactor.plugin import plugins_registry
+
+    for plugin_class_name, plugin_keys in CONFIGS[config_name].items():
+        if method == 'eager':
+            plugin_classes = load_all_plugins(plugin_class_name)
+        else:
+            plugin_classes = plugins_registry.get_plugin_classes(plugin_class_name)
+        for key in plugin_keys:
+            plugin_classes.get(key)
+    return time.time() - start
+
+
+def run_isolated(config_name, method):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'tests.benchmark_plugins_loading',
+         '--measure', config_name, method])
+    return float(output.decode().split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark loading of plugins')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--measure', nargs=2, metavar=('CONFIG', 'METHOD'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # keep plugins' logs out of the output
+        import logging
+        logging.disable(logging.CRITICAL)
+        print(measure(*args.measure))
+        return
+
+    for config_name in sorted(CONFIGS):
+        results = {}
+        for method in ('eager', 'registry'):
+            results[method] = min(run_isolated(config_name, method)
+                                  for _ in range(args.repeat))
+        print('{0:13} all plugins in each runner: {1:.3f}s, registry: {2:.3f}s ({3:.1f}x)'
+              .format(config_name, results['eager'], results['registry'],
+                      results['eager'] / results['registry']))
+
+
+if __name__ == '__main__':
+    main()
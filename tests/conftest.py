@@ -0,0 +1,35 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import pytest
+
+from atomic_reactor.plugin import plugins_registry
+from atomic_reactor.util import checksums_cache
+
+
+@pytest.fixture(autouse=True)
+def reload_plugins():
+    """
+    plugin modules are imported only once per process; make each test import
+    them again, so they pick up functions mocked by the test
+    """
+    plugins_registry.clear_modules()
+    yield
+    plugins_registry.clear_modules()
+
+
+@pytest.fixture(autouse=True)
+def clear_checksums_cache():
+    """
+    don't let tests share checksums of files with reused inodes
+    """
+    checksums_cache.clear()
+    yield
+    checksums_cache.clear()
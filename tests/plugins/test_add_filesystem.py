@@ -105,7 +105,10 @@ def mock_koji_session(koji_proxyuser=None, koji_ssl_certs_dir=None,
     flexmock(util).should_receive('is_scratch_build').and_return(scratch)
     session.should_receive('buildImageOz').replace_with(_mockBuildImageOz)
 
-    session.should_receive('taskFinished').and_return(True)
+    if throws_build_cancelled:
+        session.should_receive('taskFinished').and_raise(BuildCanceledException)
+    else:
+        session.should_receive('taskFinished').and_return(True)
     if image_task_fail:
         session.should_receive('getTaskInfo').and_return({
             'state': koji_util.koji.TASK_STATES['FAILED']
@@ -132,11 +135,6 @@ def mock_koji_session(koji_proxyuser=None, koji_ssl_certs_dir=None,
     session.should_receive('krb_login').and_return(True)
 
     if throws_build_cancelled:
-        task_watcher = flexmock(koji_util.TaskWatcher)
-
-        task_watcher.should_receive('wait').and_raise(BuildCanceledException)
-        task_watcher.should_receive('failed').and_return(True)
-
         cancel_mock_chain = session.should_receive('cancelTask').\
             with_args(FILESYSTEM_TASK_ID).once()
 
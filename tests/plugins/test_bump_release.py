@@ -166,6 +166,10 @@ class TestBumpRelease(object):
         {'actual': '20.1.fc25',
          'builds': ['20.fc25', '20.1.fc25', '21.fc25'],
          'expected': '22.fc25'},
+        # more builds than candidates checked at once
+        {'actual': '1',
+         'builds': [str(release) for release in range(1, 26)],
+         'expected': '26'},
     ])
     def test_increment(self, tmpdir, component, version, next_release,
                        include_target, reactor_config_map):
@@ -230,6 +234,7 @@ class TestBumpRelease(object):
         (None, [], '1.1'),
         (None, ['1.1'], '1.2'),
         (None, ['1.1', '1.2'], '1.3'),
+        ('42', ['42.{}'.format(suffix) for suffix in range(1, 21)], '42.21'),
     ])
     def test_append(self, tmpdir, base_release, builds, expected, reactor_config_map):
 
@@ -1,8 +1,16 @@
+import gzip
+import io
 import os
 import tarfile
 
+try:
+    from backports import lzma
+except ImportError:
+    import lzma
+
 import pytest
 
+from atomic_reactor.compression import COMPRESSION_EXTENSIONS, zstandard
 from atomic_reactor.constants import (EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE,
                                       IMAGE_TYPE_DOCKER_ARCHIVE)
 from atomic_reactor.core import DockerTasker
@@ -39,9 +47,14 @@ class TestCompress(object):
         ('lzma', False, False, 'xz'),
         ('gzip', True, True, 'gz'),
         ('gzip', True, False, 'gz'),
+        pytest.param('zstd', False, False, 'zst',
+                     marks=pytest.mark.skipif(zstandard is None,
+                                              reason='zstandard is not available')),
         ('spam', True, True, None),
     ])
-    def test_compress(self, tmpdir, caplog, method, load_exported_image, give_export, extension):
+    @pytest.mark.parametrize('threads', [1, 2])
+    def test_compress(self, tmpdir, caplog, method, load_exported_image, give_export, extension,
+                      threads):
         if MOCK:
             mock_docker()
 
@@ -64,6 +77,7 @@ class TestCompress(object):
                 'args': {
                     'method': method,
                     'load_exported_image': load_exported_image,
+                    'threads': threads,
                 },
             }]
         )
@@ -86,3 +100,74 @@ class TestCompress(object):
         assert 'uncompressed_size' in metadata
         assert isinstance(metadata['uncompressed_size'], integer_types)
         assert ", ratio: " in caplog.text()
+
+        assert metadata['compression']['method'] == method
+        assert metadata['compression']['ratio'] == (metadata['size'] /
+                                                    float(metadata['uncompressed_size']))
+        assert metadata['compression']['throughput'] > 0
+
+        assert len(decompress(method, compressed_img)) == metadata['uncompressed_size']
+
+    @pytest.mark.parametrize(('candidates', 'min_throughput', 'max_ratio', 'expected'), [
+        ([['gzip', 1], ['lzma', 1]], None, None, 'lzma'),
+        ([['gzip', 1], ['lzma', 1]], 0, 1, 'lzma'),
+        # no candidate meets the targets, the fastest one is used
+        ([['gzip', 1], ['lzma', 1]], 10**9, None, 'gzip'),
+        # zstd is skipped when zstandard is missing
+        ([['zstd', 1], ['lzma', 6]], 10**9, None, 'zstd' if zstandard else 'lzma'),
+    ])
+    @pytest.mark.parametrize('load_exported_image', [True, False])
+    def test_compress_auto(self, tmpdir, candidates, min_throughput, max_ratio, expected,
+                           load_exported_image):
+        if MOCK:
+            mock_docker()
+
+        tasker = DockerTasker()
+        workflow = DockerBuildWorkflow({'provider': 'git', 'uri': 'asd'}, 'test-image')
+        workflow.builder = X()
+        if load_exported_image:
+            exp_img = os.path.join(str(tmpdir), 'img.tar')
+            with tarfile.open(exp_img, mode='w') as tar:
+                content = b'spam and eggs ' * 100000
+                info = tarfile.TarInfo('layer/layer.tar')
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            workflow.exported_image_sequence.append({'path': exp_img,
+                                                     'type': IMAGE_TYPE_DOCKER_ARCHIVE})
+
+        runner = PostBuildPluginsRunner(
+            tasker,
+            workflow,
+            [{
+                'name': CompressPlugin.key,
+                'args': {
+                    'method': 'auto',
+                    'load_exported_image': load_exported_image,
+                    # sample only a part of the image
+                    'auto_sample_size': 0.5,
+                    'auto_candidates': candidates,
+                    'min_throughput': min_throughput,
+                    'max_ratio': max_ratio,
+                },
+            }]
+        )
+        runner.run()
+
+        metadata = workflow.exported_image_sequence[-1]
+        assert metadata['compression']['method'] == expected
+        assert metadata['path'].endswith('.tar.' + COMPRESSION_EXTENSIONS[expected])
+        content = decompress(expected, metadata['path'])
+        assert len(content) == metadata['uncompressed_size']
+        if load_exported_image:
+            with open(exp_img, 'rb') as f:
+                assert content == f.read()
+            assert metadata['layers'][0]['id'] == 'layer'
+
+
+def decompress(method, path):
+    with open(path, 'rb') as f:
+        if method == 'zstd':
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+        if method == 'gzip':
+            return gzip.GzipFile(fileobj=f).read()
+        return lzma.LZMAFile(f).read()
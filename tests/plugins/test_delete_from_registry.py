@@ -29,6 +29,7 @@ import os
 import json
 import requests
 import requests.auth
+import time
 
 if MOCK:
     from tests.docker_mock import mock_docker
@@ -278,3 +279,80 @@ def test_delete_from_registry_failures(tmpdir, status_code, reactor_config_map):
             assert result[DeleteFromRegistryPlugin.key] == deleted_digests
         else:
             assert result[DeleteFromRegistryPlugin.key] == set([])
+
+
+@pytest.mark.parametrize('list_status', [202, 520])
+def test_delete_from_registry_concurrent(tmpdir, list_status):
+    if MOCK:
+        mock_docker()
+        mock_get_retry_session()
+
+    tasker = DockerTasker()
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE)
+    setattr(workflow, 'builder', X)
+
+    # worker and orchestrator repositories share digests
+    ann_digests = [
+        {'digest': DIGEST1, 'tag': 'latest', 'repository': 'foo/bar', 'registry': DOCKER0_REGISTRY},
+        {'digest': DIGEST1, 'tag': '1.0', 'repository': 'foo/bar', 'registry': DOCKER0_REGISTRY},
+        {'digest': DIGEST2, 'tag': 'latest', 'repository': 'foo/bar', 'registry': DOCKER0_REGISTRY},
+        {'digest': DIGEST2, 'tag': 'latest', 'repository': 'foo/baz', 'registry': DOCKER0_REGISTRY},
+    ]
+    setattr(workflow, 'build_result', Y)
+    setattr(workflow.build_result, 'annotations',
+            {'worker-builds': {'x86_64': {'digests': ann_digests}}})
+    workflow.postbuild_results[PLUGIN_GROUP_MANIFESTS_KEY] = {
+        'foo/bar': ManifestDigest(v2_list=DIGEST_LIST),
+    }
+    r = DockerRegistry(DOCKER0_REGISTRY)
+    r.digests['foo/bar:latest'] = ManifestDigest(v2_list=DIGEST_LIST)
+    r.digests['foo/bar:1.0'] = ManifestDigest(v2_list=DIGEST_LIST)
+    workflow.push_conf._registries['docker'].append(r)
+
+    base = 'https://' + DOCKER0_REGISTRY + '/v2/'
+    list_url = base + 'foo/bar/manifests/' + DIGEST_LIST
+    statuses = {
+        list_url: [list_status],
+        base + 'foo/bar/manifests/' + DIGEST1: [429, 202],
+        base + 'foo/bar/manifests/' + DIGEST2: [404],
+        base + 'foo/baz/manifests/' + DIGEST2: [405],
+    }
+    deleted_urls = []
+
+    def delete(url, **kwargs):
+        if url != list_url:
+            # manifest list is deleted first
+            assert list_url in deleted_urls
+        deleted_urls.append(url)
+        response = requests.Response()
+        response.status_code = statuses[url].pop(0)
+        return response
+
+    flexmock(requests.Session).should_receive('delete').replace_with(delete)
+    sleeps = []
+    flexmock(time).should_receive('sleep').replace_with(sleeps.append)
+
+    runner = ExitPluginsRunner(tasker, workflow, [{
+        'name': DeleteFromRegistryPlugin.key,
+        'args': {
+            'registries': {DOCKER0_REGISTRY: {}},
+            'delete_threads': 2,
+            'delete_retry_delay': 4,
+        },
+    }])
+    if list_status != 202:
+        with pytest.raises(PluginFailedException):
+            runner.run()
+        # manifests still in the manifest list are kept, the others are deleted
+        assert sorted(deleted_urls) == sorted([list_url, base + 'foo/baz/manifests/' + DIGEST2])
+        return
+
+    result = runner.run()
+
+    assert result[DeleteFromRegistryPlugin.key] == {DIGEST_LIST, DIGEST1}
+    assert sorted(deleted_urls) == sorted(list(statuses) + [base + 'foo/bar/manifests/' +
+                                                            DIGEST1])
+    assert all(not s for s in statuses.values())
+    assert len(sleeps) == 1
+    assert 2 <= sleeps[0] <= 6
+    assert not workflow.push_conf.docker_registries
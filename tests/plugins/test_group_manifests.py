@@ -603,3 +603,53 @@ def test_group_manifests(tmpdir, test_name,
         with pytest.raises(PluginFailedException) as ex:
             runner.run()
         assert expected_exception in str(ex)
+
+
+@pytest.mark.parametrize(('group', 'present', 'expected_mounts'), [
+    # each blob is linked into the target repository once, for all tags
+    (True, [], 4),
+    (False, [], 2),
+    # blobs already in the target repository are not linked
+    (True, ['layer-x86_64', 'config-ppc64le'], 2),
+    (False, ['layer-x86_64', 'config-x86_64'], 0),
+])
+@pytest.mark.parametrize('registry_threads', [1, 4])
+@responses.activate
+def test_group_manifests_link_blobs_once(tmpdir, group, present, expected_mounts,
+                                         registry_threads):
+    if MOCK:
+        mock_docker()
+
+    workers = {
+        'x86_64': {REGISTRY_V2: ['worker-build:worker-build-x86_64-latest']},
+    }
+    if group:
+        workers['ppc64le'] = {REGISTRY_V2: ['worker-build:worker-build-ppc64le-latest']}
+    registry_conf = {REGISTRY_V2: {'version': 'v2', 'insecure': True}}
+    test_images = ['namespace/httpd:2.4', 'namespace/httpd:latest', 'namespace/httpd:1']
+
+    mocked_registries, annotations = mock_registries(registry_conf, workers)
+    for blob in present:
+        mocked_registries[REGISTRY_V2].add_blob('namespace/httpd', blob)
+    tasker, workflow = mock_environment(tmpdir, primary_images=test_images,
+                                        annotations=annotations)
+
+    plugins_conf = [{
+        'name': GroupManifestsPlugin.key,
+        'args': {
+            'registries': registry_conf,
+            'group': group,
+            'goarch': {'ppc64le': 'powerpc', 'x86_64': 'amd64'},
+            'registry_threads': registry_threads,
+        },
+    }]
+    PostBuildPluginsRunner(tasker, workflow, plugins_conf).run()
+
+    mounts = [call for call in responses.calls if call.request.method == 'POST']
+    assert len(mounts) == expected_mounts
+    registry = mocked_registries[REGISTRY_V2]
+    for platform in workers:
+        for blob in ('layer-' + platform, 'config-' + platform):
+            assert registry.get_blob('namespace/httpd', make_digest(blob)) == blob
+    for image in test_images:
+        assert image.split(':')[1] in registry.get_repo('namespace/httpd')['tags']
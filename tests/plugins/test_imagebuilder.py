@@ -20,7 +20,7 @@ from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.constants import INSPECT_ROOTFS, INSPECT_ROOTFS_LAYERS
 
 from flexmock import flexmock
-from six import StringIO
+from six import BytesIO, StringIO
 import pytest
 from tests.constants import MOCK_SOURCE
 
@@ -30,7 +30,7 @@ class MockDocker(object):
         return []
 
     def get_image(self, image_id):
-        return flexmock(data="image data")
+        return BytesIO(b"image data")
 
 
 class MockDockerTasker(object):
@@ -210,6 +210,76 @@ def test_remove_everything():
         ]
 
 
+@pytest.mark.parametrize(('config', 'expected'), [
+    ('', None),
+    ('plugins_concurrency: 4', 4),
+])
+def test_plugins_concurrency(config, expected):
+    plugins_json = {
+        'build_json_dir': 'inputs',
+        'build_type': 'orchestrator',
+        'git_ref': 'test',
+        'git_uri': 'test',
+        'user': 'user',
+        'prebuild_plugins': [{'name': 'before', }],
+    }
+    reactor_config = dedent("""\
+        version: 1
+    """) + config
+
+    mock_env = {
+        'BUILD': '{}',
+        'SOURCE_URI': 'https://github.com/foo/bar.git',
+        'SOURCE_REF': 'master',
+        'OUTPUT_IMAGE': 'asdf:fdsa',
+        'OUTPUT_REGISTRY': 'localhost:5000',
+        'USER_PARAMS': json.dumps(plugins_json),
+        'REACTOR_CONFIG': reactor_config
+    }
+    flexmock(os, environ=mock_env)
+    enable_plugins_configuration(plugins_json)
+
+    plugin = OSv3InputPlugin()
+    assert plugin.run().get('plugins_concurrency') == expected
+
+
+@pytest.mark.parametrize(('option', 'config', 'expected'), [
+    ('plugins_profiling', '', None),
+    ('plugins_profiling', 'plugins_profiling: {}', {}),
+    ('plugins_profiling', 'plugins_profiling: {tracemalloc: 10}', {'tracemalloc': 10}),
+    ('registry_cache', '', None),
+    ('registry_cache', 'registry_cache: {tag_ttl: 0, directory: /var/cache/registry}',
+     {'tag_ttl': 0, 'directory': '/var/cache/registry'}),
+])
+def test_workflow_options(option, config, expected):
+    plugins_json = {
+        'build_json_dir': 'inputs',
+        'build_type': 'orchestrator',
+        'git_ref': 'test',
+        'git_uri': 'test',
+        'user': 'user',
+        'prebuild_plugins': [{'name': 'before', }],
+    }
+    reactor_config = dedent("""\
+        version: 1
+    """) + config
+
+    mock_env = {
+        'BUILD': '{}',
+        'SOURCE_URI': 'https://github.com/foo/bar.git',
+        'SOURCE_REF': 'master',
+        'OUTPUT_IMAGE': 'asdf:fdsa',
+        'OUTPUT_REGISTRY': 'localhost:5000',
+        'USER_PARAMS': json.dumps(plugins_json),
+        'REACTOR_CONFIG': reactor_config
+    }
+    flexmock(os, environ=mock_env)
+    enable_plugins_configuration(plugins_json)
+
+    plugin = OSv3InputPlugin()
+    assert plugin.run().get(option) == expected
+
+
 def test_remove_v1_pulp_and_exit_delete():
     plugins_json = {
         'build_json_dir': 'inputs',
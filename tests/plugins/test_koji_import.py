@@ -200,7 +200,9 @@ def is_string_type(obj):
 
 
 class BuildInfo(object):
-    def __init__(self, help_file=None, help_valid=True, media_types=None, digests=None):
+    def __init__(self, help_file=None, help_valid=True, media_types=None, digests=None,
+                 koji_upload_dir='test-dir'):
+        self.koji_upload_dir = koji_upload_dir
         annotations = {}
         if media_types:
             annotations['media-types'] = json.dumps(media_types)
@@ -1434,6 +1436,35 @@ class TestKojiImport(object):
         else:
             assert reg == set(['docker-registry.example.com:8888'])
 
+    @pytest.mark.parametrize(('koji_upload_dir', 'relpath'), [
+        ('test-dir', None),
+        # speculative duplicate of the worker build was used
+        ('test-dir/x86_64-duplicate', 'x86_64-duplicate'),
+    ])
+    def test_koji_import_worker_upload_dir(self, tmpdir, os_env, koji_upload_dir, relpath,
+                                           reactor_config_map):
+        session = MockedClientSession('')
+        tasker, workflow = mock_environment(tmpdir,
+                                            session=session,
+                                            name='ns/name',
+                                            version='1.0',
+                                            release='1')
+        orchestrate_plugin = workflow.plugin_workspace[OrchestrateBuildPlugin.key]
+        orchestrate_plugin[WORKSPACE_KEY_BUILD_INFO]['x86_64'] = BuildInfo(
+            help_file='help.md', koji_upload_dir=koji_upload_dir)
+        worker_metadata = workflow.postbuild_results[FetchWorkerMetadataPlugin.key]['x86_64']
+        worker_outputs = [output['filename'] for output in worker_metadata['output']]
+        runner = create_runner(tasker, workflow, reactor_config_map=reactor_config_map)
+        runner.run()
+
+        assert session.server_dir == 'test-dir'
+        for output in session.metadata['output']:
+            if output['filename'] in worker_outputs:
+                assert output.get('relpath') == relpath
+            else:
+                # uploaded by the orchestrator
+                assert 'relpath' not in output
+
     def test_koji_import_without_build_info(self, tmpdir, os_env, reactor_config_map):  # noqa
 
         class LegacyCGImport(MockedClientSession):
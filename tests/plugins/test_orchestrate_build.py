@@ -12,10 +12,12 @@ from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import BuildCanceledException, PluginFailedException
 from atomic_reactor.plugin import BuildStepPluginsRunner
+from atomic_reactor.cluster_scheduling import ClusterHistory
 from atomic_reactor.plugins import pre_reactor_config
 from atomic_reactor.plugins.build_orchestrate_build import (OrchestrateBuildPlugin,
                                                             get_worker_build_info,
                                                             get_koji_upload_dir,
+                                                            get_worker_koji_upload_dir,
                                                             override_build_kwarg)
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfig,
                                                        ReactorConfigPlugin,
@@ -26,6 +28,7 @@ import atomic_reactor.util
 from atomic_reactor.constants import PLUGIN_ADD_FILESYSTEM_KEY, PLUGIN_CHECK_AND_SET_PLATFORMS_KEY
 from flexmock import flexmock
 from multiprocessing.pool import AsyncResult
+import osbs.api
 from osbs.api import OSBS
 from osbs.conf import Configuration
 from osbs.build.build_response import BuildResponse
@@ -223,11 +226,42 @@ def mock_osbs(current_builds=2, worker_builds=1, logs_return_bytes=False, worker
         .should_receive('get_build_logs')
         .and_yield(log_format_string % line for line in range(10)))
 
-    def mock_wait_for_build_to_finish(build_name):
+    def mock_get_build(build_name):
         return make_build_response(build_name, 'Complete')
     (flexmock(OSBS)
-        .should_receive('wait_for_build_to_finish')
-        .replace_with(mock_wait_for_build_to_finish))
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
+
+
+def mock_osbs_class(monkeypatch, list_builds=None, create_worker_build=None):
+    """
+    make the plugin use OSBS subclass which remembers its instances and
+    calls list_builds(cluster_url) instead of OSBS.list_builds and
+    create_worker_build(cluster_url, **kwargs) instead of
+    OSBS.create_worker_build, if given
+
+    :return: list, created OSBS instances
+    """
+    clients = []
+
+    class ClusterOSBS(OSBS):
+        def __init__(self, *args, **kwargs):
+            super(ClusterOSBS, self).__init__(*args, **kwargs)
+            clients.append(self)
+
+        def list_builds(self, **kwargs):
+            if not list_builds:
+                return super(ClusterOSBS, self).list_builds(**kwargs)
+            return list_builds(self.build_conf.get_openshift_base_uri())
+
+        def create_worker_build(self, **kwargs):
+            if not create_worker_build:
+                return super(ClusterOSBS, self).create_worker_build(**kwargs)
+            return create_worker_build(self.build_conf.get_openshift_base_uri(), **kwargs)
+
+    # plugin module is imported again by each test
+    monkeypatch.setattr(osbs.api, 'OSBS', ClusterOSBS)
+    return clients
 
 
 def make_build_response(name, status, annotations=None, labels=None):
@@ -463,7 +497,7 @@ def test_orchestrate_build_annotations_and_labels(tmpdir, metadata_fragment):
         'metadata_fragment_key': 'metadata.json'
     }
 
-    def mock_wait_for_build_to_finish(build_name):
+    def mock_get_build(build_name):
         annotations = {
             'repositories': json.dumps({
                 'unique': ['{}-unique'.format(build_name)],
@@ -484,8 +518,8 @@ def test_orchestrate_build_annotations_and_labels(tmpdir, metadata_fragment):
         labels = {'koji-build-id': 'koji-build-id'}
         return make_build_response(build_name, 'Complete', annotations, labels)
     (flexmock(OSBS)
-        .should_receive('wait_for_build_to_finish')
-        .replace_with(mock_wait_for_build_to_finish))
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
 
     mock_reactor_config(tmpdir)
     runner = BuildStepPluginsRunner(
@@ -672,11 +706,11 @@ def test_orchestrate_build_cancelation(tmpdir):
         }]
     )
 
-    def mock_wait_for_build_to_finish(build_name):
+    def mock_get_build(build_name):
         return make_build_response(build_name, 'Running')
     (flexmock(OSBS)
-        .should_receive('wait_for_build_to_finish')
-        .replace_with(mock_wait_for_build_to_finish))
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
 
     flexmock(OSBS).should_receive('cancel_build').once()
 
@@ -709,6 +743,297 @@ def test_orchestrate_build_cancelation(tmpdir):
     assert 'BuildCanceledException' in str(exc)
 
 
+@pytest.mark.parametrize('fail_fast', [True, False])
+def test_orchestrate_build_fail_fast(tmpdir, fail_fast):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir)
+
+    status = {'worker-build-x86_64': ['Running'] * 3 + ['Complete'],
+              'worker-build-ppc64le': ['Failed']}
+
+    def mock_get_build(build_name):
+        phases = status[build_name]
+        return make_build_response(build_name, phases.pop(0) if len(phases) > 1 else phases[0])
+    (flexmock(OSBS)
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
+
+    (flexmock(OSBS)
+        .should_receive('get_pod_for_build')
+        .and_raise(OsbsException()))
+
+    def mock_cancel_build(build_name):
+        status[build_name] = ['Cancelled']
+    (flexmock(OSBS)
+        .should_receive('cancel_build')
+        .replace_with(mock_cancel_build)
+        .times(1 if fail_fast else 0))
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64', 'ppc64le'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'goarch': {'x86_64': 'amd64'},
+                'monitor_interval': .01,
+                'fail_fast': fail_fast,
+            }
+        }]
+    )
+
+    build_result = runner.run()
+    assert build_result.is_failed()
+    fail_reason = json.loads(build_result.fail_reason)
+    if fail_fast:
+        assert set(fail_reason) == {'x86_64', 'ppc64le'}
+        assert 'worker build for platform ppc64le failed' in fail_reason['x86_64']['general']
+    else:
+        assert set(fail_reason) == {'ppc64le'}
+
+
+def test_orchestrate_build_cancelation_while_monitoring(tmpdir):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir)
+
+    def mock_get_build(build_name):
+        return make_build_response(build_name, 'Running')
+    (flexmock(OSBS)
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
+    # worker builds of both platforms are cancelled
+    flexmock(OSBS).should_receive('cancel_build').twice()
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64', 'ppc64le'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'goarch': {'x86_64': 'amd64'},
+                'monitor_interval': 42,
+            }
+        }]
+    )
+
+    # orchestrator build cancelled while waiting for worker builds
+    def mock_sleep(seconds):
+        if seconds == 42:
+            raise BuildCanceledException()
+    flexmock(time).should_receive('sleep').replace_with(mock_sleep)
+
+    with pytest.raises(PluginFailedException) as exc:
+        runner.run()
+    assert 'BuildCanceledException' in str(exc)
+
+
+@pytest.mark.parametrize(('straggler_args', 'logs', 'chosen'), [
+    ({}, None, 'spam'),
+    # build on spam is much slower than usual
+    ({'straggler_factor': 2}, None, 'eggs'),
+    # build on spam doesn't log anything
+    ({'straggler_log_timeout': .05}, None, 'eggs'),
+    # logs of build on spam can't be watched, they don't tell it is straggling
+    ({'straggler_log_timeout': .05}, 'ended', 'spam'),
+    # duplicate build fails, original one is used
+    ({'straggler_factor': 2}, None, 'spam'),
+    # build on spam gets to pushing its outputs, duplicate is cancelled
+    ({'straggler_factor': 2}, 'publishing', 'spam'),
+    # publishing of either build wouldn't be noticed without logs, duplicate is cancelled
+    ({'straggler_factor': 2}, 'lost', 'spam'),
+    ({'straggler_factor': 2}, 'lost duplicate', 'spam'),
+])
+def test_orchestrate_build_straggler(tmpdir, monkeypatch, straggler_args, logs, chosen):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir, {
+        'x86_64': [
+            {'name': 'spam', 'max_concurrent_builds': 5},
+            {'name': 'eggs', 'max_concurrent_builds': 5},
+        ],
+    })
+
+    history_path = str(tmpdir.join('cluster-history.json'))
+    ClusterHistory(history_path).record_build('spam', 'x86_64', .01, True)
+
+    koji_upload_dirs = {}
+
+    def mock_create_worker_build(cluster_url, **kwargs):
+        build_name = cluster_url.split('/')[2]
+        koji_upload_dirs[build_name] = kwargs['koji_upload_dir']
+        return make_build_response(build_name, 'Running')
+    mock_osbs_class(monkeypatch, create_worker_build=mock_create_worker_build)
+
+    if logs == 'publishing':
+        status = {'spam.com': ['Running'], 'eggs.com': ['Running']}
+    elif logs in ('lost', 'lost duplicate'):
+        status = {'spam.com': ['Running'] * 10 + ['Complete'], 'eggs.com': ['Running']}
+    elif chosen == 'spam':
+        status = {'spam.com': ['Running'] * 10 + ['Complete'], 'eggs.com': ['Failed']}
+    else:
+        status = {'spam.com': ['Running'], 'eggs.com': ['Complete']}
+
+    def publishing_logs():
+        while 'eggs.com' not in koji_upload_dirs:
+            time.sleep(.01)
+        yield 'initializing runner of post-build plugins'
+        status['spam.com'] = ['Complete']
+
+    def lost_logs():
+        while 'eggs.com' not in koji_upload_dirs:
+            time.sleep(.01)
+        return
+        yield
+
+    def mock_get_build_logs(build_name, **kwargs):
+        if logs == 'ended':
+            return iter([])
+        if logs == 'publishing' and build_name == 'spam.com':
+            return publishing_logs()
+        if logs == 'lost' and build_name == 'spam.com':
+            return lost_logs()
+        if logs == 'lost duplicate' and build_name == 'eggs.com':
+            return iter([])
+        # logs are followed until the build finishes
+        while status[build_name][0] == 'Running':
+            time.sleep(.01)
+        return iter([])
+    (flexmock(OSBS)
+        .should_receive('get_build_logs')
+        .replace_with(mock_get_build_logs))
+
+    def mock_get_build(build_name):
+        phases = status[build_name]
+        return make_build_response(build_name, phases.pop(0) if len(phases) > 1 else phases[0])
+    (flexmock(OSBS)
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
+    (flexmock(OSBS)
+        .should_receive('get_pod_for_build')
+        .and_raise(OsbsException()))
+
+    def mock_cancel_build(build_name):
+        assert build_name == ('eggs.com' if chosen == 'spam' else 'spam.com')
+        if logs in ('lost', 'lost duplicate'):
+            # not because the original build finished
+            assert status['spam.com'] != ['Complete']
+        status[build_name] = ['Cancelled']
+    (flexmock(OSBS)
+        .should_receive('cancel_build')
+        .replace_with(mock_cancel_build)
+        .times(1 if chosen == 'eggs' or logs in ('publishing', 'lost', 'lost duplicate')
+               else 0))
+
+    args = {
+        'platforms': ['x86_64'],
+        'build_kwargs': make_worker_build_kwargs(),
+        'osbs_client_config': str(tmpdir),
+        'goarch': {'x86_64': 'amd64'},
+        'monitor_interval': .01,
+        'cluster_history': history_path,
+    }
+    args.update(straggler_args)
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': args,
+        }]
+    )
+
+    build_result = runner.run()
+    assert not build_result.is_failed()
+    annotations = build_result.annotations['worker-builds']['x86_64']
+    assert annotations['build']['cluster-url'] == 'https://{}.com/'.format(chosen)
+    assert get_worker_build_info(workflow, 'x86_64').name == '{}.com'.format(chosen)
+    # duplicate doesn't upload over outputs of the original build
+    assert len(set(koji_upload_dirs.values())) == len(koji_upload_dirs)
+    assert (get_worker_koji_upload_dir(workflow, 'x86_64') ==
+            koji_upload_dirs['{}.com'.format(chosen)])
+
+
+def test_orchestrate_build_cancelation_with_straggler(tmpdir, monkeypatch):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir, {
+        'x86_64': [
+            {'name': 'spam', 'max_concurrent_builds': 5},
+            {'name': 'eggs', 'max_concurrent_builds': 5},
+        ],
+    })
+
+    history_path = str(tmpdir.join('cluster-history.json'))
+    ClusterHistory(history_path).record_build('spam', 'x86_64', .01, True)
+
+    created = []
+
+    def mock_create_worker_build(cluster_url, **kwargs):
+        build_name = cluster_url.split('/')[2]
+        created.append(build_name)
+        return make_build_response(build_name, 'Running')
+    mock_osbs_class(monkeypatch, create_worker_build=mock_create_worker_build)
+    (flexmock(OSBS)
+        .should_receive('get_build')
+        .replace_with(lambda build_name: make_build_response(build_name, 'Running')))
+    cancelled = []
+    (flexmock(OSBS)
+        .should_receive('cancel_build')
+        .replace_with(cancelled.append))
+    real_sleep = time.sleep
+
+    def mock_get_build_logs(build_name, **kwargs):
+        # logs are followed until the build is cancelled
+        while build_name not in cancelled:
+            real_sleep(.01)
+            yield 'running'
+    (flexmock(OSBS)
+        .should_receive('get_build_logs')
+        .replace_with(mock_get_build_logs))
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'goarch': {'x86_64': 'amd64'},
+                'monitor_interval': .01,
+                'cluster_history': history_path,
+                'straggler_factor': 2,
+            }
+        }]
+    )
+
+    # orchestrator build cancelled while the duplicate is running
+    def mock_sleep(seconds):
+        if 'eggs.com' in created:
+            raise BuildCanceledException()
+        real_sleep(seconds)
+    flexmock(time).should_receive('sleep').replace_with(mock_sleep)
+
+    with pytest.raises(PluginFailedException) as exc:
+        runner.run()
+    assert 'BuildCanceledException' in str(exc)
+    # both the straggling build and its duplicate are cancelled
+    assert sorted(cancelled) == ['eggs.com', 'spam.com']
+
+
 @pytest.mark.parametrize(('clusters_x86_64'), (
     ([('chosen_x86_64', 5), ('spam', 4)]),
     ([('chosen_x86_64', 5000), ('spam', 4)]),
@@ -903,6 +1228,8 @@ def test_orchestrate_build_unknown_platform(tmpdir, reactor_config_map):  # noqa
     mock_manifest_list()
     if reactor_config_map:
         mock_reactor_config(tmpdir)
+        # build started for x86_64 is cancelled
+        flexmock(OSBS).should_receive('cancel_build').once()
     else:
         mock_reactor_config(tmpdir, clusters={}, empty=True)
 
@@ -1038,13 +1365,13 @@ def test_orchestrate_build_failed_waiting(tmpdir,
 
             return self.pod_failure_reason
 
-    def mock_wait_for_build_to_finish(build_name):
+    def mock_get_build(build_name):
         if build_name == 'worker-build-ppc64le':
             raise OsbsException('it happens')
         return make_build_response(build_name, 'Failed')
     (flexmock(OSBS)
-     .should_receive('wait_for_build_to_finish')
-     .replace_with(mock_wait_for_build_to_finish))
+     .should_receive('get_build')
+     .replace_with(mock_get_build))
     mock_manifest_list()
 
     cancel_build_expectation = flexmock(OSBS).should_receive('cancel_build')
@@ -1127,7 +1454,7 @@ def test_orchestrate_build_get_fs_task_id(tmpdir, task_id, error):
 
 
 @pytest.mark.parametrize('fail_at', ('all', 'first'))
-def test_orchestrate_build_failed_to_list_builds(tmpdir, fail_at):
+def test_orchestrate_build_failed_to_list_builds(tmpdir, monkeypatch, fail_at):
     workflow = mock_workflow(tmpdir)
     mock_osbs()  # Current builds is a constant 2
 
@@ -1144,7 +1471,12 @@ def test_orchestrate_build_failed_to_list_builds(tmpdir, fail_at):
         flexmock_chain.and_raise(OsbsException("foo"))
 
     if fail_at == 'first':
-        flexmock_chain.and_return(['a', 'b'])
+        # clusters are queried concurrently, fail only the preferred one
+        def list_builds(cluster_url):
+            if cluster_url == 'https://spam.com/':
+                raise OsbsException("foo")
+            return ['a', 'b']
+        mock_osbs_class(monkeypatch, list_builds)
 
     if fail_at == 'build_canceled':
         flexmock_chain.and_raise(OsbsException(cause=BuildCanceledException()))
@@ -1179,6 +1511,126 @@ def test_orchestrate_build_failed_to_list_builds(tmpdir, fail_at):
             assert 'BuildCanceledException()' in str(exc)  # noqa F821
 
 
+@pytest.mark.parametrize(('cluster_load_ttl', 'list_builds_calls'), [
+    (60, 3),
+    # build on the first cluster failed to start, another one is queried again
+    (0, 4),
+])
+def test_orchestrate_build_cluster_load_cache(tmpdir, monkeypatch, cluster_load_ttl,
+                                              list_builds_calls):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+
+    mock_reactor_config(tmpdir, {
+        'x86_64': [
+            {'name': 'spam', 'max_concurrent_builds': 5},
+            {'name': 'eggs', 'max_concurrent_builds': 5},
+        ],
+        'ppc64le': [
+            {'name': 'ham', 'max_concurrent_builds': 5},
+        ],
+    })
+
+    list_builds = []
+
+    def mock_list_builds(cluster_url):
+        list_builds.append(cluster_url)
+        return ['a', 'b']
+    clients = mock_osbs_class(monkeypatch, mock_list_builds)
+
+    created = []
+
+    def mock_create_worker_build(**kwargs):
+        created.append(kwargs['platform'])
+        if len(created) == 1:
+            raise OsbsException('it happens')
+        return make_build_response('worker-build-{}'.format(kwargs['platform']), 'Running')
+    (flexmock(OSBS)
+        .should_receive('create_worker_build')
+        .replace_with(mock_create_worker_build))
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64', 'ppc64le'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'failure_retry_delay': .1,
+                'cluster_load_ttl': cluster_load_ttl,
+                'goarch': {'x86_64': 'amd64'},
+            }
+        }]
+    )
+
+    build_result = runner.run()
+    assert not build_result.is_failed()
+    assert set(build_result.annotations['worker-builds']) == {'x86_64', 'ppc64le'}
+    assert len(list_builds) == list_builds_calls
+    # one client per cluster and platform
+    assert len(clients) == 3
+
+
+@pytest.mark.parametrize(('scheduling_policy', 'chosen'), [
+    ('load', 'spam'),
+    # eggs is busier, but builds there are faster
+    ('history', 'eggs'),
+])
+def test_orchestrate_build_scheduling_policy(tmpdir, scheduling_policy, chosen):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+
+    mock_reactor_config(tmpdir, {
+        'x86_64': [
+            {'name': 'spam', 'max_concurrent_builds': 10},
+            {'name': 'eggs', 'max_concurrent_builds': 5},
+        ],
+    })
+
+    history_path = str(tmpdir.join('cluster-history.json'))
+    history = ClusterHistory(history_path)
+    history.record_build('spam', 'x86_64', 1800, True)
+    history.record_build('eggs', 'x86_64', 600, True)
+
+    def mock_get_build(build_name):
+        plugins_metadata = {'durations': {'spam': 500, 'eggs': 100}}
+        return make_build_response(build_name, 'Complete', annotations={
+            'plugins-metadata': json.dumps(plugins_metadata),
+        })
+    (flexmock(OSBS)
+        .should_receive('get_build')
+        .replace_with(mock_get_build))
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'scheduling_policy': scheduling_policy,
+                'cluster_history': history_path,
+            }
+        }]
+    )
+
+    build_result = runner.run()
+    assert not build_result.is_failed()
+    cluster_url = build_result.annotations['worker-builds']['x86_64']['build']['cluster-url']
+    assert cluster_url == 'https://{}.com/'.format(chosen)
+
+    # worker build is recorded, with duration of its plugins
+    stats = ClusterHistory(history_path).get_stats(chosen, 'x86_64')
+    assert stats['builds'] == 2
+    assert stats['duration'] == (1800 if chosen == 'spam' else 600) / 2 + 300
+
+
 @pytest.mark.parametrize('is_auto', [
     True,
     False
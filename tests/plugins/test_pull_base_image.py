@@ -12,6 +12,7 @@ import docker
 import flexmock
 import json
 import pytest
+import responses
 import atomic_reactor
 import atomic_reactor.util
 
@@ -123,7 +124,7 @@ def set_build_json(monkeypatch):
 ])
 def test_pull_base_image_plugin(parent_registry, df_base, expected, not_expected,
                                 reactor_config_map, workflow_callback=None,
-                                check_platforms=False, parent_images=None):
+                                check_platforms=False, parent_images=None, pull_threads=None):
     if MOCK:
         mock_docker(remember_images=True)
 
@@ -155,14 +156,17 @@ def test_pull_base_image_plugin(parent_registry, df_base, expected, not_expected
     if workflow_callback:
         workflow = workflow_callback(workflow)
 
+    plugin_args = {'parent_registry': parent_registry,
+                   'parent_registry_insecure': True,
+                   'check_platforms': check_platforms}
+    if pull_threads is not None:
+        plugin_args['pull_threads'] = pull_threads
     runner = PreBuildPluginsRunner(
         tasker,
         workflow,
         [{
             'name': PullBaseImagePlugin.key,
-            'args': {'parent_registry': parent_registry,
-                     'parent_registry_insecure': True,
-                     'check_platforms': check_platforms}
+            'args': plugin_args,
         }]
     )
 
@@ -203,6 +207,81 @@ def test_pull_parent_images(reactor_config_map):  # noqa
         parent_images=parent_images)
 
 
+@pytest.mark.parametrize('pull_threads', [1, 3])
+def test_pull_parent_images_concurrently(reactor_config_map, pull_threads):  # noqa
+    parent_images = {BASE_IMAGE: None, "builder:image": None, "other:image": None}
+    test_pull_base_image_plugin(
+        None, BASE_IMAGE,
+        [BASE_IMAGE, "builder:image", "other:image"],
+        [],
+        reactor_config_map=reactor_config_map,
+        parent_images=parent_images,
+        pull_threads=pull_threads)
+
+    if not reactor_config_map:
+        # parents are tagged in sorted order, however they are pulled
+        assert parent_images == {
+            "builder:image": UNIQUE_ID + ':0',
+            BASE_IMAGE: UNIQUE_ID + ':1',
+            "other:image": UNIQUE_ID + ':2',
+        }
+
+
+@pytest.mark.parametrize(('local_digests', 'pulled'), [
+    # manifest list digest, as recorded by docker when pulling through the list
+    (['sha256:list'], False),
+    (['sha256:other'], True),
+    ([], True),
+])
+@responses.activate
+def test_pull_base_image_local_cache(local_digests, pulled):
+    if MOCK:
+        mock_docker()
+
+    url = 'https://{}/v2/busybox/manifests/latest'.format(LOCALHOST_REGISTRY)
+    responses.add(responses.HEAD, url,
+                  content_type='application/vnd.docker.distribution.manifest.list.v2+json',
+                  headers={'Docker-Content-Digest': 'sha256:list'})
+
+    tasker = DockerTasker(retry_times=0)
+    workflow = DockerBuildWorkflow(MOCK_SOURCE, 'test-image')
+    builder = workflow.builder = MockBuilder()
+    builder.base_image = builder.original_base_image = ImageName.parse(BASE_IMAGE)
+    builder.parent_images = {BASE_IMAGE: None}
+
+    pinned = LOCALHOST_REGISTRY + '/busybox@sha256:list'
+    (flexmock(tasker)
+     .should_receive('get_image_ids_by_repo_digest')
+     .and_return({LOCALHOST_REGISTRY + '/busybox@' + digest: 'image-id'
+                  for digest in local_digests})
+     .once())
+    (flexmock(tasker)
+     .should_receive('pull_image')
+     .with_args(ImageName.parse(pinned), insecure=True)
+     .times(1 if pulled else 0))
+    (flexmock(tasker)
+     .should_receive('tag_image')
+     .with_args(ImageName.parse(pinned), ImageName(repo=UNIQUE_ID, tag='0'))
+     .and_return(UNIQUE_ID + ':0')
+     .once())
+
+    runner = PreBuildPluginsRunner(tasker, workflow, [{
+        'name': PullBaseImagePlugin.key,
+        'args': {'parent_registry': LOCALHOST_REGISTRY,
+                 'parent_registry_insecure': True,
+                 'local_cache': True},
+    }])
+    results = runner.run()
+
+    assert results[PullBaseImagePlugin.key] == {
+        'hits': [] if pulled else [pinned],
+        'misses': [pinned] if pulled else [],
+    }
+    assert builder.parent_images == {BASE_IMAGE: UNIQUE_ID + ':0'}
+    # image is left on the node for later builds, only the unique tag is removed
+    assert workflow.pulled_base_images == {UNIQUE_ID + ':0'}
+
+
 def test_pull_base_wrong_registry(reactor_config_map):  # noqa
     with pytest.raises(PluginFailedException) as exc:
         test_pull_base_image_plugin(
@@ -505,7 +584,8 @@ class TestValidateBaseImage(object):
             manifest_image = base_image_result.copy()
             (flexmock(atomic_reactor.util)
              .should_receive('get_manifest_list')
-             .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True)
+             .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True,
+                        registry_session=object)
              .and_return(None)
              .once())
             return workflow
@@ -546,13 +626,15 @@ class TestValidateBaseImage(object):
             if sha_is_manifest_list:
                 (flexmock(atomic_reactor.util)
                  .should_receive('get_manifest_list')
-                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True)
+                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True,
+                            registry_session=object)
                  .and_return(flexmock(json=lambda: manifest_list))
                  .once())
             else:
                 (flexmock(atomic_reactor.util)
                  .should_receive('get_manifest_list')
-                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True)
+                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True,
+                            registry_session=object)
                  .and_return(None)
                  .once()
                  .ordered())
@@ -565,7 +647,8 @@ class TestValidateBaseImage(object):
                 manifest_image = base_image_result.copy()
                 (flexmock(atomic_reactor.util)
                  .should_receive('get_manifest_list')
-                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True)
+                 .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True,
+                            registry_session=object)
                  .and_return(flexmock(json=lambda: manifest_list))
                  .once()
                  .ordered())
@@ -600,7 +683,8 @@ class TestValidateBaseImage(object):
 
             (flexmock(atomic_reactor.util)
              .should_receive('get_manifest_list')
-             .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True)
+             .with_args(image=manifest_image, registry=manifest_image.registry, insecure=True,
+                        registry_session=object)
              .and_return(flexmock(json=lambda: manifest_list))
              .once())
             return workflow
@@ -8,9 +8,13 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals
 
+import io
 import os
 import sys
+import tarfile
 
+from atomic_reactor import compression
+from atomic_reactor.compression import open_compressor
 from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import PostBuildPluginsRunner
@@ -28,7 +32,7 @@ try:
 except (ImportError):
     dockpulp = None
 
-import subprocess
+import tempfile
 
 import pytest
 from flexmock import flexmock
@@ -46,7 +50,7 @@ class X(object):
 
 
 def prepare(check_repo_retval=0, existing_layers=[],
-            subprocess_exceptions=False,
+            repack_exceptions=False,
             conf=None, unsupported=False):
     if MOCK:
         mock_docker()
@@ -143,10 +147,10 @@ def prepare(check_repo_retval=0, existing_layers=[],
         (flexmock(dockpulp.Pulp).should_receive('getImageIdsExist')
          .with_args(list)
          .and_return(existing_layers))
-    if subprocess_exceptions:
-        (flexmock(subprocess)
-         .should_receive("check_call")
-         .and_raise(Exception))
+    if repack_exceptions:
+        (flexmock(tempfile)
+         .should_receive("mkstemp")
+         .and_raise(OSError))
 
     mock_docker()
     return tasker, workflow
@@ -163,18 +167,18 @@ def prepare(check_repo_retval=0, existing_layers=[],
     (OSError),
     (None)
 ])
-@pytest.mark.parametrize(("existing_layers", "should_raise", "subprocess_exceptions"), [
+@pytest.mark.parametrize(("existing_layers", "should_raise", "repack_exceptions"), [
     (None, True, False),               # mock dockpulp without getImageIdsExist method
     ([], True, False),                 # this will trigger remove dedup layers and pass
-    (['no-such-layer'], True, False),  # no such layer - tar command will fail
-    ([], True, True),                  # all subprocess.check_call will fail
+    (['no-such-layer'], True, False),  # no such layer - nothing is removed
+    ([], True, True),                  # repacking the tar will fail
 ])
 def test_pulp_dedup_layers(unsupported, unlink_exc, tmpdir, existing_layers, should_raise,
-                           monkeypatch, subprocess_exceptions, reactor_config_map):
+                           monkeypatch, repack_exceptions, reactor_config_map):
     tasker, workflow = prepare(
         check_repo_retval=0,
         existing_layers=existing_layers,
-        subprocess_exceptions=subprocess_exceptions, unsupported=unsupported)
+        repack_exceptions=repack_exceptions, unsupported=unsupported)
     monkeypatch.setenv('SOURCE_SECRET_PATH', str(tmpdir))
     with open(os.path.join(str(tmpdir), "pulp.cer"), "wt") as cer:
         cer.write("pulp certificate\n")
@@ -360,3 +364,115 @@ def test_load_exported_image():
         .once()
     )
     plugin.run()
+
+
+def write_image_archive(path, layers, method=None):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        for layer_id in layers:
+            info = tarfile.TarInfo(os.path.join(layer_id, 'layer.tar'))
+            info.size = 1000
+            tar.addfile(info, io.BytesIO(b'a' * info.size))
+    with open(path, 'wb') as f:
+        if method is None:
+            f.write(archive.getvalue())
+        else:
+            compressor = open_compressor(f, method, 1)
+            compressor.write(archive.getvalue())
+            compressor.close()
+
+
+@pytest.mark.skipif(dockpulp is None,
+                    reason='dockpulp module not available')
+@pytest.mark.parametrize(('method', 'extension'), [
+    (None, '.tar'),
+    ('gzip', '.tar.gz'),
+    ('lzma', '.tar.xz'),
+    ('zstd', '.tar.zst'),
+])
+def test_push_tar_compressed_export(tmpdir, method, extension):
+    if method == 'lzma' and compression.lzma is None:
+        pytest.skip('lzma module not available')
+    if method == 'zstd' and compression.zstandard is None:
+        pytest.skip('zstandard module not available')
+
+    filename = os.path.join(str(tmpdir), 'image' + extension)
+    write_image_archive(filename, ['foo', 'bar'], method)
+
+    tasker, workflow = prepare()
+    plugin = PulpPushPlugin(tasker, workflow, 'test', publish=False)
+    uploaded = []
+
+    def get_tar_metadata(path):
+        # dockpulp reads the archive with tarfile
+        with tarfile.open(path) as tar:
+            tar.getnames()
+        return 'foo', ['foo', 'bar']
+
+    def upload(path, repo_id):
+        uploaded.append(path)
+        with tarfile.open(path, mode='r:gz') as tar:
+            assert tar.getnames() == ['bar/layer.tar']
+        return False
+
+    handler = flexmock(plugin.pulp_handler)
+    handler.should_receive('check_file')
+    (handler.should_receive('create_dockpulp_and_repos')
+     .and_return({'redhat-image-name1': flexmock(registry_id='image-name1',
+                                                tags=['latest'])}))
+    handler.should_receive('get_tar_metadata').replace_with(get_tar_metadata)
+    handler.should_receive('get_image_ids_existing').and_return(['foo'])
+    handler.should_receive('upload').replace_with(upload).once()
+    handler.should_receive('update_repo').once()
+    handler.should_receive('get_registry_hostname').and_return('registry.example.com')
+    handler.should_receive('get_pulp_instance').and_return('test')
+
+    top_layer, _ = plugin.push_tar(filename, workflow.tag_conf.images)
+
+    assert top_layer == 'foo'
+    assert len(uploaded) == 1
+    assert not os.path.exists(uploaded[0])
+    assert os.listdir(str(tmpdir)) == ['image' + extension]
+
+
+@pytest.mark.skipif(dockpulp is None,
+                    reason='dockpulp module not available')
+@pytest.mark.parametrize('extension', ['.tar', '.gz'])
+@pytest.mark.parametrize(('existing', 'removed'), [
+    (['baz'], None),
+    (['foo', 'baz'], ['foo/layer.tar']),
+])
+def test_deduplicate_layers_index(tmpdir, extension, existing, removed):
+    filename = os.path.join(str(tmpdir), 'image.tar')
+    if extension == '.gz':
+        filename += extension
+    write_image_archive(filename, ['foo', 'bar'], 'gzip' if extension == '.gz' else None)
+    layers_index = [{'id': 'foo'}, {'id': 'bar'}]
+
+    tasker, workflow = prepare()
+    plugin = flexmock(PulpPushPlugin(tasker, workflow, 'test'))
+    (flexmock(plugin.pulp_handler)
+     .should_receive('get_image_ids_existing')
+     .and_return(existing))
+
+    if removed is not None:
+        # only layers in the index are removed
+        (plugin.should_receive('_repack')
+         .with_args(filename, extension, 'strip_tar_', removed)
+         .and_return('stripped.tar.gz')
+         .once())
+        assert plugin._deduplicate_layers(['foo', 'bar', 'baz'], filename, extension,
+                                          layers_index) == 'stripped.tar.gz'
+        return
+
+    result = plugin._deduplicate_layers(['foo', 'bar', 'baz'], filename, extension,
+                                        layers_index)
+    if extension == '.gz':
+        # nothing to remove from compressed archive, upload it as it is
+        assert result is None
+    else:
+        try:
+            with tarfile.open(result, mode='r:gz') as tar:
+                assert tar.getnames() == ['foo/layer.tar', 'bar/layer.tar']
+        finally:
+            os.unlink(result)
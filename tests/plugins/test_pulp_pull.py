@@ -12,10 +12,12 @@ from atomic_reactor.constants import (PLUGIN_GROUP_MANIFESTS_KEY,
                                       MEDIA_TYPE_DOCKER_V2_SCHEMA2,
                                       MEDIA_TYPE_DOCKER_V2_MANIFEST_LIST)
 from atomic_reactor.plugin import PostBuildPlugin, ExitPlugin
+from atomic_reactor.plugins import post_pulp_pull
 from atomic_reactor.plugins.post_pulp_pull import (PulpPullPlugin,
                                                    CraneTimeoutError)
+from atomic_reactor.pulp_util import record_crane_publish
 from atomic_reactor.inner import TagConf, PushConf
-from atomic_reactor.util import ImageName
+from atomic_reactor.util import ImageName, RegistrySessionPool
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfig,
                                                        ReactorConfigPlugin,
                                                        ReactorConfigKeys,
@@ -87,6 +89,7 @@ class TestPostPulpPull(object):
                         builder=builder,
                         build_process_failed=build_process_failed,
                         plugin_workspace=plugin_workspace,
+                        registry_sessions=RegistrySessionPool(),
                         postbuild_results=postbuild_results or {},
                         prebuild_results=prebuild_results or {})
 
@@ -671,3 +674,41 @@ class TestPostPulpPull(object):
                 assert "Only V2 schema 2 manifest list is expected, " in caplog.text()
 
             assert set(media_types) == set(expected_media_types)
+
+    @responses.activate
+    @pytest.mark.parametrize('published', [True, False])
+    def test_wait_for_missing_media_types(self, published):
+        delays = []
+        accepted = []
+
+        def get_manifest(request):
+            media_type = request.headers['Accept']
+            accepted.append(media_type)
+            # v2 schema 2 manifest appears later than schema 1
+            if media_type == self.media_type_v1 or \
+                    (media_type == self.media_type_v2 and len(delays) >= 2):
+                return (200, {'Content-Type': media_type,
+                              'Docker-Content-Digest': 'sha256:' + media_type}, '{}')
+            return (404, {}, '')
+
+        url = re.compile(r'.*//crane.example.com/v2/.*/manifests/.*')
+        responses.add_callback(responses.GET, url, callback=get_manifest)
+        flexmock(post_pulp_pull).should_receive('sleep').replace_with(delays.append)
+
+        workflow = self.workflow(push=False, expectv2schema2=True)
+        if published:
+            record_crane_publish(workflow)
+            workflow.plugin_workspace[PulpPullPlugin.key]['published'] -= 10
+        workflow.postbuild_plugins_conf = [{'name': 'pulp_sync'}]
+        plugin = PulpPullPlugin(MockerTasker(), workflow, expect_v2schema2=True)
+        assert plugin.run() == [self.media_type_v1, self.media_type_v2]
+
+        # found media types are not probed again
+        assert accepted.count(self.media_type_v1) == 1
+        assert accepted.count(self.media_type_v2) == 3
+        assert len(delays) == 2
+        if published:
+            # waiting continues from publishing
+            assert all(10 <= delay <= 15 for delay in delays)
+        else:
+            assert all(0.5 <= delay <= 1 for delay in delays)
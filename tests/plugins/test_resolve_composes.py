@@ -9,6 +9,7 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals
 
 import os
+import time
 from copy import deepcopy
 
 try:
@@ -219,7 +220,7 @@ def mock_odcs_request():
 
     (flexmock(ODCSClient)
         .should_receive('wait_for_compose')
-        .with_args(ODCS_COMPOSE_ID)
+        .with_args(ODCS_COMPOSE_ID, timeout=float, canceled=object)
         .and_return(ODCS_COMPOSE))
 
 
@@ -343,7 +344,7 @@ class TestResolveComposes(object):
                 .and_return(pulp_composes[arch]).once())
             (flexmock(ODCSClient)
                 .should_receive('wait_for_compose')
-                .with_args(pulp_id)
+                .with_args(pulp_id, timeout=float, canceled=object)
                 .and_return(pulp_composes[arch]).once())
 
         mock_content_sets_config(workflow._tmpdir, content_set)
@@ -383,7 +384,7 @@ class TestResolveComposes(object):
 
         (flexmock(ODCSClient)
             .should_receive('wait_for_compose')
-            .with_args(ODCS_COMPOSE_ID)
+            .with_args(ODCS_COMPOSE_ID, timeout=float, canceled=object)
             .and_return(tag_compose).once())
 
         plugin_result = self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map,
@@ -402,7 +403,7 @@ class TestResolveComposes(object):
             .never())
         (flexmock(ODCSClient)
             .should_receive('wait_for_compose')
-            .with_args(85)
+            .with_args(85, timeout=float, canceled=object)
             .never())
 
         mock_content_sets_config(workflow._tmpdir, '')
@@ -594,7 +595,7 @@ class TestResolveComposes(object):
         (flexmock(ODCSClient)
             .should_receive('wait_for_compose')
             .once()
-            .with_args(odcs_compose['id'])
+            .with_args(odcs_compose['id'], timeout=float, canceled=object)
             .and_return(odcs_compose))
 
         parent_build_info = {
@@ -642,7 +643,7 @@ class TestResolveComposes(object):
             (flexmock(ODCSClient)
                 .should_receive('wait_for_compose')
                 .once()
-                .with_args(compose_id)
+                .with_args(compose_id, timeout=float, canceled=object)
                 .and_return(compose))
 
             composes.append(compose)
@@ -737,7 +738,7 @@ class TestResolveComposes(object):
         (flexmock(ODCSClient)
             .should_receive('wait_for_compose')
             .once()
-            .with_args(old_odcs_compose['id'])
+            .with_args(old_odcs_compose['id'], timeout=float, canceled=object)
             .and_return(old_odcs_compose))
 
         (flexmock(ODCSClient)
@@ -749,7 +750,7 @@ class TestResolveComposes(object):
         (flexmock(ODCSClient)
             .should_receive('wait_for_compose')
             .times(1 if expect_renew else 0)
-            .with_args(new_odcs_compose['id'])
+            .with_args(new_odcs_compose['id'], timeout=float, canceled=object)
             .and_return(new_odcs_compose))
 
         plugin_args = {
@@ -764,6 +765,72 @@ class TestResolveComposes(object):
         else:
             assert plugin_result['composes'] == [old_odcs_compose]
 
+    @pytest.mark.parametrize('wait_threads', [1, 4])
+    def test_wait_for_composes_concurrently(self, workflow, wait_threads,
+                                            reactor_config_map):  # noqa:F811
+        composes = {}
+        for compose_id in (1, 2, 3, 10):
+            composes[compose_id] = dict(ODCS_COMPOSE, id=compose_id)
+        composes[1]['state_name'] = 'removed'
+        timeouts = []
+
+        def wait_for_compose(compose_id, timeout, canceled):
+            timeouts.append(timeout)
+            # composes listed first finish last
+            time.sleep(0.01 * (4 - compose_id % 10))
+            return composes[compose_id]
+
+        flexmock(ODCSClient).should_receive('start_compose').never()
+        (flexmock(ODCSClient)
+            .should_receive('wait_for_compose')
+            .replace_with(wait_for_compose)
+            .times(4))
+        (flexmock(ODCSClient)
+            .should_receive('renew_compose')
+            .with_args(1)
+            .and_return(composes[10])
+            .once())
+
+        plugin_args = {
+            'compose_ids': [1, 2, 3],
+            'composes_timeout': 600,
+            'wait_threads': wait_threads,
+        }
+        plugin_result = self.run_plugin_with_args(workflow, plugin_args,
+                                                  reactor_config_map=reactor_config_map)
+
+        # in order of compose_ids, renewed compose in place of the original
+        assert [compose['id'] for compose in plugin_result['composes']] == [10, 2, 3]
+        # all waits share one deadline
+        assert all(0 < timeout <= 600 for timeout in timeouts)
+
+    def test_wait_for_composes_failure(self, workflow, reactor_config_map):  # noqa:F811
+        canceled_ids = []
+
+        def wait_for_compose(compose_id, timeout, canceled):
+            if compose_id == 2:
+                raise RuntimeError('Failed request for compose_id=2')
+            # the other waits only end once they are canceled
+            assert canceled.wait(timeout)
+            canceled_ids.append(compose_id)
+            raise RuntimeError('Waiting for compose_id={} canceled'.format(compose_id))
+
+        flexmock(ODCSClient).should_receive('start_compose').never()
+        (flexmock(ODCSClient)
+            .should_receive('wait_for_compose')
+            .replace_with(wait_for_compose)
+            .times(3))
+
+        plugin_args = {
+            'compose_ids': [1, 2, 3],
+            'composes_timeout': 10,
+            'wait_threads': 4,
+        }
+        self.run_plugin_with_args(workflow, plugin_args,
+                                  expect_error='Failed request for compose_id=2',
+                                  reactor_config_map=reactor_config_map)
+        assert sorted(canceled_ids) == [1, 3]
+
     def test_inject_yum_repos_from_new_compose(self, workflow, reactor_config_map):  # noqa:F811
         self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map)
         assert self.get_override_yum_repourls(workflow) == [ODCS_COMPOSE_REPOFILE]
@@ -780,7 +847,7 @@ class TestResolveComposes(object):
             (flexmock(ODCSClient)
                 .should_receive('wait_for_compose')
                 .once()
-                .with_args(compose_id)
+                .with_args(compose_id, timeout=float, canceled=object)
                 .and_return(compose))
 
             compose_ids.append(compose_id)
@@ -23,7 +23,8 @@ from atomic_reactor.constants import (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
                                       PLUGIN_KOJI_UPLOAD_PLUGIN_KEY,
                                       PLUGIN_PULP_PUSH_KEY,
                                       PLUGIN_ADD_FILESYSTEM_KEY,
-                                      PLUGIN_GROUP_MANIFESTS_KEY)
+                                      PLUGIN_GROUP_MANIFESTS_KEY,
+                                      PLUGIN_PULL_BASE_IMAGE_KEY)
 from atomic_reactor.build import BuildResult
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import ExitPluginsRunner, PluginFailedException
@@ -348,6 +349,7 @@ CMD blabla"""
 
     plugins_metadata = json.loads(annotations["plugins-metadata"])
     assert "all_rpm_packages" in plugins_metadata["durations"]
+    assert "profiles" not in plugins_metadata
 
     if br_annotations:
         assert annotations['br_annotations'] == expected_br_annotations
@@ -446,6 +448,13 @@ CMD blabla"""
         PostBuildRPMqaPlugin.key: 'foo',
         PLUGIN_KOJI_UPLOAD_PLUGIN_KEY: 'bar',
     }
+    workflow.plugins_profiles = {
+        PostBuildRPMqaPlugin.key: {'cpu_user': 1.5, 'max_rss_increase': 4096},
+    }
+    workflow.prebuild_results[PLUGIN_PULL_BASE_IMAGE_KEY] = {
+        'hits': ['registry.example.com/fedora@sha256:123'],
+        'misses': [],
+    }
 
     runner = ExitPluginsRunner(
         None,
@@ -476,6 +485,13 @@ CMD blabla"""
     plugins_metadata = json.loads(annotations["plugins-metadata"])
     assert "all_rpm_packages" in plugins_metadata["errors"]
     assert "all_rpm_packages" in plugins_metadata["durations"]
+    assert plugins_metadata["profiles"] == {
+        "all_rpm_packages": {"cpu_user": 1.5, "max_rss_increase": 4096},
+    }
+    assert plugins_metadata["parent_images_cache"] == {
+        "hits": ["registry.example.com/fedora@sha256:123"],
+        "misses": [],
+    }
 
 
 @pytest.mark.parametrize('koji_plugin', (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
@@ -532,3 +532,113 @@ def test_tag_and_push_plugin_oci(
         assert workflow.push_conf.docker_registries[0].digests[TEST_IMAGE].oci == DIGEST_OCI
 
         assert workflow.push_conf.docker_registries[0].config is config_json
+
+
+@pytest.mark.parametrize('push_threads', [1, 4])
+def test_tag_and_push_plugin_retag(push_threads):
+    if MOCK:
+        mock_docker()
+    else:
+        return
+
+    registries = [LOCALHOST_REGISTRY, 'registry.example.com']
+    pushed = []
+    flexmock(docker.APIClient,
+             push=lambda repository, **kwargs: pushed.append(repository) or iter(PUSH_LOGS_1_10))
+
+    tasker = DockerTasker(retry_times=0)
+    workflow = DockerBuildWorkflow({"provider": "git", "uri": "asd"}, TEST_IMAGE)
+    setattr(workflow, 'builder', X)
+    for tag in ('1', '1.0', 'latest'):
+        workflow.tag_conf.add_primary_image('{}:{}'.format(TEST_IMAGE, tag))
+    workflow.tag_conf.add_primary_image('other-image:1')
+    workflow.tag_conf.add_unique_image('{}:unique'.format(TEST_IMAGE))
+
+    CONFIG_DIGEST = 'sha256:2c782e3a93d34d89ea4cf54052768be117caed54803263dd1f3798ce42aac14e'
+    manifest_json = {
+        'config': {
+            'digest': CONFIG_DIGEST,
+            'mediaType': 'application/octet-stream',
+            'size': 4132
+        },
+        'layers': [],
+        'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+        'schemaVersion': 2
+    }
+    stored = []
+
+    def make_response(status_code, content=b'', headers=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        response.headers.update(headers or {})
+        return response
+
+    def custom_request(method, url, headers=None, **kwargs):
+        registry, path = url.split('://', 1)[1].split('/', 1)
+        if method == 'PUT':
+            stored.append((registry, path, headers['Content-Type'], kwargs['data']))
+            return make_response(201)
+
+        repo, object_type, ref = path[len('v2/'):].rsplit('/', 2)
+        if object_type == 'blobs':
+            assert ref == CONFIG_DIGEST
+            return make_response(200, json.dumps({'id': repo}).encode('utf-8'))
+
+        accept = headers['Accept'].split(', ')
+        if 'application/vnd.docker.distribution.manifest.v2+json' in accept:
+            return make_response(200, json.dumps(manifest_json).encode('utf-8'), {
+                'Content-Type': 'application/vnd.docker.distribution.manifest.v2+json',
+                'Docker-Content-Digest': DIGEST_V2,
+            })
+        if accept == ['application/vnd.docker.distribution.manifest.v1+json']:
+            # registry converts the manifest for each tag
+            return make_response(200, b'{}', {
+                'Content-Type': 'application/vnd.docker.distribution.manifest.v1+prettyjws',
+                'Docker-Content-Digest': 'sha256:v1-{}-{}'.format(repo, ref),
+            })
+        return make_response(404)
+
+    mock_get_retry_session()
+    (flexmock(requests.Session)
+        .should_receive('request')
+        .replace_with(custom_request))
+
+    runner = PostBuildPluginsRunner(
+        tasker,
+        workflow,
+        [{
+            'name': TagAndPushPlugin.key,
+            'args': {
+                'registries': {registry: {'insecure': True} for registry in registries},
+                'push_threads': push_threads,
+            },
+        }]
+    )
+    output = runner.run()
+
+    # the image is pushed once per repository
+    assert sorted(pushed) == sorted('{}/{}'.format(registry, repo)
+                                    for registry in registries
+                                    for repo in (TEST_IMAGE, 'other-image'))
+    # the other tags are set to the uploaded manifest
+    assert sorted((registry, path) for registry, path, _, _ in stored) == sorted(
+        (registry, 'v2/{}/manifests/{}'.format(TEST_IMAGE, tag))
+        for registry in registries
+        for tag in ('1.0', 'latest', 'unique'))
+    for _, _, content_type, data in stored:
+        assert content_type == 'application/vnd.docker.distribution.manifest.v2+json'
+        assert json.loads(data) == manifest_json
+
+    assert [image.to_str() for image in output[TagAndPushPlugin.key]] == [
+        '{}/{}'.format(registry, image.to_str())
+        for registry in registries
+        for image in workflow.tag_conf.images
+    ]
+    for push_conf_registry in workflow.push_conf.docker_registries:
+        assert len(push_conf_registry.digests) == 5
+        for tag, digests in push_conf_registry.digests.items():
+            repo, ref = tag.split(':')
+            assert digests.v2 == DIGEST_V2
+            assert digests.v1 == 'sha256:v1-{}-{}'.format(repo, ref)
+        assert push_conf_registry.config == {'id': TEST_IMAGE}
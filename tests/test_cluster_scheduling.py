@@ -0,0 +1,213 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import division, unicode_literals
+
+import json
+import os
+import random
+from multiprocessing.pool import ThreadPool
+
+from flexmock import flexmock
+import pytest
+
+from atomic_reactor.cluster_scheduling import (ClusterHistory, HistorySchedulingPolicy,
+                                               LoadSchedulingPolicy, get_scheduling_policy)
+from atomic_reactor.plugins.build_orchestrate_build import ClusterInfo
+from atomic_reactor.plugins.pre_reactor_config import ClusterConfig
+
+PLATFORM = 'x86_64'
+
+
+def make_cluster_infos(*clusters):
+    """
+    :param clusters: tuples (name, max_concurrent_builds, active builds)
+    """
+    return [ClusterInfo(ClusterConfig(name, max_builds, priority=priority), PLATFORM, None,
+                        active / max_builds)
+            for priority, (name, max_builds, active) in enumerate(clusters)]
+
+
+def names(cluster_infos):
+    return [info.cluster.name for info in cluster_infos]
+
+
+def test_cluster_history(tmpdir):
+    path = str(tmpdir.join('history', 'clusters.json'))
+    history = ClusterHistory(path, max_durations=2)
+    for duration in (10, 20, 30):
+        history.record_build('spam', PLATFORM, duration, True)
+    history.record_build('spam', PLATFORM, 1, False)
+    history.record_build('spam', 'ppc64le', None, True)
+
+    expected = {'builds': 4, 'failures': 1, 'duration': 25}
+    assert history.get_stats('spam', PLATFORM) == expected
+    assert history.get_stats('spam', 'ppc64le') == {
+        'builds': 1, 'failures': 0, 'duration': None,
+    }
+    assert history.get_stats('eggs', PLATFORM) == {
+        'builds': 0, 'failures': 0, 'duration': None,
+    }
+
+    # e.g. next build on the same node
+    other = ClusterHistory(path)
+    assert other.get_stats('spam', PLATFORM) == expected
+    # builds recorded meanwhile are kept
+    other.record_build('eggs', PLATFORM, 5, True)
+    history.record_build('spam', PLATFORM, 40, True)
+    assert ClusterHistory(path).get_stats('eggs', PLATFORM)['builds'] == 1
+    assert ClusterHistory(path).get_stats('spam', PLATFORM)['builds'] == 5
+
+
+def test_cluster_history_shared(tmpdir):
+    path = str(tmpdir.join('clusters.json'))
+    # e.g. builds running concurrently on the same node
+    histories = [ClusterHistory(path) for _ in range(4)]
+
+    def record_builds(history):
+        for _ in range(25):
+            history.record_build('spam', PLATFORM, 10, True)
+    pool = ThreadPool(len(histories))
+    pool.map(record_builds, histories)
+    pool.close()
+    pool.join()
+
+    assert ClusterHistory(path).get_stats('spam', PLATFORM)['builds'] == 100
+    assert os.path.exists(path + '.lock')
+
+
+def test_cluster_history_unwritten(tmpdir):
+    path = str(tmpdir.join('clusters.json'))
+    history = ClusterHistory(path)
+    other = ClusterHistory(path)
+    history.record_build('spam', PLATFORM, 10, True)
+    rename = os.rename
+    flexmock(os).should_receive('rename').and_raise(OSError)
+    history.record_build('spam', PLATFORM, 20, False)
+    flexmock(os).should_receive('rename').replace_with(rename)
+    assert history.get_stats('spam', PLATFORM)['builds'] == 2
+    assert ClusterHistory(path).get_stats('spam', PLATFORM)['builds'] == 1
+
+    # build which couldn't be stored isn't lost when another one updates the file
+    other.record_build('spam', PLATFORM, 30, True)
+    history.record_build('eggs', PLATFORM, 5, True)
+    assert ClusterHistory(path).get_stats('spam', PLATFORM) == {
+        'builds': 3, 'failures': 1, 'duration': 20,
+    }
+    assert history.get_stats('spam', PLATFORM)['builds'] == 3
+
+
+@pytest.mark.parametrize('content', ['{', '[]'])
+def test_cluster_history_corrupted(tmpdir, content):
+    path = tmpdir.join('clusters.json')
+    path.write(content)
+
+    history = ClusterHistory(str(path))
+    assert history.get_stats('spam', PLATFORM)['builds'] == 0
+    history.record_build('spam', PLATFORM, 10, True)
+    assert list(json.loads(path.read())) == ['spam/' + PLATFORM]
+
+
+def test_get_scheduling_policy():
+    assert isinstance(get_scheduling_policy('load'), LoadSchedulingPolicy)
+    assert isinstance(get_scheduling_policy('history'), HistorySchedulingPolicy)
+    with pytest.raises(ValueError):
+        get_scheduling_policy('spam')
+
+
+@pytest.mark.parametrize('policy', ['load', 'history'])
+def test_sort_by_load(policy):
+    # without history, clusters are ordered by load, then priority
+    cluster_infos = make_cluster_infos(('spam', 4, 2), ('eggs', 5, 1), ('ham', 2, 1))
+
+    assert names(get_scheduling_policy(policy).sort_clusters(PLATFORM, cluster_infos)) == \
+        ['eggs', 'spam', 'ham']
+
+
+@pytest.mark.parametrize(('history', 'clusters', 'expected'), [
+    # faster cluster wins over less loaded one
+    ({'spam': [100], 'eggs': [300]}, [('eggs', 10, 0), ('spam', 2, 1)], ['spam', 'eggs']),
+    # unless the build would have to wait for a free slot
+    ({'spam': [100], 'eggs': [300]}, [('eggs', 10, 0), ('spam', 2, 6)], ['eggs', 'spam']),
+    # cluster without history is expected to take the mean duration
+    ({'spam': [100], 'eggs': [300]}, [('eggs', 2, 0), ('ham', 2, 0), ('spam', 2, 0)],
+     ['spam', 'ham', 'eggs']),
+    # failures make cluster slower
+    ({'spam': [100, 100, None, None, None], 'eggs': [150]}, [('spam', 2, 0), ('eggs', 2, 0)],
+     ['eggs', 'spam']),
+    # ties are broken by priority
+    ({'spam': [100], 'eggs': [100]}, [('eggs', 2, 0), ('spam', 2, 0)], ['eggs', 'spam']),
+])
+def test_sort_by_history(history, clusters, expected):
+    policy = get_scheduling_policy('history')
+    for cluster, durations in history.items():
+        for duration in durations:
+            policy.record_build(cluster, PLATFORM, duration, duration is not None)
+
+    cluster_infos = make_cluster_infos(*clusters)
+    assert names(policy.sort_clusters(PLATFORM, cluster_infos)) == expected
+
+
+def simulate_fleet(policy, fleet, builds, interval, seed=0):
+    """
+    start builds on a simulated fleet of clusters, one build each interval
+    seconds, on the first cluster chosen by the policy
+
+    :param fleet: dict, name -> (max_concurrent_builds, build duration, failure rate)
+    :return: float, mean number of seconds from submitting a build to its
+             successful completion
+    """
+    rnd = random.Random(seed)
+    running = {name: [] for name in fleet}  # finish times of started builds
+    unrecorded = []  # (finish time, cluster, duration, succeeded)
+    turnaround = 0
+    for index in range(builds):
+        now = index * interval
+        for build in [b for b in unrecorded if b[0] <= now]:
+            unrecorded.remove(build)
+            policy.record_build(build[1], PLATFORM, build[2], build[3])
+
+        submitted = now
+        succeeded = False
+        while not succeeded:
+            cluster_infos = [
+                ClusterInfo(ClusterConfig(name, max_builds, priority=priority), PLATFORM, None,
+                            len([t for t in running[name] if t > now]) / max_builds)
+                for priority, (name, (max_builds, _, _)) in enumerate(sorted(fleet.items()))
+            ]
+            name = policy.sort_clusters(PLATFORM, cluster_infos)[0].cluster.name
+            max_builds, duration, failure_rate = fleet[name]
+            # wait for a free slot
+            active = sorted(t for t in running[name] if t > now)
+            start = now if len(active) < max_builds else active[len(active) - max_builds]
+            succeeded = rnd.random() >= failure_rate
+            finish = start + (duration if succeeded else duration / 2)
+            running[name].append(finish)
+            unrecorded.append((finish, name, finish - start, succeeded))
+            # resubmit failed build
+            now = finish
+        turnaround += now - submitted
+    return turnaround / builds
+
+
+@pytest.mark.parametrize(('fleet', 'faster'), [
+    # load policy splits builds evenly
+    ({'fast': (10, 600, 0), 'slow': (10, 1800, 0)}, True),
+    # load policy prefers big cluster, though it's slow
+    ({'fast': (2, 600, 0), 'slow': (10, 1800, 0)}, False),
+    # unreliable cluster
+    ({'flaky': (4, 600, 0.5), 'stable': (4, 700, 0.02)}, True),
+    # the same clusters
+    ({'spam': (4, 600, 0), 'eggs': (4, 600, 0)}, False),
+])
+def test_simulated_fleet(fleet, faster):
+    load = simulate_fleet(get_scheduling_policy('load'), fleet, 200, 120)
+    history = simulate_fleet(get_scheduling_policy('history'), fleet, 200, 120)
+
+    assert history <= load
+    assert (history < load) == faster
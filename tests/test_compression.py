@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import os
+import zlib
+
+import pytest
+
+from atomic_reactor.compression import (ParallelGzipFile, ParallelXZFile, lzma, zstandard,
+                                        measure_compression, open_compressor)
+
+DATA = os.urandom(10000) * 3 + b'spam and eggs ' * 5000
+
+
+def write(compressor, size, chunk_size=3000):
+    for i in range(0, size, chunk_size):
+        compressor.write(DATA[i:min(i + chunk_size, size)])
+    compressor.close()
+
+
+@pytest.mark.parametrize('size', [0, 10, len(DATA)])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_parallel_gzip(tmpdir, size, threads):
+    path = str(tmpdir.join('file.tar.gz'))
+    with open(path, 'wb') as f:
+        write(ParallelGzipFile(f, threads=threads, block_size=4096, filename=path), size)
+
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == DATA[:size]
+    # single gzip member with the original file name in header
+    with open(path, 'rb') as f:
+        content = f.read()
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(content) == DATA[:size]
+    assert decompressor.unused_data == b''
+    assert content[10:19] == b'file.tar\x00'
+
+
+@pytest.mark.parametrize('size', [0, 10, len(DATA)])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_parallel_xz(size, threads):
+    output = io.BytesIO()
+    write(ParallelXZFile(output, threads=threads, block_size=4096), size)
+
+    assert lzma.decompress(output.getvalue()) == DATA[:size]
+
+
+def test_write_after_close():
+    compressor = ParallelGzipFile(io.BytesIO())
+    compressor.close()
+    with pytest.raises(ValueError):
+        compressor.write(b'data')
+
+
+@pytest.mark.skipif(zstandard is None, reason='zstandard is not available')
+@pytest.mark.parametrize('threads', [1, 2])
+def test_zstd(threads):
+    output = io.BytesIO()
+    write(open_compressor(output, 'zstd', 3, threads), len(DATA))
+
+    assert not output.closed
+    params = zstandard.get_frame_parameters(output.getvalue())
+    # long-distance matching window
+    assert params.window_size == 2**27
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(output.getvalue()))
+    assert reader.read() == DATA
+
+
+@pytest.mark.parametrize(('method', 'opener'), [
+    ('gzip', lambda f: gzip.GzipFile(fileobj=f)),
+    ('lzma', lzma.LZMAFile),
+])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_open_compressor(method, opener, threads):
+    output = io.BytesIO()
+    write(open_compressor(output, method, 1, threads, block_size=4096), len(DATA))
+
+    assert not output.closed
+    output.seek(0)
+    assert opener(output).read() == DATA
+
+
+def test_open_compressor_unknown():
+    with pytest.raises(ValueError):
+        open_compressor(io.BytesIO(), 'spam', 1)
+
+
+def test_measure_compression():
+    ratio, throughput = measure_compression(DATA, 'gzip', 6)
+
+    assert 0 < ratio < 0.5
+    assert throughput > 0
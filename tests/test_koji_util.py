@@ -7,7 +7,10 @@ of the BSD license. See the LICENSE file for details.
 """
 
 from __future__ import absolute_import, print_function, unicode_literals
+import hashlib
+import threading
 import time
+import zlib
 
 from requests.exceptions import ConnectionError
 
@@ -29,7 +32,8 @@ except ImportError:
     import koji
 
 from atomic_reactor.koji_util import (koji_login, create_koji_session,
-                                      TaskWatcher, tag_koji_build)
+                                      KojiSessionWrapper, TaskWatcher, tag_koji_build,
+                                      upload_file, map_in_subsessions)
 from atomic_reactor import koji_util
 from atomic_reactor.plugin import BuildCanceledException
 from atomic_reactor.constants import HTTP_MAX_RETRIES
@@ -179,6 +183,74 @@ class TestCreateKojiSession(object):
                 create_koji_session(url, auth_args)
 
 
+class MultiCallSession(object):
+    """
+    Queues calls while multicall is set, as koji.ClientSession does
+    """
+
+    def __init__(self, failures=()):
+        self.multicall = False
+        self.round_trips = 0
+        self.failures = list(failures)
+        self._calls = []
+
+    def getBuild(self, nvr):
+        if self.multicall:
+            self._calls.append(nvr)
+            return None
+        self.round_trips += 1
+        return {'nvr': nvr}
+
+    def multiCall(self, strict=False):
+        assert self.multicall
+        self.multicall = False
+        calls, self._calls = self._calls, []
+        self.round_trips += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        if strict and 'missing' in calls:
+            raise koji.GenericError('no such build')
+        return [[{'nvr': nvr}] for nvr in calls]
+
+
+class TestBatchCalls(object):
+    @pytest.mark.parametrize(('count', 'batch_size', 'round_trips'), [
+        (0, 3, 0),
+        (3, 3, 1),
+        (7, 3, 3),
+    ])
+    def test_batch_calls(self, count, batch_size, round_trips):
+        session = MultiCallSession()
+        nvrs = ['spam-1.0-{}'.format(release) for release in range(count)]
+
+        results = KojiSessionWrapper(session).batch_calls([('getBuild', (nvr,)) for nvr in nvrs],
+                                                          batch_size=batch_size)
+        assert results == [{'nvr': nvr} for nvr in nvrs]
+        assert session.round_trips == round_trips
+
+    def test_batch_calls_retry(self):
+        flexmock(time).should_receive('sleep').and_return(None)
+        session = MultiCallSession(failures=[ConnectionError()])
+
+        results = KojiSessionWrapper(session).batch_calls([('getBuild', ('spam',), {})])
+        assert results == [{'nvr': 'spam'}]
+        assert session.round_trips == 2
+
+    def test_batch_calls_fault(self):
+        session = MultiCallSession()
+
+        with pytest.raises(koji.GenericError):
+            KojiSessionWrapper(session).batch_calls([('getBuild', ('spam',)),
+                                                     ('getBuild', ('missing',))])
+
+    def test_batch_calls_without_multicall(self):
+        session = flexmock()
+        session.should_receive('getBuild').with_args('spam', strict=True).once().and_return(1)
+
+        assert KojiSessionWrapper(session).batch_calls([('getBuild', ('spam',),
+                                                         {'strict': True})]) == [1]
+
+
 class TestStreamTaskOutput(object):
     def test_output_as_generator(self):
         contents = 'this is the simulated file contents'
@@ -195,6 +267,120 @@ class TestStreamTaskOutput(object):
         assert ''.join(list(streamer)) == contents
 
 
+class UploadSession(object):
+    """
+    Hub side of uploads, failing to store given offsets once
+    """
+
+    def __init__(self, fail_offsets=()):
+        self.files = {}
+        self.offsets = []
+        self.fail_offsets = set(fail_offsets)
+
+    def rawUpload(self, data, offset, path, name, overwrite=False):
+        self.offsets.append(offset)
+        if offset in self.fail_offsets:
+            self.fail_offsets.remove(offset)
+            raise koji.GenericError('upload failed')
+        content = self.files.get((path, name), b'')
+        # the hub truncates the file at offset
+        self.files[(path, name)] = content[:offset] + data
+        return {'size': len(data), 'hexdigest': '%08x' % (zlib.adler32(data) & 0xffffffff)}
+
+    def checkUpload(self, path, name, verify=None):
+        content = self.files[(path, name)]
+        return {'size': str(len(content)),
+                'hexdigest': hashlib.new(verify, content).hexdigest()}
+
+
+class TestUploadFile(object):
+    @pytest.mark.parametrize('checksum', [True, False])
+    @pytest.mark.parametrize(('fail_offsets', 'offsets'), [
+        ((), [0, 4, 8]),
+        # resumed from the last acknowledged offset
+        ((4,), [0, 4, 4, 8]),
+        ((4, 8), [0, 4, 4, 8, 8]),
+    ])
+    def test_upload(self, tmpdir, checksum, fail_offsets, offsets):
+        flexmock(time).should_receive('sleep').times(len(fail_offsets))
+        content = b'0123456789'
+        path = tmpdir.join('image.tar')
+        path.write_binary(content)
+        session = UploadSession(fail_offsets)
+        callback = flexmock()
+        (callback.should_receive('callback')
+            .replace_with(lambda offset, size, *_: progress.append(offset)))
+        progress = []
+
+        expected = hashlib.md5(content).hexdigest() if checksum else None
+        assert upload_file(session, str(path), 'dir', 'name', checksum=expected,
+                           blocksize=4, callback=callback.callback) == 'dir/name'
+        assert session.files[('dir', 'name')] == content
+        assert session.offsets == offsets
+        assert progress == [0, 4, 8, 10]
+
+    def test_upload_empty(self, tmpdir):
+        path = tmpdir.join('empty.log')
+        path.write_binary(b'')
+        session = UploadSession()
+
+        upload_file(session, str(path), 'dir', 'name')
+        assert session.files[('dir', 'name')] == b''
+
+    def test_upload_retries(self, tmpdir):
+        flexmock(time).should_receive('sleep').times(2)
+        path = tmpdir.join('image.tar')
+        path.write_binary(b'0123456789')
+        session = UploadSession()
+        (flexmock(session)
+            .should_receive('rawUpload')
+            .and_raise(koji.GenericError('upload failed')))
+
+        with pytest.raises(koji.GenericError):
+            upload_file(session, str(path), 'dir', 'name', blocksize=4, retries=2)
+
+    def test_upload_checksum_mismatch(self, tmpdir):
+        path = tmpdir.join('image.tar')
+        path.write_binary(b'0123456789')
+
+        with pytest.raises(RuntimeError) as exc:
+            upload_file(UploadSession(), str(path), 'dir', 'name',
+                        checksum=hashlib.md5(b'spam').hexdigest())
+        assert 'does not match' in str(exc.value)
+
+
+@pytest.mark.parametrize(('threads', 'args', 'subsessions'), [
+    (1, [1, 2, 3], 0),
+    (4, [1], 0),
+    (2, [1, 2, 3, 4], 2),
+])
+def test_map_in_subsessions(threads, args, subsessions):
+    session = flexmock()
+    logged_out = []
+    sessions = []
+    lock = threading.Lock()
+
+    def subsession():
+        sub = flexmock()
+        sub.should_receive('logout').replace_with(lambda: logged_out.append(sub))
+        return sub
+
+    def func(sess, arg):
+        with lock:
+            sessions.append(sess)
+        # keep all threads busy
+        time.sleep(0.1)
+        return arg * 2
+
+    session.should_receive('subsession').replace_with(subsession)
+    assert map_in_subsessions(session, func, args, threads) == [arg * 2 for arg in args]
+    if subsessions:
+        assert session not in sessions
+        assert len(logged_out) == subsessions
+    else:
+        assert set(sessions) == {session}
+
+
 class TestTaskWatcher(object):
     @pytest.mark.parametrize(('finished', 'info', 'exp_state', 'exp_failed'), [
         ([False, False, True],
@@ -240,6 +426,24 @@ class TestTaskWatcher(object):
 
         assert task.failed()
 
+    def test_wait_backoff(self):
+        sleeps = []
+        flexmock(time).should_receive('sleep').replace_with(sleeps.append)
+        session = flexmock()
+        task_id = 1234
+        (session.should_receive('taskFinished')
+            .with_args(task_id)
+            .and_return(False).and_return(False).and_return(False).and_return(False)
+            .and_return(True))
+        (session.should_receive('getTaskInfo')
+            .with_args(task_id, request=True)
+            .and_return({'state': koji.TASK_STATES['CLOSED']}))
+
+        task = TaskWatcher(session, task_id, poll_interval=2, initial_poll_interval=1)
+        assert task.wait() == 'CLOSED'
+        # slower polls for long-running tasks
+        assert sleeps == [1, 1.5, 2, 2]
+
 
 class TestTagKojiBuild(object):
     @pytest.mark.parametrize(('task_state', 'failure'), (
@@ -14,6 +14,7 @@ import pytest
 import responses
 import six
 import json
+import threading
 import time
 
 
@@ -153,6 +154,66 @@ def test_wait_for_compose(odcs_client, final_state_id, final_state_name, expect_
         odcs_client.wait_for_compose(COMPOSE_ID)
 
 
+@responses.activate
+@pytest.mark.parametrize(('polls', 'timeout', 'expected_sleeps', 'expect_timeout'), (
+    # short polls during the burst, then gradually longer
+    (6, 1800, [1, 1, 1.5, 2.25, 3], False),
+    # the last poll happens right at the timeout
+    (10, 4.5, [1, 1, 1.5, 1], True),
+))
+def test_wait_for_compose_backoff(odcs_client, polls, timeout, expected_sleeps,
+                                  expect_timeout):
+    state = {'count': 1}
+
+    def handle_composes_get(request):
+        if state['count'] < polls:
+            response_json = compose_json(1, 'generating')
+        else:
+            response_json = compose_json(2, 'done')
+        state['count'] += 1
+        return (200, {}, response_json)
+
+    responses.add_callback(responses.GET, '{}composes/{}'.format(ODCS_URL, COMPOSE_ID),
+                           content_type='application/json',
+                           callback=handle_composes_get)
+
+    clock = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    flexmock(time).should_receive('time').replace_with(lambda: clock[0])
+    flexmock(time).should_receive('sleep').replace_with(sleep)
+
+    if expect_timeout:
+        with pytest.raises(RuntimeError) as exc_info:
+            odcs_client.wait_for_compose(COMPOSE_ID, burst_length=1.5, slow_retry=3,
+                                         timeout=timeout)
+        assert 'timed out' in str(exc_info.value)
+    else:
+        odcs_client.wait_for_compose(COMPOSE_ID, burst_length=1.5, slow_retry=3,
+                                     timeout=timeout)
+    assert sleeps == expected_sleeps
+
+
+@responses.activate
+def test_wait_for_compose_canceled(odcs_client):
+    responses.add(responses.GET, '{}composes/{}'.format(ODCS_URL, COMPOSE_ID),
+                  content_type='application/json',
+                  body=compose_json(1, 'generating'))
+    canceled = threading.Event()
+    # waiting is canceled while sleeping between polls
+    flexmock(canceled).should_receive('wait').replace_with(lambda delay: canceled.set())
+    flexmock(time).should_receive('sleep').never()
+
+    with pytest.raises(RuntimeError) as exc_info:
+        odcs_client.wait_for_compose(COMPOSE_ID, canceled=canceled)
+    assert 'canceled' in str(exc_info.value)
+    assert len(responses.calls) == 1
+
+
 @responses.activate
 def test_renew_compose(odcs_client):
     new_compose_id = COMPOSE_ID + 1
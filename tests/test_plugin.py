@@ -10,21 +10,26 @@ from __future__ import unicode_literals
 
 import json
 import os
+import threading
 import time
 
 from dockerfile_parse import DockerfileParser
 from flexmock import flexmock
 import pytest
+from six.moves import queue
+
+import atomic_reactor.plugin
 
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.build import BuildResult
+from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY
 from atomic_reactor.plugin import (BuildPluginsRunner, PreBuildPluginsRunner,
                                    PostBuildPluginsRunner, InputPluginsRunner,
                                    PluginFailedException, PrePublishPluginsRunner,
                                    ExitPluginsRunner, BuildStepPluginsRunner,
                                    PluginsRunner, InappropriateBuildStepError,
                                    BuildStepPlugin, PreBuildPlugin,
-                                   PreBuildSleepPlugin)
+                                   PreBuildSleepPlugin, PluginsRegistry)
 from atomic_reactor.plugins.pre_add_yum_repo_by_url import AddYumRepoByUrlPlugin
 from atomic_reactor.util import ImageName
 
@@ -101,6 +106,59 @@ def test_load_plugins(docker_tasker, runner_type, tmpdir):
     assert len(runner.plugin_classes) > 0
 
 
+def test_load_plugins_lazily(tmpdir):
+    registry = PluginsRegistry()
+    plugin_classes = registry.get_plugin_classes('PreBuildPlugin')
+    assert len(plugin_classes) > 0
+    assert not [module for module in registry._modules.values() if module]
+
+    plugin_class = plugin_classes[AddYumRepoByUrlPlugin.key]
+    assert plugin_class.key == AddYumRepoByUrlPlugin.key
+    assert issubclass(plugin_class, PreBuildPlugin)
+    assert len([module for module in registry._modules.values() if module]) == 1
+
+    # modules are imported only once
+    again = registry.get_plugin_classes('PreBuildPlugin')
+    assert again[AddYumRepoByUrlPlugin.key] is plugin_class
+    assert 'not_a_plugin' not in again
+    assert len([module for module in registry._modules.values() if module]) == 1
+
+
+def test_load_plugins_from_files(tmpdir):
+    plugin_file = tmpdir.join('my_plugin.py')
+    plugin_file.write('\n'.join([
+        'from atomic_reactor import plugin',
+        'from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY',
+        'class MyPlugin(plugin.PreBuildPlugin):',
+        '    key = PLUGIN_KOJI_PARENT_KEY',
+        'class MyOtherPlugin(MyPlugin):',
+        '    key = "my_other_plugin"',
+        'class MyPostBuildPlugin(plugin.PostBuildPlugin):',
+        '    key = "my_plugin"',
+    ]))
+
+    registry = PluginsRegistry()
+    plugin_classes = registry.get_plugin_classes('PreBuildPlugin', [str(plugin_file)])
+    # plugins from additional files override plugins with the same key
+    assert plugin_classes[PLUGIN_KOJI_PARENT_KEY].__name__ == 'MyPlugin'
+    assert plugin_classes['my_other_plugin'].__name__ == 'MyOtherPlugin'
+    assert 'my_plugin' not in plugin_classes
+
+
+def test_load_plugins_dynamic_key(tmpdir):
+    plugin_file = tmpdir.join('my_plugin.py')
+    plugin_file.write('\n'.join([
+        'from atomic_reactor.plugin import PreBuildPlugin',
+        'class MyPlugin(PreBuildPlugin):',
+        '    key = "my_" + "plugin"',
+    ]))
+
+    registry = PluginsRegistry()
+    assert registry.scan(str(plugin_file)) is None
+    plugin_classes = registry.get_plugin_classes('PreBuildPlugin', [str(plugin_file)])
+    assert plugin_classes['my_plugin'].__name__ == 'MyPlugin'
+
+
 class X(object):
     pass
 
@@ -347,6 +405,223 @@ class TestBuildPluginsRunner(object):
             assert getattr(plugin, key) == value
 
 
+class MyConcurrentPlugin(PreBuildPlugin):
+    key = 'MyConcurrentPlugin'
+    requires = ('spam',)
+    provides = ('eggs',)
+    # threading.Event instances can't be passed as (deep-copied) plugin args
+    events = {}
+
+    def __init__(self, tasker, workflow, wait_for=None, notify=None, fail=False):
+        super(MyConcurrentPlugin, self).__init__(tasker, workflow)
+        self.wait_for = wait_for
+        self.notify = notify
+        self.fail = fail
+
+    def run(self):
+        if self.notify:
+            self.events[self.notify].set()
+        if self.wait_for:
+            assert self.events[self.wait_for].wait(5)
+        if self.fail:
+            raise RuntimeError('failed')
+        return self.workflow.plugins_timestamps[self.key]
+
+
+class MyOtherConcurrentPlugin(MyConcurrentPlugin):
+    key = 'MyOtherConcurrentPlugin'
+    requires = ('bacon',)
+    provides = ('ham',)
+
+
+class MyConsumerPlugin(MyConcurrentPlugin):
+    key = 'MyConsumerPlugin'
+    requires = ('eggs', MyOtherConcurrentPlugin.key)
+    provides = ()
+
+
+class MyUndeclaredPlugin(MyConcurrentPlugin):
+    key = 'MyUndeclaredPlugin'
+    requires = None
+    provides = None
+
+
+class TestConcurrentPluginsRunner(object):
+    def get_runner(self, tmpdir, docker_tasker, plugins_conf, concurrency=4):
+        workflow = mock_workflow(tmpdir)
+        flexmock(PluginsRunner, load_plugins=lambda x: {
+            plugin.key: plugin for plugin in (MyConcurrentPlugin, MyOtherConcurrentPlugin,
+                                              MyConsumerPlugin, MyUndeclaredPlugin)})
+        return PreBuildPluginsRunner(docker_tasker, workflow, plugins_conf,
+                                     plugins_concurrency=concurrency)
+
+    @pytest.mark.parametrize(('names', 'overrides', 'expected'), [  # noqa
+        (['MyConcurrentPlugin', 'MyOtherConcurrentPlugin', 'MyConsumerPlugin'],
+         {}, [set(), set(), {0, 1}]),
+        (['MyConcurrentPlugin', 'MyUndeclaredPlugin', 'MyOtherConcurrentPlugin'],
+         {}, [set(), {0}, {1}]),
+        (['MyConcurrentPlugin', 'MyOtherConcurrentPlugin'],
+         {'requires': ['eggs']}, [set(), {0}]),
+        (['MyConcurrentPlugin', 'MyOtherConcurrentPlugin'],
+         {'provides': ['spam']}, [set(), {0}]),
+    ])
+    def test_schedule(self, tmpdir, docker_tasker, names, overrides, expected):
+        plugins_conf = [{'name': name} for name in names]
+        plugins_conf[-1].update(overrides)
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf)
+
+        schedule = runner.get_plugins_schedule()
+        assert [depends_on for _, _, _, depends_on in schedule] == expected
+
+    @pytest.mark.parametrize(('names', 'concurrent'), [  # noqa
+        # orchestrator
+        (['reactor_config', 'check_and_set_rebuild', 'check_and_set_platforms',
+          'inject_parent_image', 'add_filesystem', 'pull_base_image', 'koji_parent',
+          'bump_release', 'resolve_composes'],
+         [('check_and_set_rebuild', 'inject_parent_image'),
+          ('check_and_set_platforms', 'inject_parent_image'),
+          ('koji_parent', 'bump_release'),
+          ('bump_release', 'resolve_composes')]),
+        # worker
+        (['reactor_config', 'inject_parent_image', 'add_filesystem', 'pull_base_image',
+          'koji_parent', 'add_labels_in_dockerfile', 'change_from_in_dockerfile',
+          'add_help', 'add_dockerfile', 'distgit_fetch_artefacts', 'fetch_maven_artifacts',
+          'koji', 'add_yum_repo_by_url', 'inject_yum_repo', 'distribution_scope'],
+         [('fetch_maven_artifacts', 'koji')]),
+    ])
+    def test_schedule_build(self, tmpdir, docker_tasker, names, concurrent):
+        workflow = mock_workflow(tmpdir)
+        plugins_conf = [{'name': name} for name in names]
+        runner = PreBuildPluginsRunner(docker_tasker, workflow, plugins_conf,
+                                       plugins_concurrency=4)
+
+        schedule = runner.get_plugins_schedule()
+        assert [plugin_class.key for plugin_class, _, _, _ in schedule] == names
+
+        def depends(first, second):
+            """whether second has to wait for first, directly or not"""
+            index = names.index(second)
+            waits_for = set(schedule[index][3])
+            while waits_for:
+                if names.index(first) in waits_for:
+                    return True
+                waits_for = set.union(*(schedule[i][3] for i in waits_for))
+            return False
+
+        for first, second in concurrent:
+            assert not depends(first, second)
+        # everything waits for reactor_config
+        assert all(depends('reactor_config', name) for name in names[1:])
+        # and the base image is set before it is used
+        assert depends('pull_base_image', 'koji_parent')
+        assert depends('inject_parent_image', 'pull_base_image')
+
+    @pytest.mark.parametrize('plugins_conf', [  # noqa
+        [{'name': 'MyConcurrentPlugin'}, {'name': 'no_such_plugin'}],
+        [{'name': 'MyConcurrentPlugin'}, {'args': {}}],
+    ])
+    def test_schedule_invalid(self, tmpdir, docker_tasker, plugins_conf):
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf)
+        assert runner.get_plugins_schedule() is None
+        with pytest.raises(PluginFailedException):
+            runner.run()
+
+    def test_run_concurrently(self, tmpdir, docker_tasker):  # noqa
+        MyConcurrentPlugin.events = {'first': threading.Event(), 'second': threading.Event()}
+        plugins_conf = [
+            {'name': 'MyConcurrentPlugin',
+             'args': {'wait_for': 'second', 'notify': 'first'}},
+            {'name': 'MyOtherConcurrentPlugin',
+             'args': {'wait_for': 'first', 'notify': 'second'}},
+            {'name': 'MyConsumerPlugin'},
+            {'name': 'no_such_plugin', 'required': False},
+        ]
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf)
+        results = runner.run()
+
+        assert set(results) == {'MyConcurrentPlugin', 'MyOtherConcurrentPlugin',
+                                'MyConsumerPlugin'}
+        assert results['MyConsumerPlugin'] >= results['MyConcurrentPlugin']
+        assert results['MyConsumerPlugin'] >= results['MyOtherConcurrentPlugin']
+        assert set(runner.workflow.plugins_durations) == set(results)
+
+    def test_run_concurrently_wait_interval(self, tmpdir, docker_tasker, monkeypatch):  # noqa
+        timeouts = []
+        Queue = queue.Queue
+
+        class RecordingQueue(Queue):
+            def get(self, block=True, timeout=None):
+                timeouts.append(timeout)
+                return Queue.get(self, block, timeout)
+
+        monkeypatch.setattr(atomic_reactor.plugin, 'PLUGINS_WAIT_INTERVAL', 0.01)
+        monkeypatch.setattr(atomic_reactor.plugin.queue, 'Queue', RecordingQueue)
+        MyConcurrentPlugin.events = {'first': threading.Event()}
+        threading.Timer(0.1, MyConcurrentPlugin.events['first'].set).start()
+        plugins_conf = [
+            {'name': 'MyConcurrentPlugin', 'args': {'wait_for': 'first'}},
+        ]
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf)
+        results = runner.run()
+
+        assert set(results) == {'MyConcurrentPlugin'}
+        # signals are handled while waiting for plugins to finish
+        assert len(timeouts) > 1
+        assert all(timeout == 0.01 for timeout in timeouts)
+
+    @pytest.mark.parametrize(('is_allowed_to_fail', 'keep_going', 'consumer_runs'), [  # noqa
+        (False, False, False),
+        (False, True, True),
+        (True, False, True),
+    ])
+    def test_run_concurrently_failure(self, tmpdir, docker_tasker, is_allowed_to_fail,
+                                      keep_going, consumer_runs):
+        plugins_conf = [
+            {'name': 'MyConcurrentPlugin', 'args': {'fail': True},
+             'is_allowed_to_fail': is_allowed_to_fail},
+            {'name': 'MyOtherConcurrentPlugin'},
+            {'name': 'MyConsumerPlugin'},
+        ]
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf)
+
+        if is_allowed_to_fail:
+            results = runner.run(keep_going=keep_going)
+        else:
+            with pytest.raises(PluginFailedException):
+                runner.run(keep_going=keep_going)
+            results = runner.plugins_results
+            assert runner.workflow.plugin_failed
+
+        assert 'MyOtherConcurrentPlugin' in results
+        assert ('MyConsumerPlugin' in results) == consumer_runs
+
+    def test_sequential_by_default(self, tmpdir, docker_tasker):  # noqa
+        plugins_conf = [{'name': 'MyConcurrentPlugin'}, {'name': 'MyOtherConcurrentPlugin'}]
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf, concurrency=None)
+        flexmock(runner).should_receive('get_plugins_schedule').never()
+        results = runner.run()
+        assert results['MyOtherConcurrentPlugin'] >= results['MyConcurrentPlugin']
+
+    @pytest.mark.parametrize('concurrency', [None, 4])  # noqa
+    @pytest.mark.parametrize('profiling', [None, {}])
+    def test_profiling(self, tmpdir, docker_tasker, concurrency, profiling):
+        plugins_conf = [
+            {'name': 'MyConcurrentPlugin'},
+            {'name': 'MyOtherConcurrentPlugin', 'args': {'fail': True},
+             'is_allowed_to_fail': True},
+        ]
+        runner = self.get_runner(tmpdir, docker_tasker, plugins_conf, concurrency=concurrency)
+        runner.workflow.plugins_profiling = profiling
+        runner.run()
+
+        if profiling is None:
+            assert runner.workflow.plugins_profiles == {}
+        else:
+            profiles = runner.workflow.plugins_profiles
+            assert set(profiles) == {'MyConcurrentPlugin', 'MyOtherConcurrentPlugin'}
+            assert all(profile['cpu_user'] >= 0 for profile in profiles.values())
+
+
 class TestInputPluginsRunner(object):
     def test_substitution(self, tmpdir):
         tmpdir_path = str(tmpdir)
@@ -0,0 +1,84 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from flexmock import flexmock
+import pytest
+
+from atomic_reactor.profiling import (PluginProfiler, get_plugins_profiling_from_env,
+                                      PLUGINS_PROFILING_ENV)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+@pytest.mark.parametrize('per_thread', [True, False])
+def test_profiler(tmpdir, per_thread):
+    profiler = PluginProfiler('foo', per_thread=per_thread)
+    profiler.start()
+    data = [bytearray(1024) for _ in range(1024)]
+    tmpdir.join('file').write(data[0])
+    profile = profiler.stop()
+
+    for name in ('cpu_user', 'cpu_system', 'children_user', 'children_system'):
+        assert profile[name] >= 0
+    assert profile['max_rss'] > 0
+    assert profile['max_rss_increase'] >= 0
+    if os.path.exists('/proc/self/io'):
+        assert profile['write_chars'] >= 1024
+    assert 'tracemalloc' not in profile
+    assert 'cprofile' not in profile
+
+
+@pytest.mark.skipif(tracemalloc is None, reason='tracemalloc is not available')
+def test_profiler_tracemalloc():
+    assert not tracemalloc.is_tracing()
+    profiler = PluginProfiler('foo', tracemalloc=3)
+    profiler.start()
+    data = [bytearray(1024) for _ in range(1024)]  # noqa
+    profile = profiler.stop()
+
+    assert not tracemalloc.is_tracing()
+    assert len(profile['tracemalloc']) == 3
+    top = profile['tracemalloc'][0]
+    assert __file__.rstrip('c') in top['traceback']
+    assert top['size_diff'] >= 1024 * 1024
+    assert top['count_diff'] >= 1024
+
+
+def test_profiler_cprofile(tmpdir):
+    cprofile_dir = str(tmpdir.join('profiles'))
+    profiler = PluginProfiler('foo', cprofile_dir=cprofile_dir)
+    profiler.start()
+    profile = profiler.stop()
+
+    assert os.path.dirname(profile['cprofile']) == cprofile_dir
+    assert os.path.basename(profile['cprofile']).startswith('foo-')
+    assert os.path.exists(profile['cprofile'])
+
+
+@pytest.mark.parametrize(('value', 'expected'), [
+    (None, None),
+    ('', None),
+    ('not json', None),
+    ('[]', None),
+    ('{}', {}),
+    ('{"tracemalloc": 10, "unknown": true}', {'tracemalloc': 10}),
+])
+def test_get_plugins_profiling_from_env(value, expected):
+    environ = {}
+    if value is not None:
+        environ[PLUGINS_PROFILING_ENV] = value
+    flexmock(os, environ=environ)
+
+    assert get_plugins_profiling_from_env() == expected
@@ -0,0 +1,247 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import time
+
+from flexmock import flexmock
+import pytest
+import requests
+import responses
+
+from atomic_reactor.registry_cache import RegistryCache
+from atomic_reactor.util import RegistrySession
+
+DIGEST = 'sha256:' + 'a' * 64
+REGISTRY = 'registry.example.com'
+MANIFEST_TYPE = 'application/vnd.docker.distribution.manifest.v2+json'
+
+
+def make_response(content=b'{"schemaVersion": 2}', status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers['Content-Type'] = MANIFEST_TYPE
+    response.headers['Docker-Content-Digest'] = DIGEST
+    response.url = 'https://registry.example.com/v2/spam/manifests/latest'
+    response._content = content
+    return response
+
+
+@pytest.mark.parametrize(('relative_url', 'cached'), [
+    ('/v2/spam/manifests/latest', True),
+    ('/v2/foo/spam/manifests/' + DIGEST, True),
+    ('/v2/spam/blobs/' + DIGEST, True),
+    # blobs are referenced only by digest
+    ('/v2/spam/blobs/uploads', False),
+    ('/v2/spam/tags/list', False),
+    ('/v2/_catalog', False),
+])
+def test_cached_urls(relative_url, cached):
+    cache = RegistryCache()
+    cache.put(REGISTRY, 'GET', relative_url, MANIFEST_TYPE, make_response())
+
+    response = cache.get(REGISTRY, 'GET', relative_url, MANIFEST_TYPE)
+    if cached:
+        assert response.status_code == 200
+        assert response.headers['docker-content-digest'] == DIGEST
+        assert response.json() == {'schemaVersion': 2}
+        response.raise_for_status()
+    else:
+        assert response is None
+
+
+def test_cache_key():
+    cache = RegistryCache()
+    url = '/v2/spam/manifests/latest'
+    cache.put(REGISTRY, 'GET', url, MANIFEST_TYPE, make_response())
+
+    assert cache.get('other.example.com', 'GET', url, MANIFEST_TYPE) is None
+    assert cache.get(REGISTRY, 'GET', url, 'application/json') is None
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/1', MANIFEST_TYPE) is None
+    # HEAD is answered by GET response, not the other way round
+    assert cache.get(REGISTRY, 'HEAD', url, MANIFEST_TYPE) is not None
+    cache.put(REGISTRY, 'HEAD', '/v2/spam/manifests/1', MANIFEST_TYPE, make_response())
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/1', MANIFEST_TYPE) is None
+    # responses for other credentials are not used
+    assert cache.get(REGISTRY, 'GET', url, MANIFEST_TYPE, scope='other') is None
+    assert cache.get_stats() == {'hits': 1, 'disk_hits': 0, 'misses': 5, 'entries': 2}
+
+
+@pytest.mark.parametrize(('status_code', 'content'), [
+    (404, b''),
+    (500, b''),
+    (200, None),
+    (200, b'x' * (4 * 1024**2 + 1)),
+])
+def test_not_cached_responses(status_code, content):
+    cache = RegistryCache()
+    url = '/v2/spam/manifests/latest'
+    cache.put(REGISTRY, 'GET', url, None, make_response(content, status_code))
+
+    assert cache.get(REGISTRY, 'GET', url, None) is None
+
+
+def test_tag_ttl():
+    cache = RegistryCache(tag_ttl=10)
+    now = time.time()
+    flexmock(time).should_receive('time').and_return(now)
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/latest', None, make_response())
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None, make_response())
+
+    flexmock(time).should_receive('time').and_return(now + 11)
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/latest', None) is None
+    # digests never expire
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None) is not None
+
+    cache = RegistryCache(tag_ttl=0)
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/latest', None, make_response())
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/latest', None) is None
+
+
+def test_lru():
+    cache = RegistryCache(max_entries=2)
+    for tag in ('1', '2'):
+        cache.put(REGISTRY, 'GET', '/v2/spam/manifests/' + tag, None, make_response())
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/1', None) is not None
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/3', None, make_response())
+
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/1', None) is not None
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/2', None) is None
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/3', None) is not None
+
+
+def test_directory(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = RegistryCache(directory=directory)
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/latest', None, make_response())
+    cache.put(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None, make_response())
+    # only responses for digests are stored
+    assert len(os.listdir(directory)) == 1
+
+    # e.g. next build on the same node
+    cache = RegistryCache(directory=directory)
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/latest', None) is None
+    response = cache.get(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None)
+    assert response.json() == {'schemaVersion': 2}
+    assert response.headers['Docker-Content-Digest'] == DIGEST
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None) is not None
+    assert cache.get_stats() == {'hits': 2, 'disk_hits': 1, 'misses': 1, 'entries': 1}
+
+    # corrupted entry is ignored
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write('{')
+    cache = RegistryCache(directory=directory)
+    assert cache.get(REGISTRY, 'GET', '/v2/spam/manifests/' + DIGEST, None) is None
+
+
+def test_directory_blobs(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = RegistryCache(directory=directory)
+    blob_url = '/v2/spam/blobs/' + DIGEST
+    cache.put(REGISTRY, 'GET', blob_url, None, make_response())
+    cache.put(REGISTRY, 'HEAD', '/v2/eggs/blobs/' + DIGEST, None, make_response())
+    # blob may be removed from repository, HEAD responses are in memory only
+    assert len(os.listdir(directory)) == 1
+    assert cache.get(REGISTRY, 'HEAD', '/v2/eggs/blobs/' + DIGEST, None) is not None
+
+    cache = RegistryCache(directory=directory)
+    assert cache.get(REGISTRY, 'GET', blob_url, None) is not None
+    cache = RegistryCache(directory=directory)
+    assert cache.get(REGISTRY, 'HEAD', blob_url, None) is None
+    assert cache.get(REGISTRY, 'HEAD', '/v2/eggs/blobs/' + DIGEST, None) is None
+
+
+def test_invalidate(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = RegistryCache(directory=directory)
+    url = '/v2/spam/manifests/' + DIGEST
+    other_url = '/v2/eggs/manifests/' + DIGEST
+    for accept in (None, MANIFEST_TYPE):
+        cache.put(REGISTRY, 'GET', url, accept, make_response())
+    cache.put(REGISTRY, 'GET', url, None, make_response(), scope='other')
+    cache.put(REGISTRY, 'GET', other_url, None, make_response())
+    assert len(os.listdir(directory)) == 4
+
+    cache.invalidate(REGISTRY, url)
+    assert cache.get(REGISTRY, 'GET', url, None) is None
+    assert cache.get(REGISTRY, 'GET', url, None, scope='other') is None
+    assert cache.get(REGISTRY, 'GET', other_url, None) is not None
+    # other builds on the node don't see it either
+    assert len(os.listdir(directory)) == 1
+    cache = RegistryCache(directory=directory)
+    assert cache.get(REGISTRY, 'GET', url, MANIFEST_TYPE) is None
+    assert cache.get(REGISTRY, 'GET', other_url, None) is not None
+
+
+def test_prune(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = RegistryCache(directory=directory)
+    urls = ['/v2/spam{}/manifests/{}'.format(i, DIGEST) for i in range(3)]
+    now = time.time()
+    for age, url in enumerate(reversed(urls)):
+        cache.put(REGISTRY, 'GET', url, None, make_response(b'x' * 100))
+        path = cache._get_file_path((REGISTRY, None, 'GET', url, None))
+        os.utime(path, (now - age * 10, now - age * 10))
+    size = os.path.getsize(path)
+    # least recently used is refreshed by reading it
+    assert RegistryCache(directory=directory).get(REGISTRY, 'GET', urls[0], None)
+
+    cache = RegistryCache(directory=directory, max_disk_size=2 * size)
+    assert len(os.listdir(directory)) == 2
+    assert cache.get(REGISTRY, 'GET', urls[0], None) is not None
+    assert cache.get(REGISTRY, 'GET', urls[1], None) is None
+    assert cache.get(REGISTRY, 'GET', urls[2], None) is not None
+
+
+@responses.activate
+def test_registry_session_cache():
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    responses.add(responses.GET, url, body='{}', headers={'Docker-Content-Digest': DIGEST})
+    responses.add(responses.HEAD, url, headers={'Docker-Content-Digest': DIGEST})
+    responses.add(responses.PUT, url, status=201)
+    session = RegistrySession(REGISTRY, cache=RegistryCache())
+    headers = {'Accept': MANIFEST_TYPE}
+
+    assert session.get('/v2/spam/manifests/latest', headers=headers).json() == {}
+    response = session.head('/v2/spam/manifests/latest', headers=headers)
+    assert response.headers['Docker-Content-Digest'] == DIGEST
+    assert len(responses.calls) == 1
+    assert session.requests == 1
+
+    # updated tag is fetched again
+    session.put('/v2/spam/manifests/latest', data='{}')
+    session.get('/v2/spam/manifests/latest', headers=headers)
+    assert len(responses.calls) == 3
+
+    # e.g. checking the blob is still in repository
+    session.head('/v2/spam/manifests/latest', headers=headers, use_cache=False)
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_registry_session_cache_credentials(tmpdir):
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    responses.add(responses.GET, url, body='{}')
+    cache = RegistryCache()
+    sessions = []
+    for username in ('john', 'jane', None):
+        dockercfg_path = str(tmpdir.join(username or 'anonymous'))
+        os.mkdir(dockercfg_path)
+        with open(os.path.join(dockercfg_path, '.dockercfg'), 'w') as f:
+            credentials = {'username': username, 'password': 'secret'} if username else {}
+            json.dump({REGISTRY: credentials}, f)
+        sessions.append(RegistrySession(REGISTRY, dockercfg_path=dockercfg_path, cache=cache))
+
+    for session in sessions + sessions:
+        session.get('/v2/spam/manifests/latest')
+    # each set of credentials fetches it once
+    assert len(responses.calls) == 3
@@ -8,15 +8,20 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals
 
+import gzip
+import hashlib
+import io
 import json
 import logging
 import os
+import re
 import tempfile
 import pytest
 import requests
 import responses
 from requests.exceptions import ConnectionError
 import subprocess
+import tarfile
 import time
 from collections import namedtuple
 
@@ -37,6 +42,7 @@ from atomic_reactor.util import (ImageName, wait_for_command, clone_git_repo,
                                  get_version_of_tools,
                                  human_size, CommandResult,
                                  registry_hostname, Dockercfg, RegistrySession,
+                                 RegistrySessionPool,
                                  get_manifest_digests, ManifestDigest,
                                  get_manifest_list,
                                  get_build_json, is_scratch_build, is_isolated_build, df_parser,
@@ -46,6 +52,8 @@ from atomic_reactor.util import (ImageName, wait_for_command, clone_git_repo,
                                  get_manifest_media_version,
                                  get_primary_images,
                                  get_image_upload_filename,
+                                 export_image_stream, get_exported_image_metadata,
+                                 strip_tar_members,
                                  split_module_spec, ModuleSpec,
                                  read_yaml, read_yaml_from_file_path, OSBSLogs,
                                  get_platforms_in_limits, get_orchestrator_platforms)
@@ -297,6 +305,232 @@ def test_get_hexdigests(tmpdir, content, algorithms, expected):
         assert checksums == expected
 
 
+@pytest.mark.parametrize('parallel', [True, False])
+def test_get_checksums_cached(tmpdir, parallel):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(b'abc')
+
+    (flexmock(util)
+        .should_call('_hash_file')
+        .with_args(object, ['md5'], parallel)
+        .once())
+    (flexmock(util)
+        .should_call('_hash_file')
+        .with_args(object, ['sha256', 'sha1'], parallel)
+        .once())
+    assert get_checksums(path, ['md5'], parallel=parallel) == {
+        'md5sum': '900150983cd24fb0d6963f7d28e17f72',
+    }
+    assert get_checksums(path, ['md5'], parallel=parallel) == {
+        'md5sum': '900150983cd24fb0d6963f7d28e17f72',
+    }
+    # only missing checksums are computed
+    assert get_checksums(path, ['md5', 'sha256', 'sha1'], parallel=parallel) == {
+        'md5sum': '900150983cd24fb0d6963f7d28e17f72',
+        'sha256sum': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad',
+        'sha1sum': 'a9993e364706816aba3e25717850c26c9cd0d89d',
+    }
+
+
+def test_get_checksums_sequential_by_default(tmpdir):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(b'abc')
+
+    # small files are not worth a thread pool
+    flexmock(util).should_receive('ThreadPool').never()
+    assert get_checksums(path, ['md5', 'sha256']) == {
+        'md5sum': '900150983cd24fb0d6963f7d28e17f72',
+        'sha256sum': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad',
+    }
+
+
+def test_get_checksums_modified(tmpdir):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(b'abc')
+    assert get_checksums(path, ['md5']) == {'md5sum': '900150983cd24fb0d6963f7d28e17f72'}
+
+    with open(path, 'wb') as f:
+        f.write(b'abcd')
+    assert get_checksums(path, ['md5']) == {'md5sum': 'e2fc714c4727ee9395f324cd2e7f331f'}
+
+
+def test_get_checksums_large(tmpdir):
+    content = os.urandom(1024) * 3000
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    assert get_checksums(path, ['md5', 'sha256']) == {
+        'md5sum': hashlib.md5(content).hexdigest(),
+        'sha256sum': hashlib.sha256(content).hexdigest(),
+    }
+
+
+def make_docker_archive(path, layers):
+    """
+    create docker-save like archive with layers, a list of contents of layer.tar files
+    """
+    with tarfile.open(path, 'w') as tar:
+        for i, content in enumerate(layers):
+            info = tarfile.TarInfo('layer{}/layer.tar'.format(i))
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        info = tarfile.TarInfo('manifest.json')
+        info.size = 2
+        tar.addfile(info, io.BytesIO(b'[]'))
+
+
+@pytest.mark.parametrize('compress', [None, 'gzip'])
+def test_export_image_stream(tmpdir, compress):
+    layers = [b'a' * 1000, b'b' * 10000]
+    archive = str(tmpdir.join('image.tar'))
+    make_docker_archive(archive, layers)
+    output = str(tmpdir.join('exported'))
+
+    def gzip_compressor(fileobj):
+        return gzip.GzipFile(output, 'wb', fileobj=fileobj)
+
+    compressor = gzip_compressor if compress else None
+
+    with open(archive, 'rb') as stream:
+        metadata = export_image_stream(stream, IMAGE_TYPE_DOCKER_ARCHIVE, output, compressor,
+                                       chunk_size=512)
+
+    assert metadata['path'] == output
+    assert metadata['type'] == IMAGE_TYPE_DOCKER_ARCHIVE
+    assert metadata['size'] == os.path.getsize(output)
+    # checksums of the exported file are cached
+    checksums = {k: metadata[k] for k in ('md5sum', 'sha256sum')}
+    flexmock(util).should_receive('_hash_file').never()
+    assert get_checksums(output, ['md5', 'sha256']) == checksums
+    flexmock(util).should_call('_hash_file').once()
+    util.checksums_cache.clear()
+    assert get_checksums(output, ['md5', 'sha256']) == checksums
+
+    if compress:
+        assert metadata['uncompressed_size'] == os.path.getsize(archive)
+        with gzip.open(output, 'rb') as f:
+            exported = f.read()
+    else:
+        assert 'uncompressed_size' not in metadata
+        with open(output, 'rb') as f:
+            exported = f.read()
+    with open(archive, 'rb') as f:
+        assert exported == f.read()
+
+    assert [layer['id'] for layer in metadata['layers']] == ['layer0', 'layer1']
+    for layer, content in zip(metadata['layers'], layers):
+        assert layer['size'] == len(content)
+        assert exported[layer['offset']:layer['offset'] + layer['size']] == content
+        assert layer['digest'] == 'sha256:' + hashlib.sha256(content).hexdigest()
+
+
+def test_export_image_stream_not_tar(tmpdir):
+    output = str(tmpdir.join('exported'))
+    metadata = export_image_stream(io.BytesIO(b'not a tar'), IMAGE_TYPE_DOCKER_ARCHIVE, output)
+
+    assert metadata['size'] == 9
+    assert 'layers' not in metadata
+    with open(output, 'rb') as f:
+        assert f.read() == b'not a tar'
+
+
+def test_get_exported_image_metadata_layers(tmpdir):
+    archive = str(tmpdir.join('image.tar'))
+    make_docker_archive(archive, [b'layer'])
+
+    metadata = get_exported_image_metadata(archive, IMAGE_TYPE_DOCKER_ARCHIVE)
+    assert metadata['path'] == archive
+    assert metadata['size'] == os.path.getsize(archive)
+    assert metadata['md5sum'] == get_checksums(archive, ['md5'])['md5sum']
+    assert len(metadata['layers']) == 1
+
+
+class NonSeekableReader(object):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+@pytest.mark.parametrize('tar_format', [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+@pytest.mark.parametrize('seekable', [True, False])
+def test_strip_tar_members(tar_format, seekable):
+    # long names are stored in extended headers
+    names = ['layer0/layer.tar', 'x' * 120 + '/layer.tar', 'layer2/layer.tar', 'manifest.json']
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w', format=tar_format) as tar:
+        for i, name in enumerate(names):
+            info = tarfile.TarInfo(name)
+            info.size = 1000 * (i + 1)
+            tar.addfile(info, io.BytesIO(name[0].encode('ascii') * info.size))
+    archive.seek(0)
+
+    output = io.BytesIO()
+    reader = archive if seekable else NonSeekableReader(archive)
+    removed = strip_tar_members(reader, output, ['./layer0/layer.tar', names[1]])
+
+    assert removed == len(archive.getvalue()) - len(output.getvalue())
+    output.seek(0)
+    with tarfile.open(fileobj=output) as tar:
+        assert tar.getnames() == names[2:]
+        assert tar.extractfile(names[2]).read() == b'l' * 3000
+
+
+class Py2FileReader(NonSeekableReader):
+    """Reader like Python 2 file objects, without seekable()"""
+    def __init__(self, stream):
+        super(Py2FileReader, self).__init__(stream)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super(Py2FileReader, self).read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+
+def test_strip_tar_members_seek_without_seekable():
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        for name in ['layer0/layer.tar', 'manifest.json']:
+            info = tarfile.TarInfo(name)
+            info.size = 10000
+            tar.addfile(info, io.BytesIO(b'a' * info.size))
+    archive.seek(0)
+
+    reader = Py2FileReader(archive)
+    output = io.BytesIO()
+    removed = strip_tar_members(reader, output, ['layer0/layer.tar'])
+
+    assert removed > 10000
+    # data of the removed member were skipped, not read
+    assert reader.bytes_read <= len(archive.getvalue()) - 10000
+    output.seek(0)
+    with tarfile.open(fileobj=output) as tar:
+        assert tar.getnames() == ['manifest.json']
+
+
+def test_strip_tar_members_truncated():
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        info = tarfile.TarInfo('layer0/layer.tar')
+        info.size = 10000
+        tar.addfile(info, io.BytesIO(b'a' * info.size))
+
+    with pytest.raises(tarfile.ReadError):
+        strip_tar_members(io.BytesIO(archive.getvalue()[:5000]), io.BytesIO(), [])
+
+
 @pytest.mark.parametrize('path, image_type, expected', [
     ('foo.tar', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar'),
     ('foo.tar.gz', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar.gz'),
@@ -736,6 +970,120 @@ def test_get_manifest_digests_missing(tmpdir, has_content_type_header, has_conte
             assert actual_digests.oci_index is True
 
 
+def mock_manifest_responses(digest_in_head=True, stored='v2'):
+    """
+    mock registry storing manifest of given version for any tag, v1
+    manifests are converted and specific to the tag
+    """
+    def callback(request):
+        tag = request.url.rsplit('/', 1)[-1]
+        accepted = [t.strip() for t in request.headers['Accept'].split(',')]
+        stored_type = ManifestDigest.content_type[stored]
+        if stored_type in accepted:
+            headers = {'Content-Type': stored_type,
+                       'Docker-Content-Digest': '{}-digest'.format(stored)}
+        else:
+            headers = {'Content-Type': ManifestDigest.content_type['v1'],
+                       'Docker-Content-Digest': 'v1-{}-digest'.format(tag)}
+        if request.method == 'HEAD' and not digest_in_head:
+            del headers['Docker-Content-Digest']
+        return (200, headers, '')
+
+    url = re.compile(r'https://registry.example.com/v2/spam/manifests/.*')
+    responses.add_callback(responses.HEAD, url, callback=callback)
+    responses.add_callback(responses.GET, url, callback=callback)
+
+
+@pytest.mark.parametrize('digest_in_head', [True, False])
+@pytest.mark.parametrize('concurrent', [True, False])
+@responses.activate
+def test_get_manifest_digests_head(digest_in_head, concurrent):
+    mock_manifest_responses(digest_in_head)
+
+    digests = get_manifest_digests(ImageName.parse('spam:1'), 'registry.example.com',
+                                   versions=('v1', 'v2', 'v2_list'), concurrent=concurrent,
+                                   head=True)
+
+    assert digests == {'v1': 'v1-1-digest', 'v2': 'v2-digest'}
+    methods = [call.request.method for call in responses.calls]
+    if digest_in_head:
+        assert methods == ['HEAD'] * 3
+    else:
+        # manifest is fetched when its digest is not in HEAD response
+        assert sorted(methods) == ['GET'] * 3 + ['HEAD'] * 3
+
+
+@pytest.mark.parametrize('stored', ['v2', 'v2_list'])
+@responses.activate
+def test_get_manifest_digests_cache(stored):
+    mock_manifest_responses(stored=stored)
+    registry_session = RegistrySession('registry.example.com')
+    digests_cache = {}
+
+    for tag in ('1', '2', '3'):
+        responses.calls.reset()
+        digests = get_manifest_digests(ImageName.parse('spam:' + tag), 'registry.example.com',
+                                       registry_session=registry_session, concurrent=True,
+                                       head=True, digests_cache=digests_cache)
+
+        assert digests == {'v1': 'v1-{}-digest'.format(tag), stored: '{}-digest'.format(stored)}
+        # manifest is probed once for all of its media types, then only v1
+        # manifest (specific to tag) is probed for tags referring to the same manifest
+        assert len(responses.calls) == (6 if tag == '1' else 2)
+    assert len(digests_cache) == 1
+
+
+@responses.activate
+def test_get_manifest_digests_concurrent_error():
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+
+    def callback(request):
+        if request.headers['Accept'] == ManifestDigest.content_type['v2']:
+            return (500, {}, '')
+        return (404, {}, '')
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    with pytest.raises(requests.exceptions.HTTPError) as exc_info:
+        get_manifest_digests(ImageName.parse('spam'), 'registry.example.com', concurrent=True)
+    assert exc_info.value.response.status_code == 500
+
+
+@responses.activate
+def test_registry_session_pool():
+    url = re.compile(r'.*registry.example.com/v2/spam/manifests/.*')
+    responses.add(responses.GET, 'https://registry.example.com/v2/spam/manifests/latest',
+                  body=ConnectionError())
+    responses.add(responses.GET, url, status=200)
+    pool = RegistrySessionPool()
+
+    session = pool.get_session('registry.example.com', insecure=True)
+    assert pool.get_session('registry.example.com', insecure=True) is session
+    assert pool.get_session('registry.example.com') is not session
+
+    session.get('/v2/spam/manifests/latest')
+    # https to http fallback is not tried again
+    responses.calls.reset()
+    # (other tag, the first response is cached)
+    pool.get_session('registry.example.com', insecure=True).get('/v2/spam/manifests/1')
+    assert [call.request.url for call in responses.calls] == [
+        'http://registry.example.com/v2/spam/manifests/1',
+    ]
+
+    stats = pool.get_stats()
+    assert stats['reused'] == 2
+    assert sorted((s['registry'], s['insecure'], s['url'], s['requests'])
+                  for s in stats['sessions']) == [
+        ('registry.example.com', False, 'https://registry.example.com', 0),
+        ('registry.example.com', True, 'http://registry.example.com', 2),
+    ]
+    for s in stats['sessions']:
+        assert s['connections'] == 0
+
+    pool.close()
+    assert pool.get_session('registry.example.com', insecure=True) is not session
+
+
 @responses.activate
 def test_get_manifest_digests_connection_error(tmpdir):
     # Test that our code to handle falling back from https to http